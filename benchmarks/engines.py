@@ -0,0 +1,75 @@
+"""Connections and lines per second of each connection engine.
+
+Runs an in-process server on mongomock for every engine and measures how
+fast clients can connect, and how many pipelined WHOAMI lines the server
+answers::
+
+    python -m benchmarks.engines [--clients 50] [--lines 1000] [--connects 500]
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+from benchmarks.inprocess import running_server
+from server.server import ENGINES
+
+
+async def connect_rate(port: int, connects: int, clients: int) -> float:
+    """Connections per second, each sending one request before closing"""
+
+    async def client(count: int) -> None:
+        for _ in range(count):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"abcdefg|WHOAMI\n")
+            await reader.readline()
+            writer.close()
+            await writer.wait_closed()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(connects // clients) for _ in range(clients)))
+    return connects // clients * clients / (time.perf_counter() - started)
+
+
+async def line_rate(port: int, lines: int, clients: int) -> float:
+    """Lines per second, each client pipelining its lines in one write"""
+    request = b"abcdefg|WHOAMI\n" * lines
+
+    async def client() -> None:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"bcdefgh|SIGN_IN|bench\n")
+        await reader.readline()
+        writer.write(request)
+        for _ in range(lines):
+            await reader.readline()
+        writer.close()
+        await writer.wait_closed()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return lines * clients / (time.perf_counter() - started)
+
+
+async def run(args: argparse.Namespace) -> None:
+    for engine in ENGINES:
+        config = {"engine": engine, "max_in_flight": args.max_in_flight}
+        async with running_server(config) as (_, port):
+            connects = await connect_rate(port, args.connects, args.clients)
+            lines = await line_rate(port, args.lines, args.clients)
+        print(f"{engine:>10}: {connects:8.0f} connections/s {lines:10.0f} lines/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=1000)
+    parser.add_argument("--connects", type=int, default=500)
+    parser.add_argument("--max-in-flight", type=int, default=1)
+    # mongomock has no change streams, the watchers fail at startup
+    logging.disable(logging.ERROR)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""In-process server on a mongomock database, shared by the benchmarks."""
+
+import asyncio
+from asyncio.base_events import Server as AsyncioServer
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any, cast
+
+from dependency_injector import providers
+from mongomock_motor import AsyncMongoMockClient
+
+from server import Server
+from server.di import Container
+
+
+@asynccontextmanager
+async def running_server(
+    config: dict[str, Any] | None = None,
+) -> AsyncIterator[tuple[Server, int]]:
+    """Start a server on a free port, yields it with the port"""
+    container = Container()
+    container.config.from_dict(config or {})
+    container.mongo_client.override(providers.Singleton(AsyncMongoMockClient))
+
+    server = Server(container=container, host="127.0.0.1", port=0)
+    task = asyncio.create_task(server.start())
+    while not hasattr(server, "_server"):
+        await asyncio.sleep(0.01)
+    # asyncio.Server or its uvloop counterpart
+    sockets = cast(AsyncioServer, server._server).sockets
+    try:
+        yield server, int(sockets[0].getsockname()[1])
+    finally:
+        await server.stop()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
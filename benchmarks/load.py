@@ -0,0 +1,295 @@
+"""End-to-end load generator.
+
+Opens N concurrent clients that sign in and then run a weighted mix of
+CREATE_DISCUSSION, CREATE_REPLY, GET_DISCUSSION and LIST_DISCUSSIONS for a
+fixed duration. Reports ops/sec, p50/p95/p99 latency per action and the
+delivery latency of the DISCUSSION_UPDATED notifications the writes cause.
+
+Without --port an in-process server on mongomock is used, so it runs
+offline. Results can be saved as JSON and compared with a previous run::
+
+    python -m benchmarks.load --clients 20 --duration 10 --json run.json
+    python -m benchmarks.load --mix create_reply=8,get_discussion=2 \\
+        --compare run.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import string
+import sys
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+from benchmarks.inprocess import running_server
+
+ACTIONS = ("create_discussion", "create_reply", "get_discussion", "list_discussions")
+DEFAULT_MIX = "create_discussion=1,create_reply=4,get_discussion=4,list_discussions=1"
+NOTIFICATION = b"DISCUSSION_UPDATED|"
+# Relative change of a metric reported as a regression by --compare
+REGRESSION_THRESHOLD = 0.10
+
+
+@dataclass
+class LoadStats:
+    latencies: dict[str, list[float]] = field(
+        default_factory=lambda: {action: [] for action in ACTIONS}
+    )
+    notification_latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    # discussion_id -> when the last write to it was sent
+    last_write: dict[str, float] = field(default_factory=dict)
+    discussion_ids: list[str] = field(default_factory=list)
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        action, _, weight = part.partition("=")
+        if action not in ACTIONS:
+            raise ValueError(f"unknown action {action!r}, expected one of {ACTIONS}")
+        weights[action] = float(weight or 1)
+    return weights
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """Count and p50/p95/p99 of latencies, in milliseconds"""
+    if len(samples) < 2:
+        value = samples[0] * 1000 if samples else 0.0
+        return {"count": len(samples), "p50": value, "p95": value, "p99": value}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "count": len(samples),
+        "p50": cuts[49] * 1000,
+        "p95": cuts[94] * 1000,
+        "p99": cuts[98] * 1000,
+    }
+
+
+class Client:
+    """One connection running requests one at a time"""
+
+    def __init__(self, index: int, stats: LoadStats, rng: random.Random) -> None:
+        self.user_id = f"user{index}"
+        self.stats = stats
+        self.rng = rng
+        self._pending: dict[bytes, asyncio.Future[bytes]] = {}
+        self._reader: asyncio.StreamReader
+        self._writer: asyncio.StreamWriter
+
+    async def connect(self, host: str, port: int) -> None:
+        self._reader, self._writer = await asyncio.open_connection(host, port)
+        self._read_task = asyncio.create_task(self._read_loop())
+        await self.request(f"SIGN_IN|{self.user_id}")
+
+    async def close(self) -> None:
+        self._writer.close()
+        self._read_task.cancel()
+        try:
+            await self._read_task
+        except asyncio.CancelledError:
+            pass
+
+    async def _read_loop(self) -> None:
+        while line := await self._reader.readline():
+            if line.startswith(NOTIFICATION):
+                discussion_id = line[len(NOTIFICATION) :].strip().decode()
+                written = self.stats.last_write.get(discussion_id)
+                if written is not None:
+                    self.stats.notification_latencies.append(
+                        time.perf_counter() - written
+                    )
+                continue
+            waiter = self._pending.pop(line[:7], None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(line)
+        # The server answers errors by closing the connection
+        for waiter in self._pending.values():
+            if not waiter.done():
+                waiter.set_exception(ConnectionError("connection closed"))
+
+    async def request(self, line: str) -> bytes:
+        request_id = "".join(self.rng.choices(string.ascii_lowercase, k=7))
+        waiter: asyncio.Future[bytes] = asyncio.get_running_loop().create_future()
+        self._pending[request_id.encode()] = waiter
+        self._writer.write(f"{request_id}|{line}\n".encode())
+        return await waiter
+
+    def _next_line(self, action: str) -> tuple[str, str | None]:
+        """Request line of an action, with the discussion it writes to"""
+        rng = self.rng
+        video = f"video{rng.randrange(20)}"
+        if action == "create_discussion":
+            reference = f"{video}.{rng.randrange(600)}s"
+            return f"CREATE_DISCUSSION|{reference}|comment by {self.user_id}", None
+        if action == "list_discussions":
+            return f"LIST_DISCUSSIONS|{video}", None
+
+        discussion_id = rng.choice(self.stats.discussion_ids)
+        if action == "create_reply":
+            comment = f"reply by {self.user_id}"
+            return f"CREATE_REPLY|{discussion_id}|{comment}", discussion_id
+        return f"GET_DISCUSSION|{discussion_id}", None
+
+    async def run(self, mix: dict[str, float], deadline: float) -> None:
+        actions, weights = list(mix), list(mix.values())
+        while time.perf_counter() < deadline:
+            action = self.rng.choices(actions, weights)[0]
+            if not self.stats.discussion_ids:
+                action = "create_discussion"
+            line, written = self._next_line(action)
+
+            started = time.perf_counter()
+            if written is not None:
+                self.stats.last_write[written] = started
+            try:
+                response = await self.request(line)
+            except ConnectionError:
+                self.stats.errors += 1
+                return
+            self.stats.latencies[action].append(time.perf_counter() - started)
+
+            if action == "create_discussion":
+                discussion_id = response.strip().split(b"|")[1].decode()
+                self.stats.discussion_ids.append(discussion_id)
+                self.stats.last_write[discussion_id] = started
+
+
+@asynccontextmanager
+async def target(args: argparse.Namespace) -> AsyncIterator[tuple[str, int]]:
+    if args.port is not None:
+        yield args.host, args.port
+        return
+    config = dict(item.split("=", 1) for item in args.config)
+    async with running_server(json_values(config)) as (_, port):
+        yield "127.0.0.1", port
+
+
+def json_values(config: dict[str, str]) -> dict[str, Any]:
+    """Read --config values as JSON where possible, strings otherwise"""
+    values: dict[str, Any] = {}
+    for key, value in config.items():
+        try:
+            values[key] = json.loads(value)
+        except json.JSONDecodeError:
+            values[key] = value
+    return values
+
+
+async def run_load(args: argparse.Namespace) -> dict[str, Any]:
+    mix = parse_mix(args.mix)
+    stats = LoadStats()
+    rng = random.Random(args.seed)
+
+    async with target(args) as (host, port):
+        clients = [
+            Client(i, stats, random.Random(rng.random())) for i in range(args.clients)
+        ]
+        await asyncio.gather(*(client.connect(host, port) for client in clients))
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(client.run(mix, deadline) for client in clients))
+        elapsed = time.perf_counter() - started
+        # Let notifications of the last writes arrive
+        await asyncio.sleep(0.1)
+        await asyncio.gather(*(client.close() for client in clients))
+
+    operations = sum(len(samples) for samples in stats.latencies.values())
+    return {
+        "clients": args.clients,
+        "duration": elapsed,
+        "mix": mix,
+        "config": args.config,
+        "operations": operations,
+        "ops_per_sec": operations / elapsed,
+        "errors": stats.errors,
+        "actions": {
+            action: percentiles(samples)
+            for action, samples in stats.latencies.items()
+            if samples
+        },
+        "notifications": percentiles(stats.notification_latencies),
+    }
+
+
+def report(result: dict[str, Any]) -> None:
+    print(
+        f"{result['operations']} operations by {result['clients']} clients in "
+        f"{result['duration']:.1f}s: {result['ops_per_sec']:.0f} ops/s, "
+        f"{result['errors']} errors"
+    )
+    print(f"{'':>18} {'count':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    rows = [*result["actions"].items(), ("notifications", result["notifications"])]
+    for name, row in rows:
+        print(
+            f"{name:>18} {row['count']:>8} {row['p50']:>8.2f} "
+            f"{row['p95']:>8.2f} {row['p99']:>8.2f}"
+        )
+
+
+def compare(result: dict[str, Any], baseline: dict[str, Any]) -> bool:
+    """Print the change against a baseline, True if nothing regressed"""
+    changes = [("ops/s", baseline["ops_per_sec"], result["ops_per_sec"], True)]
+    for name, row in [
+        *result["actions"].items(),
+        ("notifications", result["notifications"]),
+    ]:
+        base = baseline["actions"].get(name) or (
+            baseline["notifications"] if name == "notifications" else None
+        )
+        if base and base["count"] and row["count"]:
+            changes.append((f"{name} p99", base["p99"], row["p99"], False))
+
+    ok = True
+    print(f"{'':>28} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, before, after, higher_is_better in changes:
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = " REGRESSION" if worse > REGRESSION_THRESHOLD else ""
+        ok = ok and not flag
+        print(f"{name:>28} {before:>10.2f} {after:>10.2f} {change:>+8.1%}{flag}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="action=weight,...")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument(
+        "--port", type=int, help="load a running server instead of an in-process one"
+    )
+    parser.add_argument(
+        "--config",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="container config of the in-process server, e.g. engine=protocol",
+    )
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results of a previous run to compare with")
+    args = parser.parse_args()
+
+    # mongomock has no change streams, the watchers fail at startup
+    logging.disable(logging.ERROR)
+    result = asyncio.run(run_load(args))
+    report(result)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(result, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            if not compare(result, json.load(file)):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
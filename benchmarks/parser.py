@@ -0,0 +1,55 @@
+"""Parse-and-dispatch cost per request line.
+
+Compares decoding the line, CommandContext.from_line and
+CommandFactory.create_command with LineParser.parse on the raw bytes::
+
+    python -m benchmarks.parser [--number 100000]
+"""
+
+import argparse
+import timeit
+
+from server.commands.command_context import CommandContext
+from server.commands.command_factory import CommandFactory
+from server.commands.line_parser import LineParser
+from server.di import Container
+
+PEER_ID = "127.0.0.1:50000"
+
+LINES = [
+    b"ougmcim|SIGN_IN|janedoe\n",
+    b"iwhygsi|WHOAMI\n",
+    b"ykkngzx|CREATE_DISCUSSION|iofetzv.0s|Hey, folks. What do you think?\n",
+    b"sqahhfj|CREATE_REPLY|iztybsd|I think it's great!\n",
+    b"xthbsuv|GET_DISCUSSION|iztybsd|offset=0|limit=10\n",
+    b"xthbsuv|LIST_DISCUSSIONS|refprefix\n",
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+
+    container = Container()
+    line_parser = LineParser(container)
+
+    def legacy() -> None:
+        for line in LINES:
+            context = CommandContext.from_line(container, line.decode(), PEER_ID)
+            CommandFactory.create_command(context)
+
+    def fast() -> None:
+        for line in LINES:
+            line_parser.parse(line, PEER_ID)
+
+    results = {}
+    for name, run in [("from_line", legacy), ("LineParser", fast)]:
+        best = min(timeit.repeat(run, number=args.number // len(LINES), repeat=5))
+        results[name] = best / (args.number // len(LINES) * len(LINES))
+        print(f"{name:>12}: {results[name] * 1e9:8.0f} ns/line")
+    print(f"{'speedup':>12}: {results['from_line'] / results['LineParser']:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
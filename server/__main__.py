@@ -1,11 +1,34 @@
 """Main entry point for the echo server."""
 
-import asyncio
+import argparse
+import os
 
+from server import event_loop
 from server.server import logger, run_server
+from server.supervisor import run_supervisor
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m server")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="worker processes sharing the port through SO_REUSEPORT",
+    )
+    parser.add_argument(
+        "--loop",
+        choices=event_loop.EVENT_LOOPS,
+        help="event loop, auto picks uvloop when it is installed",
+    )
+    args = parser.parse_args()
+    if args.loop is not None:
+        # Also read by the worker processes
+        os.environ[event_loop.ENV_VAR] = args.loop
+
     try:
-        asyncio.run(run_server())
+        if args.workers > 1:
+            run_supervisor(args.workers)
+        else:
+            event_loop.run(run_server())
     except KeyboardInterrupt:
         logger.warning("Server stopped by user")
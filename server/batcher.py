@@ -0,0 +1,126 @@
+"""Group commit of inserts issued by concurrent requests."""
+
+import asyncio
+import logging
+from typing import Any
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY = 11000
+# Batches being written at once before insert waits for one to finish
+MAX_WRITES = 8
+
+
+class InsertBatcher:
+    """Collects documents and writes them with one unordered insert_many.
+
+    A batch is written once it holds ``max_docs`` documents or ``max_delay``
+    seconds after its first document, whichever comes first. ``insert`` only
+    queues the documents; the batcher retries a failed write up to
+    ``max_retries`` times with exponential backoff, and ``flush`` waits until
+    everything queued so far is written or given up on.
+    """
+
+    def __init__(
+        self,
+        collection: AsyncIOMotorCollection[Any],
+        max_docs: int = 500,
+        max_delay: float = 0.001,
+        max_retries: int = 3,
+    ) -> None:
+        self.collection = collection
+        self.max_docs = max_docs
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.retry_delay = 0.1
+        self._docs: list[dict[str, Any]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._writes: set[asyncio.Task[None]] = set()
+        self.batches = 0
+        self.documents = 0
+        self.max_batch = 0
+        self.retries = 0
+        self.failed = 0
+
+    async def insert(self, docs: list[dict[str, Any]]) -> None:
+        """Queue documents for the next batch, without waiting for the write"""
+        if not docs:
+            return
+
+        # Only a bounded number of batches is held in memory
+        while len(self._writes) >= MAX_WRITES:
+            await asyncio.wait(set(self._writes), return_when=asyncio.FIRST_COMPLETED)
+
+        for doc in docs:
+            # Retries send the same _id, those already written are skipped
+            doc.setdefault("_id", ObjectId())
+        self._docs.extend(docs)
+        if len(self._docs) >= self.max_docs:
+            self._write_batch()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_delay, self._write_batch
+            )
+
+    async def flush(self) -> None:
+        """Write the pending batch and wait for every write in progress"""
+        self._write_batch()
+        if self._writes:
+            await asyncio.wait(set(self._writes))
+
+    def _write_batch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._docs:
+            return
+
+        docs, self._docs = self._docs, []
+        task = asyncio.create_task(self._write(docs))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self, docs: list[dict[str, Any]]) -> None:
+        """Write a batch, retrying the documents that were not stored.
+
+        A retry finds the documents an interrupted attempt did write as
+        duplicates of their _id, and does not store them twice.
+        """
+        self.batches += 1
+        self.documents += len(docs)
+        self.max_batch = max(self.max_batch, len(docs))
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                await self.collection.insert_many(docs, ordered=False)
+                return
+            except BulkWriteError as e:
+                failed = [
+                    write_error["index"]
+                    for write_error in e.details.get("writeErrors", [])
+                    if write_error.get("code") != DUPLICATE_KEY
+                ]
+                if not failed:
+                    return
+                docs = [docs[index] for index in failed]
+                error: Exception = e
+            except Exception as e:
+                error = e
+            logging.warning(f"Writing {len(docs)} documents failed: {error}")
+
+        self.failed += len(docs)
+        logging.error(f"Gave up writing {len(docs)} documents: {error}")
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": len(self._docs),
+            "batches": self.batches,
+            "documents": self.documents,
+            "max_batch": self.max_batch,
+            "retries": self.retries,
+            "failed": self.failed,
+        }
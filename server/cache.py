@@ -0,0 +1,89 @@
+"""In-process LRU cache with optional expiry."""
+
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Generic, TypeVar
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """Least recently used cache of at most ``max_entries`` values.
+
+    Entries older than ``ttl`` seconds are treated as missing. ``on_evict`` is
+    called for every entry leaving the cache, whatever the reason.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float | None = None,
+        on_evict: Callable[[K, V], None] | None = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        stored_at, value = entry
+        if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        if not self.enabled:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic(), value)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, key: K) -> None:
+        if key in self._entries:
+            self._remove(key)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        for key in list(self._entries):
+            self._remove(key)
+
+    def _remove(self, key: K) -> None:
+        _, value = self._entries.pop(key)
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -4,6 +4,7 @@ from server.services.validation_service import ValidationService
 
 
 class SignInCommand(Command):
+    changes_session = True
 
     async def _validate(self) -> None:
         if len(self.context.params) != 1:
@@ -16,22 +17,23 @@ class SignInCommand(Command):
         if self.context.peer_id is None:
             raise ValueError("peer_id is required")
 
-        await self.container.session_service().set(
+        await self.services.session_service.set(
             peer_id=self.context.peer_id, user_id=self.context.params[0]
         )
         return Response(request_id=self.context.request_id).serialize()
 
 
 class SignOutCommand(Command):
+    changes_session = True
 
     async def _validate(self) -> None:
         pass
 
     async def _execute_impl(self) -> str:
-        self._previous_user_id = await self.container.session_service().get_client_id(
+        self._previous_user_id = await self.services.session_service.get_client_id(
             self.context.peer_id
         )
-        await self.container.session_service().delete(peer_id=self.context.peer_id)
+        await self.services.session_service.delete(peer_id=self.context.peer_id)
         return Response(request_id=self.context.request_id).serialize()
 
 
@@ -41,7 +43,7 @@ class WhoAmICommand(Command):
         pass
 
     async def _execute_impl(self) -> str:
-        client_id = await self.container.session_service().get_client_id(
+        client_id = await self.services.session_service.get_client_id(
             self.context.peer_id
         )
         params = [client_id] if client_id is not None else None
@@ -1,13 +1,17 @@
 from abc import abstractmethod
-from typing import final
+from typing import ClassVar, final
 
-from server.commands.command_context import CommandContext
+from server.commands.command_context import CommandContext, Services
 
 
 class Command:
+    # Pipelined connections run these alone, between the requests around them
+    changes_session: ClassVar[bool] = False
+
     def __init__(self, context: CommandContext):
         self.context = context
         self.container = context.container
+        self.services = context.services or Services(context.container)
 
     @abstractmethod
     async def _validate(self) -> None:
@@ -19,6 +23,15 @@ class Command:
         """execution logic to be implemented by derived classes"""
         pass
 
+    def _split_options(self, allowed: set[str]) -> tuple[list[str], dict[str, str]]:
+        """Separate positional params from key=value options"""
+        positional = [p for p in self.context.params if "=" not in p]
+        options = dict(p.split("=", 1) for p in self.context.params if "=" in p)
+        unknown = options.keys() - allowed
+        if unknown:
+            raise ValueError(f"unknown option: {', '.join(sorted(unknown))}")
+        return positional, options
+
     @final
     async def execute(self) -> str:
         """Final method that executes validation before implementation"""
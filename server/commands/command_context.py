@@ -1,10 +1,24 @@
+from typing import Any
+
 from server.di import Container
 from server.services.validation_service import ValidationService
 
 MIN_PART = 2
 
 
+class Services:
+    """Container services used by commands, resolved once"""
+
+    __slots__ = ("discussion_service", "list_response_cache", "session_service")
+
+    def __init__(self, container: Container) -> None:
+        self.discussion_service = container.discussion_service()
+        self.list_response_cache = container.list_response_cache()
+        self.session_service = container.session_service()
+
+
 class CommandContext:
+    __slots__ = ("action", "container", "params", "peer_id", "request_id", "services")
 
     def __init__(
         self,
@@ -19,6 +33,28 @@ class CommandContext:
         self.params = params or []
         self.peer_id = peer_id
         self.action = action
+        # Shared by the contexts a LineParser creates, resolved lazily otherwise
+        self.services: Services | None = None
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, CommandContext):
+            return NotImplemented
+        return (
+            self.container is other.container
+            and self.request_id == other.request_id
+            and self.params == other.params
+            and self.peer_id == other.peer_id
+            and self.action == other.action
+        )
+
+    # Contexts are mutable, compared by value only
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return (
+            f"CommandContext(request_id={self.request_id!r}, action={self.action!r}, "
+            f"params={self.params!r}, peer_id={self.peer_id!r})"
+        )
 
     @staticmethod
     def from_line(
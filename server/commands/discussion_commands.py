@@ -1,5 +1,11 @@
 from server.commands.command import Command
 from server.response import Response
+from server.services.discussion_service import (
+    DEFAULT_PAGE_SIZE,
+    DEFAULT_REPLY_WINDOW,
+    MAX_PAGE_SIZE,
+    MAX_REPLY_WINDOW,
+)
 from server.services.validation_service import ValidationService
 
 
@@ -16,14 +22,14 @@ class CreateDiscussionCommand(Command):
         if len(comment) >= 250:
             raise ValueError("comment must be less than 250 characters")
 
-        self.client_id = await self.container.session_service().get_client_id(
+        self.client_id = await self.services.session_service.get_client_id(
             self.context.peer_id
         )
         if self.client_id is None:
             raise ValueError("authentication is required")
 
     async def _execute_impl(self) -> str:
-        created_id = await self.container.discussion_service().create_discussion(
+        created_id = await self.services.discussion_service.create_discussion(
             self.context.params[0],
             self.context.params[1],
             self.client_id,  # type: ignore
@@ -40,7 +46,7 @@ class CreateReplyCommand(Command):
         if len(self.context.params) != 2:
             raise ValueError("action requires two parameters")
 
-        self.client_id = await self.container.session_service().get_client_id(
+        self.client_id = await self.services.session_service.get_client_id(
             self.context.peer_id
         )
         if self.client_id is None:
@@ -49,7 +55,7 @@ class CreateReplyCommand(Command):
     async def _execute_impl(self) -> str:
         discussion_id, comment = self.context.params[0], self.context.params[1]
         self._discussion_id = discussion_id
-        reply_id = await self.container.discussion_service().create_reply(
+        reply_id = await self.services.discussion_service.create_reply(
             discussion_id, comment, self.client_id  # type: ignore
         )
         self._reply_id = reply_id
@@ -59,12 +65,24 @@ class CreateReplyCommand(Command):
 class GetDiscussionCommand(Command):
 
     async def _validate(self) -> None:
-        if len(self.context.params) != 1:
+        positional, options = self._split_options({"offset", "limit"})
+        if len(positional) != 1:
             raise ValueError("action requires one parameter")
+        self.discussion_id = positional[0]
+
+        for option in options.values():
+            if not option.isdigit():
+                raise ValueError("offset and limit must be non-negative integers")
+        self.offset = int(options.get("offset", 0))
+        self.limit: int | None = None
+        if options:
+            self.limit = int(options.get("limit", DEFAULT_REPLY_WINDOW))
+            if not 0 < self.limit <= MAX_REPLY_WINDOW:
+                raise ValueError(f"limit must be between 1 and {MAX_REPLY_WINDOW}")
 
     async def _execute_impl(self) -> str:
-        discussion = await self.container.discussion_service().get_discussion(
-            self.context.params[0]
+        discussion = await self.services.discussion_service.get_discussion(
+            self.discussion_id, offset=self.offset, limit=self.limit
         )
         if discussion is None:
             raise ValueError("Discussion not found")
@@ -77,27 +95,53 @@ class GetDiscussionCommand(Command):
             f"{discussion.reference_prefix}.{discussion.time_marker}",
             "(" + ",".join(replies) + ")",
         ]
+        if self.limit is not None:
+            # Windowed responses tell the client how many replies there are
+            params.append(str(discussion.reply_count))
         return Response(request_id=self.context.request_id, params=params).serialize()
 
 
 class ListDiscussionsCommand(Command):
 
     async def _validate(self) -> None:
-        if len(self.context.params) > 1:
+        positional, options = self._split_options({"limit", "cursor"})
+        if len(positional) > 1:
             raise ValueError("action can't have more than one parameter")
+        self.reference_prefix = positional[0] if positional else None
 
-    async def _execute_impl(self) -> str:
-        discussions = await self.container.discussion_service().list_discussions()
-
-        discussion_list = []
-        for discussion in discussions:
-            replies = []
-            for reply in discussion.replies:
-                replies.append(f"{reply.client_id}|{reply.comment}")
+        self.limit: int | None = None
+        if "limit" in options:
+            if not options["limit"].isdigit() or not (
+                0 < int(options["limit"]) <= MAX_PAGE_SIZE
+            ):
+                raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+            self.limit = int(options["limit"])
+        self.cursor = options.get("cursor")
 
-            discussion_list.append(
-                f"{discussion.discussion_id}|{discussion.reference_prefix}.{discussion.time_marker}|({','.join(replies)})"
-            )
-        return Response(
-            request_id=self.context.request_id, params=discussion_list
-        ).serialize_list()
+    async def _execute_impl(self) -> str:
+        discussion_service = self.services.discussion_service
+        response = Response(request_id=self.context.request_id)
+        if not discussion_service.coherent:
+            return await self._list(response)
+
+        # Unchanged data is answered with the body serialized the first time
+        cache = self.services.list_response_cache
+        key = (self.reference_prefix, self.limit, self.cursor)
+        version = discussion_service.version
+        cached = cache.get(key)
+        if cached is not None and cached[0] == version:
+            return response.serialize_body(cached[1])
+
+        serialized = await self._list(response)
+        cache.put(key, (version, serialized[len(self.context.request_id) :]))
+        return serialized
+
+    async def _list(self, response: Response) -> str:
+        discussion_service = self.services.discussion_service
+        paged = self.limit is not None or self.cursor is not None
+        response.params, next_cursor = await discussion_service.list_discussion_entries(
+            self.reference_prefix,
+            limit=(self.limit or DEFAULT_PAGE_SIZE) if paged else None,
+            cursor=self.cursor,
+        )
+        return response.serialize_list(next_cursor)
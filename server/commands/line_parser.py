@@ -0,0 +1,63 @@
+from server.commands.command import Command
+from server.commands.command_context import MIN_PART, CommandContext, Services
+from server.commands.command_factory import CommandFactory
+from server.di import Container
+
+REQUEST_ID_LENGTH = 7
+
+
+class LineParser:
+    """Turns request lines, as read from a connection, into commands.
+
+    Works on the raw bytes and only decodes the parts it keeps. The action
+    table and the services commands use are resolved once per parser rather
+    than for every line.
+    """
+
+    def __init__(self, container: Container) -> None:
+        self.container = container
+        self.services = Services(container)
+        self.actions: dict[bytes, tuple[str, type[Command]]] = {
+            action.encode(): (action, command)
+            for action, command in CommandFactory.commands.items()
+        }
+
+    @staticmethod
+    def _fields(data: bytes) -> list[bytes]:
+        """The non-empty fields of a line, empty ones are skipped"""
+        return [part for part in data.strip().split(b"|") if part]
+
+    def changes_session(self, data: bytes) -> bool:
+        """Whether the line names a command that changes the connection's session"""
+        parts = self._fields(data)
+        entry = self.actions.get(parts[1]) if len(parts) >= MIN_PART else None
+        return entry is not None and entry[1].changes_session
+
+    def parse(self, data: bytes, peer_id: str | None = None) -> Command:
+        parts = self._fields(data)
+        if len(parts) < MIN_PART:
+            raise ValueError("Invalid format. Expected: request_id|action[|params]")
+
+        request_id = parts[0]
+        # bytes.isalpha() and islower() only accept ASCII, i.e. [a-z]
+        if not (
+            len(request_id) == REQUEST_ID_LENGTH
+            and request_id.isalpha()
+            and request_id.islower()
+        ):
+            raise ValueError("Invalid request_id. Must be 7 lowercase letters (a-z)")
+
+        entry = self.actions.get(parts[1])
+        if entry is None:
+            raise ValueError(f"Invalid action: {parts[1].decode(errors='replace')}")
+        action, command_class = entry
+
+        context = CommandContext(
+            self.container,
+            request_id.decode(),
+            [part.decode() for part in parts[2:]],
+            peer_id,
+            action,
+        )
+        context.services = self.services
+        return command_class(context)
@@ -5,9 +5,30 @@ from typing import Any, cast
 from dependency_injector import containers, providers
 from motor.motor_asyncio import AsyncIOMotorClient
 
-from server.services.discussion_service import DiscussionService
-from server.services.notification_service import NotificationService
+from server.cache import LRUCache
+from server.migrations import MIGRATIONS
+from server.scheduler import WorkScheduler
+from server.services.discussion_service import DiscussionService, DiscussionSettings
+from server.services.notification_service import (
+    NotificationService,
+    NotificationSettings,
+)
+from server.services.schema_service import SchemaService
 from server.services.session_service import SessionService
+from server.storage.memory import (
+    MemoryDiscussionRepository,
+    MemoryNotificationRepository,
+    MemorySessionRepository,
+    MemoryStore,
+)
+from server.storage.mongo import (
+    MongoDiscussionRepository,
+    MongoNotificationRepository,
+    MongoSessionRepository,
+)
+
+# (reference_prefix, limit, cursor) of a LIST_DISCUSSIONS request
+ListKey = tuple[str | None, int | None, str | None]
 
 
 class Container(containers.DeclarativeContainer):
@@ -17,6 +38,39 @@ class Container(containers.DeclarativeContainer):
         default={
             "mongo_uri": "mongodb://localhost:27017",
             "db_name": "test_db",
+            "node_id": None,
+            # Where discussions, notifications and sessions live: mongo or memory
+            "storage": "mongo",
+            # Connection handling: "streams" or "protocol"
+            "engine": "streams",
+            # Requests a single connection may run concurrently (1 = serial)
+            "max_in_flight": 1,
+            "preserve_order": True,
+            # Per-peer notification queue: drop_oldest, coalesce or disconnect
+            "outbound_queue_size": 1000,
+            "outbound_overflow_policy": "drop_oldest",
+            # Bytes a connection's transport may hold before writers wait
+            "outbound_high_water": 262144,
+            # Change stream events are partitioned by recipient over these workers
+            "notification_workers": 8,
+            # Group commit of notification inserts: documents per batch, max wait
+            "notification_batch_size": 500,
+            "notification_batch_delay": 0.001,
+            # Replies to more participants are fanned out on read
+            "notification_fan_out_threshold": 1000,
+            # Read-through cache of discussions, kept coherent by a change stream
+            "discussion_cache_size": 10000,
+            "discussion_cache_ttl": 30.0,
+            # Serialized LIST_DISCUSSIONS responses, per prefix and page
+            "list_cache_size": 1000,
+            # "embedded" in the discussion or "bucketed" in reply_buckets
+            "reply_storage": "embedded",
+            "reply_bucket_size": 100,
+            # Background notification creation: workers, queue bound
+            "notification_scheduler_workers": 4,
+            "notification_scheduler_queue_size": 1000,
+            # Retries of a failed notification batch write
+            "notification_insert_retries": 3,
         }
     )
 
@@ -32,12 +86,86 @@ class Container(containers.DeclarativeContainer):
         lambda client, db_name: client[db_name], mongo_client, config.db_name
     )
 
-    notification_service = providers.Singleton(NotificationService, db)
+    mongo_discussions = providers.Singleton(
+        MongoDiscussionRepository,
+        db,
+        reply_storage=config.reply_storage,
+        reply_bucket_size=config.reply_bucket_size,
+    )
+    mongo_notifications = providers.Singleton(
+        MongoNotificationRepository,
+        db,
+        batch_size=config.notification_batch_size,
+        batch_delay=config.notification_batch_delay,
+        insert_retries=config.notification_insert_retries,
+    )
+    mongo_sessions = providers.Singleton(MongoSessionRepository, db)
+
+    memory_store = providers.Singleton(MemoryStore)
+
+    discussion_repository = providers.Selector(
+        config.storage,
+        mongo=mongo_discussions,
+        memory=providers.Singleton(MemoryDiscussionRepository, memory_store),
+    )
+    notification_repository = providers.Selector(
+        config.storage,
+        mongo=mongo_notifications,
+        memory=providers.Singleton(MemoryNotificationRepository, memory_store),
+    )
+    session_repository = providers.Selector(
+        config.storage,
+        mongo=mongo_sessions,
+        memory=providers.Singleton(MemorySessionRepository, memory_store),
+    )
+
+    notification_service = providers.Singleton(
+        NotificationService,
+        notification_repository,
+        discussion_repository,
+        settings=providers.Factory(
+            NotificationSettings,
+            delivery_workers=config.notification_workers,
+            fan_out_threshold=config.notification_fan_out_threshold,
+        ),
+        node_id=config.node_id,
+    )
+
+    session_service = providers.Singleton(
+        SessionService, session_repository, node_id=config.node_id
+    )
 
-    session_service = providers.Singleton(SessionService, db)
+    notification_scheduler = providers.Singleton(
+        WorkScheduler,
+        workers=config.notification_scheduler_workers,
+        max_queue=config.notification_scheduler_queue_size,
+        # Rerunning a job would notify local recipients again, the batcher
+        # retries the writes instead
+        max_retries=0,
+    )
 
     discussion_service = providers.Singleton(
         DiscussionService,
-        db,
+        discussion_repository,
         notification_service=notification_service,
+        settings=providers.Factory(
+            DiscussionSettings,
+            cache_size=config.discussion_cache_size,
+            cache_ttl=config.discussion_cache_ttl,
+        ),
+        notification_scheduler=notification_scheduler,
+    )
+
+    list_response_cache = cast(
+        providers.Provider[LRUCache[ListKey, tuple[int, str]]],
+        providers.Singleton(LRUCache, config.list_cache_size),
+    )
+
+    schema_service = providers.Singleton(
+        SchemaService,
+        db,
+        repositories=providers.List(
+            mongo_discussions, mongo_sessions, mongo_notifications
+        ),
+        migrations=providers.Object(MIGRATIONS),
     )
@@ -17,3 +17,4 @@ class Discussion:
     client_id: str
     created_at: datetime
     replies: list[Reply]
+    reply_count: int = 0
@@ -0,0 +1,64 @@
+"""Event loop selection: uvloop when it is installed, asyncio otherwise.
+
+The loop is named by the SERVER_EVENT_LOOP environment variable, which
+worker processes inherit: ``auto`` (default), ``asyncio`` or ``uvloop``.
+"""
+
+import asyncio
+import importlib
+import logging
+import os
+from collections.abc import Callable, Coroutine
+from types import ModuleType
+from typing import Any, TypeVar
+
+logger = logging.getLogger(__name__)
+
+ENV_VAR = "SERVER_EVENT_LOOP"
+EVENT_LOOPS = ("auto", "asyncio", "uvloop")
+
+LoopFactory = Callable[[], asyncio.AbstractEventLoop]
+T = TypeVar("T")
+
+
+def _import_uvloop() -> ModuleType | None:
+    try:
+        return importlib.import_module("uvloop")
+    except ImportError:
+        return None
+
+
+def loop_factories() -> dict[str, LoopFactory]:
+    """Every event loop available here, by name"""
+    factories: dict[str, LoopFactory] = {"asyncio": asyncio.new_event_loop}
+    uvloop = _import_uvloop()
+    if uvloop is not None:
+        factories["uvloop"] = uvloop.new_event_loop
+    return factories
+
+
+def select_loop(name: str | None = None) -> tuple[str, LoopFactory]:
+    """Name and factory of the loop to run, falling back to asyncio"""
+    name = name or os.environ.get(ENV_VAR) or "auto"
+    if name not in EVENT_LOOPS:
+        raise ValueError(f"event loop must be one of {EVENT_LOOPS}")
+
+    factories = loop_factories()
+    if name == "auto":
+        name = "uvloop" if "uvloop" in factories else "asyncio"
+    elif name not in factories:
+        logger.warning("%s is not installed, using the asyncio event loop", name)
+        name = "asyncio"
+    return name, factories[name]
+
+
+def run(main: Coroutine[Any, Any, T], name: str | None = None) -> T:
+    """asyncio.run on the selected event loop"""
+    _, factory = select_loop(name)
+    with asyncio.Runner(loop_factory=factory) as runner:
+        return runner.run(main)
+
+
+def running_loop_name() -> str:
+    loop_module = type(asyncio.get_running_loop()).__module__
+    return "uvloop" if loop_module.startswith("uvloop") else "asyncio"
@@ -0,0 +1,47 @@
+"""Versioned data migrations, applied in order by SchemaService at startup.
+
+Add a Migration with the next version number whenever a change to the code
+needs existing documents or indexes to change. Several nodes may start at the
+same time, so a migration must be safe to run more than once.
+"""
+
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+
+@dataclass
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[AsyncIOMotorDatabase[Any]], Awaitable[None]]
+
+
+async def _backfill_reply_count(db: AsyncIOMotorDatabase[Any]) -> None:
+    async for doc in db.discussions.find(
+        {"reply_count": {"$exists": False}}, {"replies": 1}
+    ):
+        await db.discussions.update_one(
+            {"_id": doc["_id"], "reply_count": {"$exists": False}},
+            {"$set": {"reply_count": len(doc["replies"])}},
+        )
+
+
+async def _backfill_participants(db: AsyncIOMotorDatabase[Any]) -> None:
+    async for doc in db.discussions.find(
+        {"participants": {"$exists": False}}, {"client_id": 1, "replies.client_id": 1}
+    ):
+        participants = {doc["client_id"]}
+        participants.update(reply["client_id"] for reply in doc["replies"])
+        await db.discussions.update_one(
+            {"_id": doc["_id"]},
+            {"$addToSet": {"participants": {"$each": sorted(participants)}}},
+        )
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "backfill discussions.reply_count", _backfill_reply_count),
+    Migration(2, "backfill discussions.participants", _backfill_participants),
+]
@@ -0,0 +1,20 @@
+"""Identity of a server process among the nodes sharing one database."""
+
+import os
+import socket
+import uuid
+
+_node_ids: dict[int, str] = {}
+
+
+def default_node_id() -> str:
+    """An id unique to this process, used when no node_id is configured.
+
+    The hostname alone is shared by every server on the host: one would then
+    remove the other's sessions on recovery and skip its notifications as
+    its own. Keyed by pid so forked workers do not inherit their parent's id.
+    """
+    pid = os.getpid()
+    if pid not in _node_ids:
+        _node_ids[pid] = f"{socket.gethostname()}-{pid}-{uuid.uuid4().hex[:8]}"
+    return _node_ids[pid]
@@ -0,0 +1,218 @@
+"""Per-connection output buffers."""
+
+import asyncio
+import logging
+from collections import deque
+from collections.abc import Iterable
+from dataclasses import dataclass, fields
+from enum import Enum
+from typing import Protocol
+
+logger = logging.getLogger(__name__)
+
+
+class OverflowPolicy(Enum):
+    DROP_OLDEST = "drop_oldest"  # discard the oldest queued message
+    COALESCE = "coalesce"  # merge identical queued messages, else drop oldest
+    DISCONNECT = "disconnect"  # close the connection of the slow consumer
+
+
+class Sink(Protocol):
+    """Where an OutboundQueue writes, an asyncio.StreamWriter or lookalike"""
+
+    @property
+    def transport(self) -> asyncio.WriteTransport: ...
+
+    def writelines(self, data: Iterable[bytes]) -> None: ...
+
+    async def drain(self) -> None: ...
+
+
+@dataclass
+class OutboundStats:
+    max_depth: int = 0
+    sent: int = 0
+    dropped: int = 0
+    coalesced: int = 0
+    disconnected: int = 0
+    responses: int = 0
+    # writelines calls, each carrying every message ready at the time
+    flushes: int = 0
+
+    def merge(self, other: "OutboundStats") -> None:
+        for field in fields(self):
+            if field.name == "max_depth":
+                self.max_depth = max(self.max_depth, other.max_depth)
+            else:
+                setattr(
+                    self,
+                    field.name,
+                    getattr(self, field.name) + getattr(other, field.name),
+                )
+
+
+class OutboundQueue:
+    """Output buffer of one connection, for responses and notifications.
+
+    Responses and notifications are written in the order they were queued.
+    Everything queued during one event loop iteration goes out in a single
+    writelines call, or earlier once ``FLUSH_BYTES`` of responses are
+    waiting. While the transport holds more than ``high_water`` bytes,
+    notifications are held back, along with whatever was queued after them,
+    and the caller waits in drain(). Responses are never dropped; held back
+    notifications are bounded by ``max_size``, and what happens once that is
+    reached is decided by the overflow policy.
+    """
+
+    FLUSH_BYTES = 64 * 1024
+
+    def __init__(
+        self,
+        writer: Sink,
+        max_size: int = 1000,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        high_water: int = 256 * 1024,
+    ) -> None:
+        self.writer = writer
+        self.max_size = max_size
+        self.policy = policy
+        self.high_water = high_water
+        self.stats = OutboundStats()
+        # (data, notification message or None for a response), in queue order
+        self._queue: deque[tuple[bytes, str | None]] = deque()
+        self._notifications = 0
+        self._pending: set[str] = set()
+        self._response_bytes = 0
+        self._flush_handle: asyncio.Handle | None = None
+        self._drain_task: asyncio.Task[None] | None = None
+        self._closed = False
+
+    @property
+    def depth(self) -> int:
+        return self._notifications
+
+    def start(self) -> None:
+        # The writer's drain() then waits for the mark the queue checks
+        self.writer.transport.set_write_buffer_limits(high=self.high_water)
+
+    async def close(self) -> None:
+        """Write what is still buffered and stop"""
+        if self._closed:
+            return
+        self._flush(force=True)
+        self._closed = True
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+            try:
+                await self._drain_task
+            except asyncio.CancelledError:
+                pass
+
+    def send(self, response: str) -> None:
+        """Buffer a response, it is never dropped"""
+        if self._closed:
+            return
+        data = response.encode()
+        self._queue.append((data, None))
+        self._response_bytes += len(data)
+        self.stats.responses += 1
+        if self._response_bytes >= self.FLUSH_BYTES:
+            self._flush()
+        else:
+            self._schedule_flush()
+
+    async def drain(self) -> None:
+        """Wait for the peer to read, if the transport is above the high-water mark"""
+        # A closing transport keeps its buffer but nothing will read it anymore
+        if self._blocked() and not self.writer.transport.is_closing():
+            await self.writer.drain()
+
+    def put(self, message: str) -> bool:
+        """Queue a notification, returns False when it was not accepted"""
+        if self._closed:
+            return False
+
+        coalesce = self.policy is OverflowPolicy.COALESCE
+        if coalesce and message in self._pending:
+            self.stats.coalesced += 1
+            return True
+
+        if self._notifications >= self.max_size:
+            if self.policy is OverflowPolicy.DISCONNECT:
+                self._disconnect()
+                return False
+            self._drop_oldest()
+
+        self._queue.append((message.encode(), message))
+        self._notifications += 1
+        if coalesce:
+            self._pending.add(message)
+        self.stats.max_depth = max(self.stats.max_depth, self._notifications)
+        self._schedule_flush()
+        return True
+
+    def _drop_oldest(self) -> None:
+        for index, (_, message) in enumerate(self._queue):
+            if message is not None:
+                del self._queue[index]
+                self._notifications -= 1
+                self._pending.discard(message)
+                self.stats.dropped += 1
+                return
+
+    def _blocked(self) -> bool:
+        return self.writer.transport.get_write_buffer_size() > self.high_water
+
+    def _schedule_flush(self) -> None:
+        if self._flush_handle is None and not self._closed:
+            self._flush_handle = asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self, force: bool = False) -> None:
+        self._flush_handle = None
+        if self.writer.transport.is_closing():
+            return
+
+        chunks = []
+        hold_notifications = not force and self._blocked()
+        while self._queue:
+            data, message = self._queue[0]
+            if message is not None:
+                if hold_notifications:
+                    break
+                self._notifications -= 1
+                self._pending.discard(message)
+                self.stats.sent += 1
+            else:
+                self._response_bytes -= len(data)
+            self._queue.popleft()
+            chunks.append(data)
+        if chunks:
+            self.writer.writelines(chunks)
+            self.stats.flushes += 1
+
+        if self._queue and self._drain_task is None and not self._closed:
+            # The rest waits until the peer catches up
+            self._drain_task = asyncio.create_task(self._resume_after_drain())
+
+    async def _resume_after_drain(self) -> None:
+        try:
+            await self.writer.drain()
+        except ConnectionError as e:
+            logger.info("Outbound queue stopped: %s", e)
+            return
+        finally:
+            self._drain_task = None
+        if not self.writer.transport.is_closing():
+            self._schedule_flush()
+
+    def _disconnect(self) -> None:
+        logger.warning("Disconnecting slow consumer after %d messages", self.depth)
+        self._closed = True
+        self.stats.disconnected += 1
+        self.stats.dropped += self._notifications
+        self._queue.clear()
+        self._notifications = 0
+        self._pending.clear()
+        self.writer.transport.abort()
@@ -0,0 +1,129 @@
+"""Connection engine built on asyncio.Protocol callbacks instead of streams."""
+
+import asyncio
+from collections import deque
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Protocol, cast
+
+# Same line limit as asyncio.StreamReader
+MAX_LINE_LENGTH = 2**16
+# Reading pauses while this many complete lines wait to be handled
+MAX_BUFFERED_LINES = 64
+
+
+class LineReader(Protocol):
+    """Source of request lines, an asyncio.StreamReader or a LineProtocol"""
+
+    async def readline(self) -> bytes: ...
+
+
+class LineProtocol(asyncio.Protocol):
+    """One connection, framed into lines as data arrives.
+
+    The protocol is both the LineReader and the output Sink of the
+    connection, so ``serve`` runs the same request handling as the streams
+    engine, without a StreamReader/StreamWriter pair in between.
+    """
+
+    def __init__(
+        self, serve: Callable[[LineReader, "LineProtocol", str], Awaitable[None]]
+    ):
+        self.serve = serve
+        self.transport: asyncio.Transport
+        self._buffer = bytearray()
+        self._lines: deque[bytes] = deque()
+        self._line_waiter: asyncio.Future[None] | None = None
+        self._drain_waiter: asyncio.Future[None] | None = None
+        self._reading_paused = False
+        self._writing_paused = False
+        self._eof = False
+        self._error: Exception | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = cast(asyncio.Transport, transport)
+        peer_info = transport.get_extra_info("peername")
+        self._task = asyncio.create_task(self._run(f"{peer_info[0]}:{peer_info[1]}"))
+
+    async def _run(self, peer_id: str) -> None:
+        try:
+            await self.serve(self, self, peer_id)
+        finally:
+            self.transport.close()
+
+    def data_received(self, data: bytes) -> None:
+        buffer = self._buffer
+        buffer += data
+        start = 0
+        while (end := buffer.find(b"\n", start)) >= 0:
+            self._lines.append(bytes(buffer[start : end + 1]))
+            start = end + 1
+        if start:
+            del buffer[:start]
+        if len(buffer) > MAX_LINE_LENGTH:
+            self._error = ValueError(
+                "Separator is not found, and chunk exceed the limit"
+            )
+
+        if len(self._lines) >= MAX_BUFFERED_LINES and not self._reading_paused:
+            self._reading_paused = True
+            self.transport.pause_reading()
+        self._wake_reader()
+
+    def eof_received(self) -> bool:
+        self._eof = True
+        self._wake_reader()
+        # Keep the transport open to write the last responses
+        return True
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self._eof = True
+        self._wake_reader()
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_exception(
+                exc or ConnectionResetError("Connection lost")
+            )
+
+    def _wake_reader(self) -> None:
+        if self._line_waiter is not None and not self._line_waiter.done():
+            self._line_waiter.set_result(None)
+
+    async def readline(self) -> bytes:
+        while not self._lines:
+            if self._error is not None:
+                raise self._error
+            if self._eof:
+                line = bytes(self._buffer)
+                self._buffer.clear()
+                return line
+            self._line_waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._line_waiter
+            finally:
+                self._line_waiter = None
+
+        line = self._lines.popleft()
+        if self._reading_paused and len(self._lines) <= MAX_BUFFERED_LINES // 2:
+            self._reading_paused = False
+            self.transport.resume_reading()
+        return line
+
+    def writelines(self, data: Iterable[bytes]) -> None:
+        self.transport.writelines(data)
+
+    async def drain(self) -> None:
+        if self.transport.is_closing():
+            raise ConnectionResetError("Connection lost")
+        if not self._writing_paused:
+            return
+        if self._drain_waiter is None or self._drain_waiter.done():
+            self._drain_waiter = asyncio.get_running_loop().create_future()
+        await asyncio.shield(self._drain_waiter)
+
+    def pause_writing(self) -> None:
+        self._writing_paused = True
+
+    def resume_writing(self) -> None:
+        self._writing_paused = False
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
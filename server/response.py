@@ -20,8 +20,18 @@ class Response:
 
         return "|".join(parts) + "\n"
 
-    def serialize_list(self) -> str:
+    def serialize_list(self, cursor: str | None = None) -> str:
         if not ValidationService.validate_request_id(self.request_id):
             raise ValueError(INVALID_REQUEST_ID)
 
-        return self.request_id + "|(" + ",".join(self.params) + ")\n"
+        serialized = self.request_id + "|(" + ",".join(self.params) + ")"
+        if cursor is not None:
+            serialized += "|" + cursor
+        return serialized + "\n"
+
+    def serialize_body(self, body: str) -> str:
+        """Prefix an already serialized body with the request_id"""
+        if not ValidationService.validate_request_id(self.request_id):
+            raise ValueError(INVALID_REQUEST_ID)
+
+        return self.request_id + body
@@ -0,0 +1,115 @@
+"""Bounded background work queue served by a fixed pool of workers."""
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+
+
+@dataclass
+class SchedulerStats:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    retried: int = 0
+    # seconds between submission and the first attempt
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    # seconds spent running, retries included
+    total_run: float = 0.0
+    max_run: float = 0.0
+
+
+class WorkScheduler:
+    """Runs jobs on ``workers`` tasks fed by a queue of at most ``max_queue`` jobs.
+
+    Submitting to a full queue waits for room, so producers slow down instead
+    of piling up work. Failing jobs are retried ``max_retries`` times with an
+    exponential backoff before being dropped.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queue: int = 1000,
+        max_retries: int = 3,
+        retry_delay: float = 0.1,
+    ) -> None:
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.stats = SchedulerStats()
+        self._queue: asyncio.Queue[tuple[float, Job]] = asyncio.Queue(max_queue)
+        self._tasks: list[asyncio.Task[None]] = []
+        self._closed = False
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def submit(self, job: Job) -> None:
+        if self._closed:
+            raise RuntimeError("scheduler is closed")
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._work()) for _ in range(self.workers)
+            ]
+        self.stats.submitted += 1
+        await self._queue.put((time.monotonic(), job))
+
+    async def join(self) -> None:
+        """Wait until every submitted job has completed or failed"""
+        await self._queue.join()
+
+    async def close(self) -> None:
+        """Refuse new jobs, finish the queued ones and stop the workers"""
+        self._closed = True
+        await self.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self) -> None:
+        while True:
+            submitted_at, job = await self._queue.get()
+            started_at = time.monotonic()
+            wait = started_at - submitted_at
+            self.stats.total_wait += wait
+            self.stats.max_wait = max(self.stats.max_wait, wait)
+            try:
+                await self._run(job)
+            finally:
+                run = time.monotonic() - started_at
+                self.stats.total_run += run
+                self.stats.max_run = max(self.stats.max_run, run)
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await job()
+                self.stats.completed += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error("Job failed after %d attempts: %s", attempt + 1, e)
+                    self.stats.failed += 1
+                    return
+                logger.warning("Job failed, retrying: %s", e)
+                self.stats.retried += 1
+                await asyncio.sleep(self.retry_delay * 2**attempt)
+
+    def snapshot(self) -> dict[str, float]:
+        finished = self.stats.completed + self.stats.failed
+        return {
+            **asdict(self.stats),
+            "queued": self.depth,
+            "avg_wait": self.stats.total_wait / finished if finished else 0.0,
+            "avg_run": self.stats.total_run / finished if finished else 0.0,
+        }
@@ -2,15 +2,22 @@
 
 import asyncio
 import logging
+from dataclasses import asdict
 from datetime import datetime
-from typing import TypedDict
+from typing import Any, TypedDict
 
-from server.commands.command_context import CommandContext
-from server.commands.command_factory import CommandFactory
+from server.commands.line_parser import LineParser
 from server.di import Container
+from server.event_loop import running_loop_name
+from server.outbound import OutboundQueue, OutboundStats, OverflowPolicy, Sink
+from server.protocol import LineProtocol, LineReader
+from server.storage.repository import STORAGES
 
 logger = logging.getLogger(__name__)
 
+# streams: asyncio.start_server, protocol: LineProtocol on raw transports
+ENGINES = ("streams", "protocol")
+
 
 class NotificationDocument(TypedDict):
     discussion_id: str
@@ -28,108 +35,249 @@ class Server:
         container: Container,
         host: str = "0.0.0.0",
         port: int = 8989,
+        reuse_port: bool = False,
     ) -> None:
         self.host = host
         self.port = port
+        self.reuse_port = reuse_port
         self._notification_task: asyncio.Task[None] | None = None
-        self._peer_writers: dict[str, asyncio.StreamWriter] = {}
+        self._discussion_watch_task: asyncio.Task[None] | None = None
+        self._event_watch_task: asyncio.Task[None] | None = None
+        self._peer_queues: dict[str, OutboundQueue] = {}
+        self._closed_outbound = OutboundStats()
 
         self.container = container
+        self.max_in_flight: int = self.container.config.max_in_flight()
+        self.preserve_order: bool = self.container.config.preserve_order()
+        self.outbound_queue_size: int = self.container.config.outbound_queue_size()
+        self.outbound_overflow_policy = OverflowPolicy(
+            self.container.config.outbound_overflow_policy()
+        )
+        self.outbound_high_water: int = self.container.config.outbound_high_water()
+        self.engine: str = self.container.config.engine()
+        if self.engine not in ENGINES:
+            raise ValueError(f"engine must be one of {ENGINES}")
+        self.storage: str = self.container.config.storage()
+        if self.storage not in STORAGES:
+            raise ValueError(f"storage must be one of {STORAGES}")
         self.session_service = self.container.session_service()
         self.notification_service = self.container.notification_service()
-        self.mongo_client = self.container.mongo_client()
+        self.discussion_service = self.container.discussion_service()
+        self.line_parser = LineParser(self.container)
+        # The memory storage never connects to MongoDB
+        self.mongo_client = (
+            self.container.mongo_client() if self.storage == "mongo" else None
+        )
         self.db = self.mongo_client
 
         # Set up notification service callback
         self.notification_service.set_send_callback(self._send_notification_to_peer)
+        self.notification_service.set_online_users_callback(
+            self.session_service.online_user_ids
+        )
 
     async def _send_notification_to_peer(self, recipient_id: str, message: str) -> None:
-        """Send a notification message to a specific peer."""
-        peer_id = await self._get_peer_id(recipient_id)
-        if not peer_id:
-            return
-
-        peer_writer = self._peer_writers[peer_id]
-        logger.info(f"Notification sending to {peer_id}: {message}")
-        peer_writer.write(message.encode())
-        logger.info(f"Notification sent to {peer_id}")
-        await peer_writer.drain()
-
-    async def _get_peer_id(self, recipient_id: str) -> str | None:
-        """Get peer_id for a recipient, handling offline cases."""
-        peer_id = await self.session_service.get_by_user_id(recipient_id)
-        if peer_id is None:
+        """Queue a notification message for every connection of a recipient."""
+        peer_queues = self._get_peer_queues(recipient_id)
+        if not peer_queues:
             logger.info(f"User is offline: {recipient_id}")
-            return None
+            return
 
-        if peer_id not in self._peer_writers:
-            logger.info(f"User is offline: {peer_id}")
-            return None
+        for peer_queue in peer_queues:
+            peer_queue.put(message)
+        logger.info(
+            f"Notification queued for {recipient_id} on {len(peer_queues)} peers: {message}"
+        )
 
-        return peer_id
+    def _get_peer_queues(self, recipient_id: str) -> list[OutboundQueue]:
+        """Outbound queues of the live connections a recipient signed in from."""
+        return [
+            self._peer_queues[peer_id]
+            for peer_id in self.session_service.get_peer_ids(recipient_id)
+            if peer_id in self._peer_queues
+        ]
 
     async def _send_to_peer(self, peer_id: str, message: str) -> None:
-        """Send a message to a specific peer if they are connected."""
-        peer_writer = self._peer_writers.get(peer_id)
-        if peer_writer is None:
+        """Queue a message for a specific peer if they are connected."""
+        peer_queue = self._peer_queues.get(peer_id)
+        if peer_queue is None:
             logger.info("User is offline: %s", peer_id)
             return
 
-        logger.info("Sending message to %s: %s", peer_id, message)
-        peer_writer.write(message.encode())
-        await peer_writer.drain()
-        logger.info("Message sent to %s", peer_id)
+        logger.info("Queueing message for %s: %s", peer_id, message)
+        peer_queue.put(message)
+
+    def stats(self) -> dict[str, Any]:
+        """Snapshot of the server counters."""
+        outbound = OutboundStats()
+        outbound.merge(self._closed_outbound)
+        for peer_queue in self._peer_queues.values():
+            outbound.merge(peer_queue.stats)
+
+        return {
+            "connections": len(self._peer_queues),
+            "outbound": {
+                "queued": sum(q.depth for q in self._peer_queues.values()),
+                **asdict(outbound),
+            },
+            "discussion_cache": self.discussion_service.cache.stats(),
+            "list_cache": self.container.list_response_cache().stats(),
+            "notification_scheduler": (
+                self.discussion_service.notification_scheduler.snapshot()
+            ),
+            "notification_storage": self.notification_service.repository.stats(),
+            "event_loop": running_loop_name(),
+        }
+
+    async def _execute_line(self, data: bytes, peer_id: str) -> str:
+        """Parse a single request line and run the command it names."""
+        command = self.line_parser.parse(data, peer_id)
+        response = await command.execute()
+        logger.info("response: %s", response)
+        return response
+
+    async def _serve_serial(
+        self, reader: LineReader, output: OutboundQueue, peer_id: str
+    ) -> None:
+        while True:
+            data = await reader.readline()
+            if not data:
+                break
+
+            response = await self._execute_line(data, peer_id)
+            output.send(response)
+            await output.drain()
+
+    async def _serve_pipelined(
+        self, reader: LineReader, output: OutboundQueue, peer_id: str
+    ) -> None:
+        """Run up to ``max_in_flight`` requests of one connection concurrently.
+
+        Reading pauses while the limit is reached. Responses carry their
+        request_id and are written in request order when ``preserve_order`` is
+        set, otherwise as soon as they complete. Commands changing the session
+        (SIGN_IN, SIGN_OUT) are barriers: they start once every earlier request
+        has finished and run alone, so each request sees the identity the
+        requests before it established.
+        """
+        slots = asyncio.Semaphore(self.max_in_flight)
+        previous: asyncio.Task[None] | None = None
+        in_flight: set[asyncio.Task[None]] = set()
+
+        async def run(data: bytes, before: asyncio.Task[None] | None) -> None:
+            try:
+                response = await self._execute_line(data, peer_id)
+                if before is not None:
+                    await before
+                output.send(response)
+                await output.drain()
+            finally:
+                slots.release()
+
+        async with asyncio.TaskGroup() as group:
+            while True:
+                await slots.acquire()
+                data = await reader.readline()
+                if not data:
+                    break
+
+                barrier = self.line_parser.changes_session(data)
+                if barrier and in_flight:
+                    await asyncio.wait(in_flight)
+
+                before = previous if self.preserve_order else None
+                previous = group.create_task(run(data, before))
+                in_flight.add(previous)
+                previous.add_done_callback(in_flight.discard)
+                if barrier:
+                    await asyncio.wait([previous])
 
     async def handle_client(
         self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
     ) -> None:
         peer_info = writer.get_extra_info("peername")
         peer_id = f"{peer_info[0]}:{peer_info[1]}"
-        logger.info("New connection from %s", peer_id)
         try:
-            self._peer_writers[peer_id] = writer
-
-            while True:
-                data = await reader.readline()
-                if not data:
-                    break
+            await self.serve_connection(reader, writer, peer_id)
+        finally:
+            writer.close()
+            await writer.wait_closed()
 
-                context = CommandContext.from_line(
-                    self.container, data.decode(), peer_id
-                )
-                command = CommandFactory.create_command(context)
-                response = await command.execute()
-                logger.info("response: %s", response)
+    async def serve_connection(
+        self, reader: LineReader, writer: Sink, peer_id: str
+    ) -> None:
+        """Handle the requests of one connection, whatever the engine."""
+        logger.info("New connection from %s", peer_id)
+        peer_queue = OutboundQueue(
+            writer,
+            self.outbound_queue_size,
+            self.outbound_overflow_policy,
+            self.outbound_high_water,
+        )
+        peer_queue.start()
+        try:
+            self._peer_queues[peer_id] = peer_queue
 
-                writer.write(response.encode())
-                await writer.drain()
+            if self.max_in_flight > 1:
+                await self._serve_pipelined(reader, peer_queue, peer_id)
+            else:
+                await self._serve_serial(reader, peer_queue, peer_id)
 
         except Exception as e:
-            writer.write(str(e).encode())
+            # A failed pipelined request surfaces wrapped by its task group
+            while isinstance(e, ExceptionGroup):
+                e = e.exceptions[0]
+            peer_queue.send(str(e))
             logger.error("Error handling client %s: %s", peer_id, e)
         finally:
-            self._peer_writers.pop(peer_id, None)
-            writer.close()
+            self._peer_queues.pop(peer_id, None)
+            await peer_queue.close()
+            self._closed_outbound.merge(peer_queue.stats)
             await self.session_service.delete(peer_id)
-            await writer.wait_closed()
             logger.info("Connection closed from %s", peer_id)
 
     async def start(self) -> None:
-        self._server = await asyncio.start_server(
-            self.handle_client,
-            self.host,
-            self.port,
-        )
+        if self.storage == "mongo":
+            await self.container.schema_service().setup()
+        await self.session_service.recover()
+
+        if self.engine == "protocol":
+            self._server = await asyncio.get_running_loop().create_server(
+                lambda: LineProtocol(self.serve_connection),
+                self.host,
+                self.port,
+                reuse_port=self.reuse_port or None,
+            )
+        else:
+            self._server = await asyncio.start_server(
+                self.handle_client,
+                self.host,
+                self.port,
+                reuse_port=self.reuse_port or None,
+            )
 
         self._notification_task = asyncio.create_task(
             self.notification_service.watch_notifications()
         )
+        self._discussion_watch_task = asyncio.create_task(
+            self.discussion_service.watch_discussions()
+        )
+        self._event_watch_task = asyncio.create_task(
+            self.notification_service.watch_discussion_events()
+        )
 
         # For testing, the container might not have a config attribute
         db_name = self.container.config.db_name
         logger.info(f"Using database: {db_name}")
 
-        logger.info("Server starting on %s:%d", self.host, self.port)
+        logger.info(
+            "Server starting on %s:%d (%s engine, %s storage, %s event loop)",
+            self.host,
+            self.port,
+            self.engine,
+            self.storage,
+            running_loop_name(),
+        )
         async with self._server:
             await self._server.serve_forever()
 
@@ -140,14 +288,23 @@ class Server:
             self._server.close()
             await self._server.wait_closed()
 
-        self.mongo_client.close()
+        # Pending notifications still need the database
+        await self.discussion_service.notification_scheduler.close()
+        await self.notification_service.repository.flush()
+        await self.session_service.flush()
+        if self.mongo_client is not None:
+            self.mongo_client.close()
 
 
-async def run_server() -> None:
+def configure_logging() -> None:
     logging.basicConfig(
         level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
     )
 
+
+async def run_server() -> None:
+    configure_logging()
+
     server = Server(container=Container())
     try:
         await server.start()
@@ -1,14 +1,30 @@
 import asyncio
+import base64
+import logging
 import random
 import re
 import string
+from dataclasses import dataclass, replace
 from datetime import datetime
+from functools import partial
 from typing import Any
 
-from motor.motor_asyncio import AsyncIOMotorDatabase
-
+from server.cache import LRUCache
 from server.entities.discussion import Discussion, Reply
+from server.scheduler import WorkScheduler
 from server.services.notification_service import NotificationService
+from server.storage.repository import DiscussionRepository
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+DEFAULT_REPLY_WINDOW = 100
+MAX_REPLY_WINDOW = 1000
+
+
+@dataclass
+class DiscussionSettings:
+    cache_size: int = 10000
+    cache_ttl: float | None = 30.0
 
 
 class DiscussionService:
@@ -16,13 +32,63 @@ class DiscussionService:
 
     def __init__(
         self,
-        db: AsyncIOMotorDatabase[Any],
+        repository: DiscussionRepository,
         notification_service: NotificationService,
+        settings: DiscussionSettings | None = None,
+        notification_scheduler: WorkScheduler | None = None,
     ) -> None:
-        self.db = db
-        self.discussions = self.db.discussions
+        settings = settings or DiscussionSettings()
+        self.repository = repository
         self.notification_service = notification_service
-        self.notification_tasks: list[asyncio.Task[None]] = []
+        # Notifications are created in the background by a bounded worker pool
+        self.notification_scheduler = notification_scheduler or WorkScheduler()
+        # discussion_id -> (_id, discussion); change events only carry the _id
+        self.cache: LRUCache[str, tuple[Any, Discussion]] = LRUCache(
+            settings.cache_size, settings.cache_ttl, on_evict=self._forget_cached
+        )
+        self._cached_ids: dict[Any, str] = {}
+        self._cache_generation = 0
+        # Bumped on every discussion change, local or seen on the change stream
+        self.version = 0
+        # False once remote changes can no longer be observed
+        self.coherent = True
+
+    def _forget_cached(self, discussion_id: str, entry: tuple[Any, Discussion]) -> None:
+        self._cached_ids.pop(entry[0], None)
+
+    def _invalidate(self, discussion_id: str) -> None:
+        self._cache_generation += 1
+        self.cache.invalidate(discussion_id)
+
+    def _handle_discussion_change(self, change: dict[str, Any]) -> None:
+        self.version += 1
+        if change["operationType"] == "insert":
+            return
+        if change["operationType"] in ("update", "replace", "delete"):
+            # Also when nothing is cached yet: a read in flight could be about
+            # to cache the discussion as it was before this change
+            self._cache_generation += 1
+            discussion_id = self._cached_ids.get(change["documentKey"]["_id"])
+            if discussion_id is not None:
+                self.cache.invalidate(discussion_id)
+        else:
+            # drop, rename or invalidate: nothing cached can be trusted anymore
+            self._cache_generation += 1
+            self.cache.clear()
+
+    async def watch_discussions(self) -> None:
+        """Track discussions changed by this or any other node"""
+        try:
+            logging.info("watching discussions")
+            async for change in self.repository.watch():
+                self._handle_discussion_change(change)
+        except Exception as e:
+            logging.error(f"Error watching discussions: {e}")
+        finally:
+            # Without the change stream the caches could serve stale replies
+            self.coherent = False
+            self.cache.clear()
+            self.cache.max_entries = 0
 
     def _sanitize_comment(self, comment: str) -> str:
         if "," in comment:
@@ -30,13 +96,6 @@ class DiscussionService:
             return f'"{escaped_comment}"'
         return comment
 
-    def _get_unique_participants(self, discussion_doc: dict[str, Any]) -> set[str]:
-        """Get unique client_ids from a discussion's replies"""
-        participants = {discussion_doc["client_id"]}
-        for reply in discussion_doc["replies"]:
-            participants.add(reply["client_id"])
-        return participants
-
     def _extract_mentions(self, comment: str) -> set[str]:
         """Extract mentioned client_ids from a comment"""
         return set(self.MENTION_PATTERN.findall(comment))
@@ -48,23 +107,23 @@ class DiscussionService:
         comment: str,
         participant_ids: set[str] | None = None,
     ) -> None:
-        """Create notifications for mentions and replies."""
-        # Handle mentions
+        """Create notifications for mentions and replies.
+
+        Both kinds are created concurrently so they share an insert batch.
+        """
         mentioned_users = self._extract_mentions(comment)
-        if mentioned_users:
-            await self.notification_service.create_mention_notifications(
+        await asyncio.gather(
+            self.notification_service.create_mention_notifications(
                 discussion_id=discussion_id,
                 sender_id=sender_id,
                 mentioned_ids=list(mentioned_users),
-            )
-
-        # Handle replies to participants
-        if participant_ids:
-            await self.notification_service.create_reply_notifications(
+            ),
+            self.notification_service.create_reply_notifications(
                 discussion_id=discussion_id,
                 sender_id=sender_id,
-                recipient_ids=list(participant_ids),
-            )
+                recipient_ids=list(participant_ids or ()),
+            ),
+        )
 
     async def create_discussion(
         self, reference: str, comment: str, client_id: str
@@ -81,6 +140,8 @@ class DiscussionService:
             "time_marker": time_marker,
             "client_id": client_id,
             "created_at": datetime.now(),
+            "reply_count": 1,
+            "participants": [client_id],
             "replies": [
                 {
                     "client_id": client_id,
@@ -90,83 +151,133 @@ class DiscussionService:
             ],
         }
 
-        await self.discussions.insert_one(discussion_doc)
+        await self.repository.insert(discussion_doc)
+        self.version += 1
 
-        notification_task = asyncio.create_task(
-            self._create_notifications(
+        await self.notification_scheduler.submit(
+            partial(
+                self._create_notifications,
                 discussion_id=discussion_id,
                 sender_id=client_id,
                 comment=comment,
             )
         )
-        self.notification_tasks.append(notification_task)
 
         return discussion_id
 
     async def create_reply(
         self, discussion_id: str, comment: str, client_id: str
     ) -> str:
-        discussion_doc = await self.discussions.find_one(
-            {"discussion_id": discussion_id}, {"_id": 0}
-        )
-        if not discussion_doc:
-            raise ValueError(f"Discussion {discussion_id} not found")
-
         new_reply = {
             "client_id": client_id,
             "comment": self._sanitize_comment(comment),
             "created_at": datetime.now(),
         }
-        await self.discussions.update_one(
-            {"discussion_id": discussion_id}, {"$push": {"replies": new_reply}}
-        )
-
-        participants = self._get_unique_participants(discussion_doc) - {client_id}
+        participants = await self.repository.add_reply(discussion_id, new_reply)
+        if participants is None:
+            raise ValueError(f"Discussion {discussion_id} not found")
+        self._invalidate(discussion_id)
+        self.version += 1
 
-        notification_task = asyncio.create_task(
-            self._create_notifications(
+        await self.notification_scheduler.submit(
+            partial(
+                self._create_notifications,
                 discussion_id=discussion_id,
                 sender_id=client_id,
                 comment=comment,
-                participant_ids=participants,
+                participant_ids=set(participants) - {client_id},
             )
         )
-        self.notification_tasks.append(notification_task)
 
         return discussion_id
 
-    async def get_discussion(self, discussion_id: str) -> Discussion:
-        discussion_doc = await self.discussions.find_one(
-            {"discussion_id": discussion_id}, {"_id": 0}
-        )
-        if not discussion_doc:
-            raise ValueError(f"Discussion {discussion_id} not found")
-
+    @staticmethod
+    def _to_discussion(discussion_doc: dict[str, Any]) -> Discussion:
         return Discussion(
             discussion_id=discussion_doc["discussion_id"],
             reference_prefix=discussion_doc["reference_prefix"],
             time_marker=discussion_doc["time_marker"],
             client_id=discussion_doc["client_id"],
             created_at=discussion_doc["created_at"],
-            replies=[Reply(**reply) for reply in discussion_doc["replies"]],
+            replies=[
+                Reply(reply["client_id"], reply["comment"], reply["created_at"])
+                for reply in discussion_doc["replies"]
+            ],
+            reply_count=discussion_doc.get(
+                "reply_count", len(discussion_doc["replies"])
+            ),
         )
 
+    @staticmethod
+    def _encode_cursor(created_at: datetime, discussion_id: str) -> str:
+        position = f"{created_at.isoformat()}|{discussion_id}"
+        return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            created_at, discussion_id = (
+                base64.urlsafe_b64decode(padded).decode().split("|")
+            )
+            return datetime.fromisoformat(created_at), discussion_id
+        except ValueError as e:
+            raise ValueError("Invalid cursor") from e
+
+    async def get_discussion(
+        self, discussion_id: str, offset: int = 0, limit: int | None = None
+    ) -> Discussion:
+        """Get a discussion, optionally with only a window of its replies.
+
+        Whole discussions are served from the cache when possible. On a cache
+        miss, a window is read by the repository so only the requested replies
+        are transferred; reply_count always holds the total number of replies.
+        """
+        cached = self.cache.get(discussion_id)
+        if cached is not None:
+            discussion = cached[1]
+            if limit is None:
+                return discussion
+            return replace(
+                discussion, replies=discussion.replies[offset : offset + limit]
+            )
+
+        generation = self._cache_generation
+        discussion_doc = await self.repository.get(discussion_id, offset, limit)
+        if not discussion_doc:
+            raise ValueError(f"Discussion {discussion_id} not found")
+
+        discussion = self._to_discussion(discussion_doc)
+        # Skip caching when an invalidation raced with the read
+        if limit is None and generation == self._cache_generation:
+            self._cached_ids[discussion_doc["_id"]] = discussion_id
+            self.cache.put(discussion_id, (discussion_doc["_id"], discussion))
+        return discussion
+
     async def list_discussions(
         self, reference_prefix: str | None = None
     ) -> list[Discussion]:
-        query = {"reference_prefix": reference_prefix} if reference_prefix else {}
-        discussion_docs = await self.discussions.find(query, {"_id": 0}).to_list(
-            length=None
-        )
+        discussion_docs = await self.repository.find(reference_prefix)
+        return [self._to_discussion(doc) for doc in discussion_docs]
 
-        return [
-            Discussion(
-                discussion_id=doc["discussion_id"],
-                reference_prefix=doc["reference_prefix"],
-                time_marker=doc["time_marker"],
-                client_id=doc["client_id"],
-                created_at=doc["created_at"],
-                replies=[Reply(**reply) for reply in doc["replies"]],
-            )
-            for doc in discussion_docs
-        ]
+    async def list_discussion_entries(
+        self,
+        reference_prefix: str | None = None,
+        limit: int | None = None,
+        cursor: str | None = None,
+    ) -> tuple[list[str], str | None]:
+        """LIST_DISCUSSIONS entries formatted straight from the stored documents.
+
+        Each ``discussion_id|reference|(client_id|comment,...)`` entry is built
+        by the repository without going through Discussion objects. A limit
+        selects one page of discussions ordered by (created_at, discussion_id),
+        and the cursor resuming after it is returned, None after the last page.
+        """
+        after = self._decode_cursor(cursor) if cursor is not None else None
+        entries, more = await self.repository.entries(reference_prefix, limit, after)
+
+        next_cursor = None
+        if more:
+            created_at, discussion_id, _ = entries[-1]
+            next_cursor = self._encode_cursor(created_at, discussion_id)
+        return [entry for _, _, entry in entries], next_cursor
@@ -1,18 +1,42 @@
+import asyncio
 import logging
-from collections.abc import Awaitable, Callable
+from collections.abc import Awaitable, Callable, Collection
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Any
 
-from motor.motor_asyncio import AsyncIOMotorDatabase
-
 from server.entities.notification import Notification, NotificationType
+from server.node import default_node_id
+from server.storage.repository import DiscussionRepository, NotificationRepository
+
+
+@dataclass
+class NotificationSettings:
+    delivery_workers: int = 8
+    delivery_queue_size: int = 1000
+    # Replies to more participants store a single discussion event instead
+    fan_out_threshold: int = 1000
 
 
 class NotificationService:
-    def __init__(self, db: AsyncIOMotorDatabase[Any]) -> None:
-        self.db = db
-        self.notifications = self.db.notifications
+    def __init__(
+        self,
+        repository: NotificationRepository,
+        discussions: DiscussionRepository,
+        settings: NotificationSettings | None = None,
+        node_id: str | None = None,
+    ) -> None:
+        settings = settings or NotificationSettings()
+        self.repository = repository
+        self.discussions = discussions
+        self.node_id = node_id or default_node_id()
+        self.fan_out_threshold = settings.fan_out_threshold
         self._send_callback: Callable[[str, str], Awaitable[None]] | None = None
+        self._online_users: Callable[[], Collection[str]] = frozenset
+        self.delivery_workers = max(1, settings.delivery_workers)
+        self.delivery_queue_size = settings.delivery_queue_size
+        self._partitions: list[asyncio.Queue[dict[str, Any]]] = []
+        self._workers: list[asyncio.Task[None]] = []
 
     def set_send_callback(
         self, callback: Callable[[str, str], Awaitable[None]]
@@ -20,17 +44,107 @@ class NotificationService:
         """Set callback for sending notifications to peers"""
         self._send_callback = callback
 
+    def set_online_users_callback(
+        self, callback: Callable[[], Collection[str]]
+    ) -> None:
+        """Set callback listing the users connected to this node"""
+        self._online_users = callback
+
+    def start_delivery(self) -> None:
+        """Start one delivery worker per partition"""
+        self._partitions = [
+            asyncio.Queue(self.delivery_queue_size)
+            for _ in range(self.delivery_workers)
+        ]
+        self._workers = [
+            asyncio.create_task(self._deliver(partition))
+            for partition in self._partitions
+        ]
+
+    async def stop_delivery(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._partitions = []
+
     async def watch_notifications(self) -> None:
-        """Watch for new notifications and send them to peers"""
+        """Watch for new notifications and hand them to the delivery workers"""
+        self.start_delivery()
         try:
             logging.info("watching notifications")
-            async with self.notifications.watch(
-                [{"$match": {"operationType": "insert"}}]
-            ) as stream:
-                async for change in stream:
-                    await self._process_notification(change["fullDocument"])
+            # Notifications created on this node were already delivered locally
+            async for notification in self.repository.watch(self.node_id):
+                await self._dispatch(notification)
         except Exception as e:
             logging.error(f"Error watching notifications: {e}")
+        finally:
+            await self.stop_delivery()
+
+    async def watch_discussion_events(self) -> None:
+        """Deliver discussion events stored by other nodes to local participants"""
+        try:
+            logging.info("watching discussion events")
+            async for event in self.repository.watch_events(self.node_id):
+                await self._deliver_event(event)
+        except Exception as e:
+            logging.error(f"Error watching discussion events: {e}")
+
+    async def _deliver_event(self, event: dict[str, Any]) -> None:
+        """Resolve the recipients of a discussion event among local users"""
+        online = self._online_users()
+        if not online or self._send_callback is None:
+            return
+
+        participants = await self.discussions.participants(event["discussion_id"])
+        if participants is None:
+            return
+        await self._deliver_event_to(event, set(participants))
+
+    async def _deliver_event_to(
+        self, event: dict[str, Any], participant_ids: Collection[str]
+    ) -> None:
+        online = self._online_users()
+        if len(online) < len(participant_ids):
+            recipients = [user_id for user_id in online if user_id in participant_ids]
+        else:
+            recipients = [user_id for user_id in participant_ids if user_id in online]
+        await self._deliver_locally(
+            [
+                {**event, "recipient_id": recipient_id}
+                for recipient_id in recipients
+                if recipient_id != event["sender_id"]
+            ]
+        )
+
+    async def _dispatch(self, notification: dict[str, Any]) -> None:
+        """Route a notification to the worker owning its recipient.
+
+        Partitioning by recipient keeps each user's notifications in order while
+        deliveries to different users run concurrently.
+        """
+        partition = hash(notification["recipient_id"]) % len(self._partitions)
+        await self._partitions[partition].put(notification)
+
+    async def _deliver_locally(self, notifications: list[dict[str, Any]]) -> None:
+        """Hand freshly created notifications straight to local recipients.
+
+        Recipients connected to other nodes get them through the change stream,
+        which skips the notifications originating from this node.
+        """
+        if self._send_callback is None:
+            return
+
+        for notification in notifications:
+            if self._partitions:
+                await self._dispatch(notification)
+            else:
+                await self._process_notification(notification)
+
+    async def _deliver(self, partition: asyncio.Queue[dict[str, Any]]) -> None:
+        while True:
+            notification = await partition.get()
+            await self._process_notification(notification)
 
     async def _process_notification(self, notification: dict[str, Any]) -> None:
         """Process a single notification and send it to the appropriate peer."""
@@ -45,9 +159,16 @@ class NotificationService:
     async def create_reply_notifications(
         self, discussion_id: str, sender_id: str, recipient_ids: list[str]
     ) -> None:
-        """Create reply notifications for all recipients except the sender"""
+        """Create reply notifications for all recipients except the sender.
+
+        Above fan_out_threshold recipients a single discussion event is stored
+        instead, and each node resolves which of its users to notify.
+        """
         if not recipient_ids:
             return
+        if len(recipient_ids) > self.fan_out_threshold:
+            await self.create_discussion_event(discussion_id, sender_id, recipient_ids)
+            return
 
         notifications = [
             {
@@ -56,17 +177,40 @@ class NotificationService:
                 "sender_id": sender_id,
                 "notification_type": NotificationType.REPLY.value,
                 "created_at": datetime.now(),
+                "origin": self.node_id,
             }
             for recipient_id in recipient_ids
             if recipient_id != sender_id  # Don't notify the sender
         ]
 
         if notifications:
-            await self.notifications.insert_many(notifications)
+            await self._deliver_locally(notifications)
+            await self.repository.insert(notifications)
             logging.info(
                 f"Created {len(notifications)} reply notifications for discussion {discussion_id}"
             )
 
+    async def create_discussion_event(
+        self, discussion_id: str, sender_id: str, recipient_ids: Collection[str]
+    ) -> None:
+        """Store one event for a reply, delivered to participants on read.
+
+        Its recipients are the participants of the discussion, read back from
+        the discussion when the notifications are fetched or delivered remotely.
+        """
+        event = {
+            "discussion_id": discussion_id,
+            "sender_id": sender_id,
+            "notification_type": NotificationType.REPLY.value,
+            "created_at": datetime.now(),
+            "origin": self.node_id,
+        }
+        if self._send_callback is not None:
+            await self._deliver_event_to(event, recipient_ids)
+        await self.repository.insert_event(event)
+        await self.discussions.mark_fanned_out(discussion_id)
+        logging.info(f"Created discussion event for discussion {discussion_id}")
+
     async def create_mention_notifications(
         self, discussion_id: str, sender_id: str, mentioned_ids: list[str]
     ) -> None:
@@ -81,24 +225,31 @@ class NotificationService:
                 "sender_id": sender_id,
                 "notification_type": NotificationType.MENTION.value,
                 "created_at": datetime.now(),
+                "origin": self.node_id,
             }
             for recipient_id in mentioned_ids
             if recipient_id != sender_id
         ]
 
         if notifications:
-            await self.notifications.insert_many(notifications)
+            await self._deliver_locally(notifications)
+            await self.repository.insert(notifications)
             logging.info(
                 f"Created {len(notifications)} mention notifications for discussion {discussion_id}"
             )
 
     async def get_notifications(self, recipient_id: str) -> list[Notification]:
-        """Get all notifications for a recipient"""
-        notification_docs = (
-            await self.notifications.find({"recipient_id": recipient_id}, {"_id": 0})
-            .sort("created_at", -1)
-            .to_list(length=None)
-        )
+        """Get all notifications for a recipient, newest first"""
+        # Include the notifications still waiting to be written
+        await self.repository.flush()
+        notification_docs = await self.repository.find(recipient_id)
+        # Replies to fanned out discussions are resolved from their participants
+        discussion_ids = await self.discussions.fanned_out(recipient_id)
+        if discussion_ids:
+            notification_docs += await self.repository.unread_events(
+                recipient_id, discussion_ids
+            )
+            notification_docs.sort(key=lambda doc: doc["created_at"], reverse=True)
 
         return [
             Notification(
@@ -112,6 +263,6 @@ class NotificationService:
 
     async def mark_as_read(self, recipient_id: str, discussion_id: str) -> None:
         """Mark notifications as read for a specific discussion"""
-        await self.notifications.delete_many(
-            {"recipient_id": recipient_id, "discussion_id": discussion_id}
-        )
+        # A pending write must not land after the delete
+        await self.repository.flush()
+        await self.repository.delete(recipient_id, discussion_id)
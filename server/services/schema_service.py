@@ -0,0 +1,115 @@
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Protocol
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+from server.migrations import Migration
+
+
+class IndexedRepository(Protocol):
+    INDEXES: dict[str, list[IndexModel]]
+
+
+@dataclass
+class SchemaReport:
+    applied_migrations: list[int] = field(default_factory=list)
+    # collection -> index names
+    missing: dict[str, list[str]] = field(default_factory=dict)
+    undeclared: dict[str, list[str]] = field(default_factory=dict)
+    unused: dict[str, list[str]] = field(default_factory=dict)
+
+
+class SchemaService:
+    """Applies pending migrations and keeps the declared indexes in place.
+
+    Every Mongo repository declares the indexes its queries rely on in an
+    ``INDEXES`` mapping of collection name to index models.
+    """
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase[Any],
+        repositories: list[IndexedRepository],
+        migrations: list[Migration],
+    ) -> None:
+        self.db = db
+        self.migrations = sorted(migrations, key=lambda m: m.version)
+        self.indexes: dict[str, list[IndexModel]] = {}
+        for repository in repositories:
+            for collection, models in repository.INDEXES.items():
+                self.indexes.setdefault(collection, []).extend(models)
+
+    async def setup(self) -> SchemaReport:
+        report = SchemaReport(applied_migrations=await self.migrate())
+        await self.ensure_indexes()
+        await self.verify(report)
+
+        for problem in ["missing", "undeclared", "unused"]:
+            for collection, names in getattr(report, problem).items():
+                logging.warning(f"{problem} indexes on {collection}: {names}")
+        return report
+
+    async def migrate(self) -> list[int]:
+        """Apply the migrations not recorded in schema_migrations yet"""
+        applied = {
+            doc["version"]
+            async for doc in self.db.schema_migrations.find({}, {"version": 1})
+        }
+        newly_applied = []
+        for migration in self.migrations:
+            if migration.version in applied:
+                continue
+
+            logging.info(
+                f"Applying migration {migration.version}: {migration.description}"
+            )
+            await migration.apply(self.db)
+            await self.db.schema_migrations.update_one(
+                {"version": migration.version},
+                {
+                    "$set": {
+                        "description": migration.description,
+                        "applied_at": datetime.now(),
+                    }
+                },
+                upsert=True,
+            )
+            newly_applied.append(migration.version)
+        return newly_applied
+
+    async def ensure_indexes(self) -> None:
+        """Create the declared indexes, existing identical ones are left alone"""
+        for collection, models in self.indexes.items():
+            await self.db[collection].create_indexes(models)
+
+    async def verify(self, report: SchemaReport) -> None:
+        """Compare the declared indexes with those present on the database"""
+        for collection, models in self.indexes.items():
+            declared = {model.document["name"] for model in models}
+            present = set(await self.db[collection].index_information()) - {"_id_"}
+
+            if missing := sorted(declared - present):
+                report.missing[collection] = missing
+            if undeclared := sorted(present - declared):
+                report.undeclared[collection] = undeclared
+            if unused := await self._unused_indexes(collection):
+                report.unused[collection] = unused
+
+    async def _unused_indexes(self, collection: str) -> list[str]:
+        """Indexes without a single access since the server last started"""
+        try:
+            stats = await (
+                self.db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+            )
+        except (OperationFailure, NotImplementedError):
+            # Not available with every deployment (or with mongomock)
+            return []
+        return sorted(
+            s["name"]
+            for s in stats
+            if s["name"] != "_id_" and s["accesses"]["ops"] == 0
+        )
@@ -1,53 +1,126 @@
+import asyncio
 import logging
+from collections.abc import Awaitable, Callable, KeysView
 from datetime import datetime
 from typing import Any
 
-from motor.motor_asyncio import AsyncIOMotorDatabase
-
 from server.entities.session import Session
+from server.node import default_node_id
+from server.storage.repository import SessionRepository
 
 
 class SessionService:
-    def __init__(self, db: AsyncIOMotorDatabase[Any]) -> None:
-        self.sessions = db.sessions
+    """Authoritative per-node session registry.
+
+    Lookups are served from memory; the repository is only a mirror, written
+    in the background, used for crash recovery and by other nodes.
+    """
+
+    def __init__(
+        self, repository: SessionRepository, node_id: str | None = None
+    ) -> None:
+        self.repository = repository
+        self.node_id = node_id or default_node_id()
+        # Sessions of a previous run can only be found under a configured id
+        self.recoverable = node_id is not None
+        self._sessions: dict[str, Session] = {}
+        self._peers_by_user: dict[str, set[str]] = {}
+        # peer_id -> last mirror write scheduled for it
+        self._mirror_tails: dict[str, asyncio.Task[None]] = {}
+
+    def _mirror(self, peer_id: str, operation: Callable[[], Awaitable[Any]]) -> None:
+        """Schedule a write to the repository after the earlier ones of the peer.
+
+        Writes of different peers don't wait for each other, and a peer's entry
+        is dropped once its last write is done.
+        """
+        previous = self._mirror_tails.get(peer_id)
+
+        async def run() -> None:
+            if previous is not None:
+                await asyncio.wait([previous])
+            try:
+                await operation()
+            except Exception as e:
+                logging.error(f"Error mirroring session: {e}")
+
+        task = asyncio.create_task(run())
+        self._mirror_tails[peer_id] = task
+
+        def forget(_: asyncio.Task[None]) -> None:
+            if self._mirror_tails.get(peer_id) is task:
+                del self._mirror_tails[peer_id]
+
+        task.add_done_callback(forget)
+
+    async def flush(self) -> None:
+        """Wait until every pending mirror write has reached the repository"""
+        if self._mirror_tails:
+            await asyncio.wait(list(self._mirror_tails.values()))
+
+    async def recover(self) -> None:
+        """Drop sessions a previous run of this node left behind"""
+        if not self.recoverable:
+            logging.info("No node_id configured, skipping session recovery")
+            return
+        deleted = await self.repository.delete_node(self.node_id)
+        if deleted:
+            logging.info(f"Removed {deleted} stale sessions of node {self.node_id}")
+
+    def _unlink(self, peer_id: str) -> None:
+        session = self._sessions.pop(peer_id, None)
+        if session is None:
+            return
+        peers = self._peers_by_user.get(session.user_id)
+        if peers is not None:
+            peers.discard(peer_id)
+            if not peers:
+                del self._peers_by_user[session.user_id]
+
+    def online_user_ids(self) -> KeysView[str]:
+        """Users signed in on this node"""
+        return self._peers_by_user.keys()
+
+    def get_peer_ids(self, user_id: str) -> set[str]:
+        """Every peer the user is signed in from on this node"""
+        return self._peers_by_user.get(user_id, set())
 
     async def set(self, peer_id: str, user_id: str) -> None:
         logging.info(f"Setting session for {peer_id} to {user_id}")
+        self._unlink(peer_id)
+        session = Session(peer_id=peer_id, user_id=user_id, created_at=datetime.now())
+        self._sessions[peer_id] = session
+        self._peers_by_user.setdefault(user_id, set()).add(peer_id)
+
         session_doc = {
             "peer_id": peer_id,
             "user_id": user_id,
-            "created_at": datetime.now(),
+            "node_id": self.node_id,
+            "created_at": session.created_at,
         }
-        await self.sessions.update_one(
-            {"peer_id": peer_id}, {"$set": session_doc}, upsert=True
-        )
+        self._mirror(peer_id, lambda: self.repository.save(session_doc))
 
     async def get_client_id(self, peer_id: str | None) -> str | None:
         if peer_id is None:
             return None
-        session_doc = await self.sessions.find_one({"peer_id": peer_id}, {"_id": 0})
-        if not session_doc:
-            return None
-        session = Session(**session_doc)
-        return session.user_id
+        session = self._sessions.get(peer_id)
+        return session.user_id if session is not None else None
 
     async def get_by_user_id(self, user_id: str | None) -> str | None:
         if user_id is None:
             return None
-        session_doc = await self.sessions.find_one({"user_id": user_id}, {"_id": 0})
-        if not session_doc:
+        peers = self._peers_by_user.get(user_id)
+        if not peers:
             return None
-        session = Session(**session_doc)
-        return session.peer_id
+        return next(iter(peers))
 
     async def get_session(self, peer_id: str | None) -> Session | None:
         if peer_id is None:
             return None
-        session_doc = await self.sessions.find_one({"peer_id": peer_id}, {"_id": 0})
-        if not session_doc:
-            return None
-        return Session(**session_doc)
+        return self._sessions.get(peer_id)
 
     async def delete(self, peer_id: str | None) -> None:
-        if peer_id is not None:
-            await self.sessions.delete_one({"peer_id": peer_id})
+        if peer_id is None:
+            return
+        self._unlink(peer_id)
+        self._mirror(peer_id, lambda: self.repository.delete(peer_id))
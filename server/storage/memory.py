@@ -0,0 +1,278 @@
+"""In-process repositories, without a database round trip.
+
+Discussions live in a dict by discussion_id, next to sorted lists of their
+(created_at, discussion_id) positions, one for every discussion and one per
+reference prefix, so pages are found by bisection. Notifications are kept per
+recipient, discussion events per discussion. Writes are published on an
+EventBus, which stands in for the change streams of the Mongo storage.
+"""
+
+import asyncio
+from bisect import bisect_right, insort
+from collections.abc import AsyncIterator
+from datetime import datetime
+from typing import Any
+
+from server.storage.repository import ListEntry, Position
+
+
+class EventBus:
+    """Publish/subscribe of documents by topic, within one process"""
+
+    def __init__(self) -> None:
+        self._subscribers: dict[str, set[asyncio.Queue[dict[str, Any]]]] = {}
+
+    def publish(self, topic: str, document: dict[str, Any]) -> None:
+        for queue in self._subscribers.get(topic, ()):
+            queue.put_nowait(document)
+
+    async def subscribe(self, topic: str) -> AsyncIterator[dict[str, Any]]:
+        """Documents published on the topic from the first iteration on"""
+        queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        subscribers = self._subscribers.setdefault(topic, set())
+        subscribers.add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            subscribers.discard(queue)
+
+
+class MemoryStore:
+    """Everything the memory repositories hold; servers sharing one act as nodes"""
+
+    def __init__(self) -> None:
+        self.discussions: dict[str, dict[str, Any]] = {}
+        self.positions: list[Position] = []
+        self.positions_by_prefix: dict[str, list[Position]] = {}
+        # recipient_id -> notifications, oldest first
+        self.notifications: dict[str, list[dict[str, Any]]] = {}
+        # discussion_id -> events, oldest first, of the fanned out discussions
+        self.events: dict[str, list[dict[str, Any]]] = {}
+        # (recipient_id, discussion_id) -> when its events were last read
+        self.reads: dict[tuple[str, str], datetime] = {}
+        self.sessions: dict[str, dict[str, Any]] = {}
+        self.bus = EventBus()
+
+
+def _page(
+    positions: list[Position], limit: int | None, after: Position | None
+) -> tuple[list[Position], bool]:
+    start = bisect_right(positions, after) if after is not None else 0
+    if limit is None:
+        return positions[start:], False
+    return positions[start : start + limit], len(positions) > start + limit
+
+
+class MemoryDiscussionRepository:
+    """Discussions in memory.
+
+    Documents are copied on the way in and out, down to their lists of replies
+    and participants, so neither callers nor later replies change each other's.
+    """
+
+    def __init__(self, store: MemoryStore) -> None:
+        self.store = store
+        self.discussions = store.discussions
+
+    def _change(self, operation: str, discussion_id: str) -> None:
+        self.store.bus.publish(
+            "discussions",
+            {"operationType": operation, "documentKey": {"_id": discussion_id}},
+        )
+
+    async def insert(self, discussion: dict[str, Any]) -> None:
+        discussion_id = discussion["discussion_id"]
+        if discussion_id in self.discussions:
+            raise ValueError(f"Discussion {discussion_id} already exists")
+        self.discussions[discussion_id] = {
+            **discussion,
+            "_id": discussion_id,
+            "replies": [dict(reply) for reply in discussion["replies"]],
+            "participants": list(discussion.get("participants", [])),
+        }
+
+        position = (discussion["created_at"], discussion_id)
+        insort(self.store.positions, position)
+        insort(
+            self.store.positions_by_prefix.setdefault(
+                discussion["reference_prefix"], []
+            ),
+            position,
+        )
+        self._change("insert", discussion_id)
+
+    async def add_reply(
+        self, discussion_id: str, reply: dict[str, Any]
+    ) -> list[str] | None:
+        discussion = self.discussions.get(discussion_id)
+        if discussion is None:
+            return None
+
+        participants: list[str] = discussion.setdefault("participants", [])
+        before = list(participants)
+        if reply["client_id"] not in participants:
+            participants.append(reply["client_id"])
+        discussion["replies"].append(dict(reply))
+        discussion["reply_count"] += 1
+        self._change("update", discussion_id)
+        return before
+
+    async def get(
+        self, discussion_id: str, offset: int = 0, limit: int | None = None
+    ) -> dict[str, Any] | None:
+        discussion = self.discussions.get(discussion_id)
+        if discussion is None:
+            return None
+        end = offset + limit if limit is not None else None
+        return {
+            **discussion,
+            "replies": discussion["replies"][offset:end],
+            "participants": list(discussion["participants"]),
+        }
+
+    def _positions(self, reference_prefix: str | None) -> list[Position]:
+        if reference_prefix:
+            return self.store.positions_by_prefix.get(reference_prefix, [])
+        return self.store.positions
+
+    async def find(self, reference_prefix: str | None) -> list[dict[str, Any]]:
+        return [
+            self.discussions[discussion_id]
+            for _, discussion_id in self._positions(reference_prefix)
+        ]
+
+    async def entries(
+        self,
+        reference_prefix: str | None,
+        limit: int | None = None,
+        after: Position | None = None,
+    ) -> tuple[list[ListEntry], bool]:
+        positions, more = _page(self._positions(reference_prefix), limit, after)
+        entries = []
+        for created_at, discussion_id in positions:
+            doc = self.discussions[discussion_id]
+            replies = ",".join(
+                f"{reply['client_id']}|{reply['comment']}" for reply in doc["replies"]
+            )
+            entries.append(
+                (
+                    created_at,
+                    discussion_id,
+                    f"{discussion_id}|{doc['reference_prefix']}."
+                    f"{doc['time_marker']}|({replies})",
+                )
+            )
+        return entries, more
+
+    async def participants(self, discussion_id: str) -> list[str] | None:
+        discussion = self.discussions.get(discussion_id)
+        return list(discussion["participants"]) if discussion is not None else None
+
+    async def mark_fanned_out(self, discussion_id: str) -> None:
+        self.store.events.setdefault(discussion_id, [])
+
+    async def fanned_out(self, participant_id: str) -> list[str]:
+        return [
+            discussion_id
+            for discussion_id in self.store.events
+            if participant_id in self.discussions[discussion_id]["participants"]
+        ]
+
+    def watch(self) -> AsyncIterator[dict[str, Any]]:
+        return self.store.bus.subscribe("discussions")
+
+
+class MemoryNotificationRepository:
+    def __init__(self, store: MemoryStore) -> None:
+        self.store = store
+        self.notifications = store.notifications
+        self.inserted = 0
+        self.events = 0
+
+    async def insert(self, notifications: list[dict[str, Any]]) -> None:
+        for notification in notifications:
+            self.notifications.setdefault(notification["recipient_id"], []).append(
+                notification
+            )
+            self.store.bus.publish("notifications", notification)
+        self.inserted += len(notifications)
+
+    async def insert_event(self, event: dict[str, Any]) -> None:
+        self.store.events.setdefault(event["discussion_id"], []).append(event)
+        self.store.bus.publish("discussion_events", event)
+        self.events += 1
+
+    async def find(self, recipient_id: str) -> list[dict[str, Any]]:
+        return [
+            {key: value for key, value in notification.items() if key != "origin"}
+            for notification in reversed(self.notifications.get(recipient_id, []))
+        ]
+
+    async def unread_events(
+        self, recipient_id: str, discussion_ids: list[str]
+    ) -> list[dict[str, Any]]:
+        unread = []
+        for discussion_id in discussion_ids:
+            read_at = self.store.reads.get((recipient_id, discussion_id))
+            unread += [
+                {
+                    **{key: value for key, value in event.items() if key != "origin"},
+                    "recipient_id": recipient_id,
+                }
+                for event in self.store.events.get(discussion_id, [])
+                if event["sender_id"] != recipient_id
+                and (read_at is None or event["created_at"] > read_at)
+            ]
+        return unread
+
+    async def delete(self, recipient_id: str, discussion_id: str) -> None:
+        self.store.reads[(recipient_id, discussion_id)] = datetime.now()
+        notifications = self.notifications.get(recipient_id)
+        if notifications is None:
+            return
+        notifications[:] = [
+            n for n in notifications if n["discussion_id"] != discussion_id
+        ]
+        if not notifications:
+            del self.notifications[recipient_id]
+
+    async def _from_other_nodes(
+        self, topic: str, node_id: str
+    ) -> AsyncIterator[dict[str, Any]]:
+        async for document in self.store.bus.subscribe(topic):
+            if document.get("origin") != node_id:
+                yield document
+
+    def watch(self, node_id: str) -> AsyncIterator[dict[str, Any]]:
+        return self._from_other_nodes("notifications", node_id)
+
+    def watch_events(self, node_id: str) -> AsyncIterator[dict[str, Any]]:
+        return self._from_other_nodes("discussion_events", node_id)
+
+    async def flush(self) -> None:
+        pass
+
+    def stats(self) -> dict[str, int]:
+        return {"inserted": self.inserted, "events": self.events}
+
+
+class MemorySessionRepository:
+    def __init__(self, store: MemoryStore) -> None:
+        self.sessions = store.sessions
+
+    async def save(self, session: dict[str, Any]) -> None:
+        self.sessions[session["peer_id"]] = dict(session)
+
+    async def delete(self, peer_id: str) -> None:
+        self.sessions.pop(peer_id, None)
+
+    async def delete_node(self, node_id: str) -> int:
+        peer_ids = [
+            peer_id
+            for peer_id, session in self.sessions.items()
+            if session["node_id"] == node_id
+        ]
+        for peer_id in peer_ids:
+            del self.sessions[peer_id]
+        return len(peer_ids)
@@ -0,0 +1,459 @@
+"""MongoDB repositories, the default storage."""
+
+import asyncio
+from collections.abc import AsyncIterator
+from datetime import datetime
+from typing import Any, ClassVar
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from server.batcher import InsertBatcher
+from server.storage.repository import ListEntry, Position
+
+# embedded: replies live in the discussion document
+# bucketed: replies go to reply_buckets documents of reply_bucket_size replies
+REPLY_STORAGES = ("embedded", "bucketed")
+# Fields a LIST_DISCUSSIONS entry is made of, plus what paging needs
+LIST_PROJECTION = {
+    "_id": 0,
+    "discussion_id": 1,
+    "reference_prefix": 1,
+    "time_marker": 1,
+    "created_at": 1,
+    "bucketed": 1,
+    "replies.client_id": 1,
+    "replies.comment": 1,
+}
+PAGE_ORDER = [("created_at", ASCENDING), ("discussion_id", ASCENDING)]
+
+
+def _inserts_from_other_nodes(node_id: str) -> list[dict[str, Any]]:
+    return [
+        {
+            "$match": {
+                "operationType": "insert",
+                "fullDocument.origin": {"$ne": node_id},
+            }
+        }
+    ]
+
+
+class MongoDiscussionRepository:
+    INDEXES: ClassVar[dict[str, list[IndexModel]]] = {
+        "discussions": [
+            IndexModel([("discussion_id", ASCENDING)], unique=True),
+            # Listing the discussions of one video, in page order
+            IndexModel([("reference_prefix", ASCENDING), ("created_at", ASCENDING)]),
+            IndexModel([("created_at", ASCENDING), ("discussion_id", ASCENDING)]),
+            # Only large discussions, whose replies are read from discussion_events
+            IndexModel(
+                [("participants", ASCENDING)],
+                partialFilterExpression={"fanned_out": True},
+            ),
+        ],
+        "reply_buckets": [
+            IndexModel([("discussion_id", ASCENDING), ("seq", ASCENDING)], unique=True),
+        ],
+    }
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase[Any],
+        reply_storage: str = "embedded",
+        reply_bucket_size: int = 100,
+    ) -> None:
+        if reply_storage not in REPLY_STORAGES:
+            raise ValueError(f"reply_storage must be one of {REPLY_STORAGES}")
+        self.reply_storage = reply_storage
+        self.reply_bucket_size = reply_bucket_size
+        self.discussions = db.discussions
+        self.reply_buckets = db.reply_buckets
+
+    async def insert(self, discussion: dict[str, Any]) -> None:
+        await self.discussions.insert_one(discussion)
+
+    async def add_reply(
+        self, discussion_id: str, reply: dict[str, Any]
+    ) -> list[str] | None:
+        discussion_doc = None
+        if self.reply_storage == "embedded":
+            # One round trip: append the reply and read who took part before it
+            discussion_doc = await self.discussions.find_one_and_update(
+                {"discussion_id": discussion_id, "bucketed": {"$ne": True}},
+                {
+                    "$push": {"replies": reply},
+                    "$inc": {"reply_count": 1},
+                    "$addToSet": {"participants": reply["client_id"]},
+                },
+                # discussion_id keeps the result non-empty for legacy documents
+                projection={"_id": 0, "discussion_id": 1, "participants": 1},
+                return_document=ReturnDocument.BEFORE,
+            )
+        # Discussions that already have buckets keep using them
+        if discussion_doc is None:
+            discussion_doc = await self._append_bucketed_reply(discussion_id, reply)
+        if discussion_doc is None:
+            return None
+        # Missing on discussions written before participants were tracked
+        participants: list[str] = discussion_doc.get("participants", [])
+        return participants
+
+    async def _append_bucketed_reply(
+        self, discussion_id: str, new_reply: dict[str, Any]
+    ) -> dict[str, Any] | None:
+        """Store a reply in the bucket its position falls into.
+
+        The position is the reply_count before the reply, reserved together
+        with the participant update in a single find-and-update. The discussion
+        is written again once the bucket holds the reply, so the change stream
+        reports a change after which the reply is visible: nodes that cached the
+        discussion between both writes drop it again.
+
+        A failure between both writes leaves the reserved position without a
+        reply. reply_count then counts one reply more than stored and a window
+        over that position returns one reply fewer; reply order is unaffected.
+        """
+        discussion_doc: dict[str, Any] | None = (
+            await self.discussions.find_one_and_update(
+                {"discussion_id": discussion_id},
+                {
+                    "$inc": {"reply_count": 1},
+                    "$addToSet": {"participants": new_reply["client_id"]},
+                    "$set": {"bucketed": True},
+                },
+                projection={
+                    "_id": 0,
+                    "discussion_id": 1,
+                    "participants": 1,
+                    "reply_count": 1,
+                },
+                return_document=ReturnDocument.BEFORE,
+            )
+        )
+        if discussion_doc is None:
+            return None
+
+        position = discussion_doc["reply_count"]
+        for attempt in range(2):
+            try:
+                await self.reply_buckets.update_one(
+                    {
+                        "discussion_id": discussion_id,
+                        "seq": position // self.reply_bucket_size,
+                    },
+                    {"$push": {"replies": {**new_reply, "n": position}}},
+                    upsert=True,
+                )
+                break
+            except DuplicateKeyError:
+                # Lost the race to create the bucket, it exists now
+                if attempt:
+                    raise
+        await self.discussions.update_one(
+            {"discussion_id": discussion_id},
+            {"$inc": {"bucketed_replies": 1}},
+        )
+        return discussion_doc
+
+    async def _attach_bucketed_replies(
+        self,
+        discussion_docs: list[dict[str, Any]],
+        offset: int = 0,
+        limit: int | None = None,
+    ) -> None:
+        """Append the bucketed replies to the embedded ones, in reply order.
+
+        With a window, only the buckets overlapping [offset, offset + limit) are
+        read; the embedded replies are expected to be sliced already.
+        """
+        bucketed = {
+            doc["discussion_id"]: doc for doc in discussion_docs if doc.get("bucketed")
+        }
+        if not bucketed:
+            return
+
+        query: dict[str, Any] = {"discussion_id": {"$in": list(bucketed)}}
+        if limit is not None:
+            query["seq"] = {
+                "$gte": offset // self.reply_bucket_size,
+                "$lte": (offset + limit - 1) // self.reply_bucket_size,
+            }
+        bucket_docs = self.reply_buckets.find(query, {"_id": 0}).sort(
+            [("discussion_id", ASCENDING), ("seq", ASCENDING)]
+        )
+        async for bucket_doc in bucket_docs:
+            replies = bucket_doc["replies"]
+            if limit is not None:
+                end = offset + limit
+                replies = [r for r in replies if offset <= r["n"] < end]
+            discussion_doc = bucketed[bucket_doc["discussion_id"]]
+            discussion_doc["replies"].extend(sorted(replies, key=lambda r: r["n"]))
+
+        if limit is not None:
+            for discussion_doc in bucketed.values():
+                del discussion_doc["replies"][limit:]
+
+    async def get(
+        self, discussion_id: str, offset: int = 0, limit: int | None = None
+    ) -> dict[str, Any] | None:
+        # Participants can run into thousands and are not returned. A window is
+        # sliced by the database, only its replies are transferred. _id stays
+        # for the cache, which maps change events back to discussions by it.
+        projection: dict[str, Any] = {"participants": 0}
+        if limit is not None:
+            projection["replies"] = {"$slice": [offset, limit]}
+        discussion_doc: dict[str, Any] | None = await self.discussions.find_one(
+            {"discussion_id": discussion_id}, projection
+        )
+        if discussion_doc:
+            await self._attach_bucketed_replies([discussion_doc], offset, limit)
+        return discussion_doc
+
+    @staticmethod
+    def _query(
+        reference_prefix: str | None, after: Position | None = None
+    ) -> dict[str, Any]:
+        query: dict[str, Any] = (
+            {"reference_prefix": reference_prefix} if reference_prefix else {}
+        )
+        if after is not None:
+            created_at, discussion_id = after
+            query["$or"] = [
+                {"created_at": {"$gt": created_at}},
+                {"created_at": created_at, "discussion_id": {"$gt": discussion_id}},
+            ]
+        return query
+
+    async def find(self, reference_prefix: str | None) -> list[dict[str, Any]]:
+        discussion_docs: list[dict[str, Any]] = await self.discussions.find(
+            self._query(reference_prefix), {"_id": 0}
+        ).to_list(length=None)
+        await self._attach_bucketed_replies(discussion_docs)
+        return discussion_docs
+
+    async def entries(
+        self,
+        reference_prefix: str | None,
+        limit: int | None = None,
+        after: Position | None = None,
+    ) -> tuple[list[ListEntry], bool]:
+        """Entries formatted from documents reduced to the listed fields"""
+        find = self.discussions.find(
+            self._query(reference_prefix, after), LIST_PROJECTION
+        )
+        if limit is not None:
+            # One more than the page tells whether another page follows
+            find = find.sort(PAGE_ORDER).limit(limit + 1)
+        discussion_docs = await find.to_list(length=None)
+
+        more = limit is not None and len(discussion_docs) > limit
+        discussion_docs = discussion_docs[:limit]
+        bucketed = await self._bucketed_reply_entries(
+            [doc["discussion_id"] for doc in discussion_docs if doc.get("bucketed")]
+        )
+        entries = []
+        for doc in discussion_docs:
+            replies = [
+                f"{reply['client_id']}|{reply['comment']}" for reply in doc["replies"]
+            ]
+            replies.extend(bucketed.get(doc["discussion_id"], ()))
+            entries.append(
+                (
+                    doc["created_at"],
+                    doc["discussion_id"],
+                    f"{doc['discussion_id']}|{doc['reference_prefix']}."
+                    f"{doc['time_marker']}|({','.join(replies)})",
+                )
+            )
+        return entries, more
+
+    async def _bucketed_reply_entries(
+        self, discussion_ids: list[str]
+    ) -> dict[str, list[str]]:
+        """``client_id|comment`` of the bucketed replies, in reply order"""
+        entries: dict[str, list[str]] = {}
+        if not discussion_ids:
+            return entries
+
+        bucket_docs = self.reply_buckets.find(
+            {"discussion_id": {"$in": discussion_ids}},
+            {
+                "_id": 0,
+                "discussion_id": 1,
+                "replies.n": 1,
+                "replies.client_id": 1,
+                "replies.comment": 1,
+            },
+        ).sort([("discussion_id", ASCENDING), ("seq", ASCENDING)])
+        async for bucket_doc in bucket_docs:
+            entries.setdefault(bucket_doc["discussion_id"], []).extend(
+                f"{reply['client_id']}|{reply['comment']}"
+                for reply in sorted(bucket_doc["replies"], key=lambda r: r["n"])
+            )
+        return entries
+
+    async def participants(self, discussion_id: str) -> list[str] | None:
+        discussion_doc = await self.discussions.find_one(
+            {"discussion_id": discussion_id}, {"_id": 0, "participants": 1}
+        )
+        if discussion_doc is None:
+            return None
+        participants: list[str] = discussion_doc.get("participants", [])
+        return participants
+
+    async def mark_fanned_out(self, discussion_id: str) -> None:
+        await self.discussions.update_one(
+            {"discussion_id": discussion_id, "fanned_out": {"$ne": True}},
+            {"$set": {"fanned_out": True}},
+        )
+
+    async def fanned_out(self, participant_id: str) -> list[str]:
+        return [
+            doc["discussion_id"]
+            async for doc in self.discussions.find(
+                {"participants": participant_id, "fanned_out": True},
+                {"_id": 0, "discussion_id": 1},
+            )
+        ]
+
+    async def watch(self) -> AsyncIterator[dict[str, Any]]:
+        async with self.discussions.watch() as stream:
+            async for change in stream:
+                yield change
+
+
+class MongoNotificationRepository:
+    INDEXES: ClassVar[dict[str, list[IndexModel]]] = {
+        "notifications": [
+            IndexModel([("recipient_id", ASCENDING), ("created_at", DESCENDING)]),
+        ],
+        "discussion_events": [
+            IndexModel([("discussion_id", ASCENDING), ("created_at", DESCENDING)]),
+        ],
+        # How far each recipient has read the events of a discussion
+        "notification_reads": [
+            IndexModel(
+                [("recipient_id", ASCENDING), ("discussion_id", ASCENDING)], unique=True
+            ),
+        ],
+    }
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase[Any],
+        batch_size: int = 500,
+        batch_delay: float = 0.001,
+        insert_retries: int = 3,
+    ) -> None:
+        self.notifications = db.notifications
+        self.discussion_events = db.discussion_events
+        self.notification_reads = db.notification_reads
+        # Inserts from concurrent requests are written together, in the
+        # background: notifications are delivered before they are stored
+        self.batcher = InsertBatcher(
+            self.notifications, batch_size, batch_delay, insert_retries
+        )
+        self.event_batcher = InsertBatcher(
+            self.discussion_events, batch_size, batch_delay, insert_retries
+        )
+
+    async def insert(self, notifications: list[dict[str, Any]]) -> None:
+        await self.batcher.insert(notifications)
+
+    async def insert_event(self, event: dict[str, Any]) -> None:
+        await self.event_batcher.insert([event])
+
+    async def find(self, recipient_id: str) -> list[dict[str, Any]]:
+        notification_docs: list[dict[str, Any]] = (
+            await self.notifications.find(
+                {"recipient_id": recipient_id}, {"_id": 0, "origin": 0}
+            )
+            .sort("created_at", -1)
+            .to_list(length=None)
+        )
+        return notification_docs
+
+    async def unread_events(
+        self, recipient_id: str, discussion_ids: list[str]
+    ) -> list[dict[str, Any]]:
+        read_at = {
+            doc["discussion_id"]: doc["read_at"]
+            async for doc in self.notification_reads.find(
+                {"recipient_id": recipient_id, "discussion_id": {"$in": discussion_ids}}
+            )
+        }
+        unread = [
+            (
+                {
+                    "discussion_id": discussion_id,
+                    "created_at": {"$gt": read_at[discussion_id]},
+                }
+                if discussion_id in read_at
+                else {"discussion_id": discussion_id}
+            )
+            for discussion_id in discussion_ids
+        ]
+        return [
+            {**doc, "recipient_id": recipient_id}
+            async for doc in self.discussion_events.find(
+                {"$or": unread, "sender_id": {"$ne": recipient_id}},
+                {"_id": 0, "origin": 0},
+            )
+        ]
+
+    async def delete(self, recipient_id: str, discussion_id: str) -> None:
+        await self.notifications.delete_many(
+            {"recipient_id": recipient_id, "discussion_id": discussion_id}
+        )
+        await self.notification_reads.update_one(
+            {"recipient_id": recipient_id, "discussion_id": discussion_id},
+            {"$max": {"read_at": datetime.now()}},
+            upsert=True,
+        )
+
+    async def watch(self, node_id: str) -> AsyncIterator[dict[str, Any]]:
+        async with self.notifications.watch(
+            _inserts_from_other_nodes(node_id)
+        ) as stream:
+            async for change in stream:
+                yield change["fullDocument"]
+
+    async def watch_events(self, node_id: str) -> AsyncIterator[dict[str, Any]]:
+        async with self.discussion_events.watch(
+            _inserts_from_other_nodes(node_id)
+        ) as stream:
+            async for change in stream:
+                yield change["fullDocument"]
+
+    async def flush(self) -> None:
+        await asyncio.gather(self.batcher.flush(), self.event_batcher.flush())
+
+    def stats(self) -> dict[str, int]:
+        return self.batcher.stats()
+
+
+class MongoSessionRepository:
+    INDEXES: ClassVar[dict[str, list[IndexModel]]] = {
+        "sessions": [
+            IndexModel([("peer_id", ASCENDING)], unique=True),
+            IndexModel([("user_id", ASCENDING)]),
+            IndexModel([("node_id", ASCENDING)]),
+        ],
+    }
+
+    def __init__(self, db: AsyncIOMotorDatabase[Any]) -> None:
+        self.sessions = db.sessions
+
+    async def save(self, session: dict[str, Any]) -> None:
+        await self.sessions.update_one(
+            {"peer_id": session["peer_id"]}, {"$set": session}, upsert=True
+        )
+
+    async def delete(self, peer_id: str) -> None:
+        await self.sessions.delete_one({"peer_id": peer_id})
+
+    async def delete_node(self, node_id: str) -> int:
+        result = await self.sessions.delete_many({"node_id": node_id})
+        return result.deleted_count
@@ -0,0 +1,108 @@
+"""Storage interfaces the services are written against.
+
+``mongo`` keeps everything in MongoDB and sees other nodes' writes through
+change streams. ``memory`` keeps everything in process, for edge nodes and
+benchmarks; servers sharing a MemoryStore behave like nodes sharing a database.
+"""
+
+from collections.abc import AsyncIterator
+from datetime import datetime
+from typing import Any, Protocol
+
+STORAGES = ("mongo", "memory")
+
+# (created_at, discussion_id) of a discussion, the order discussions are listed in
+Position = tuple[datetime, str]
+# (created_at, discussion_id, "discussion_id|reference|(client_id|comment,...)")
+ListEntry = tuple[datetime, str, str]
+
+
+class DiscussionRepository(Protocol):
+    async def insert(self, discussion: dict[str, Any]) -> None: ...
+
+    async def add_reply(
+        self, discussion_id: str, reply: dict[str, Any]
+    ) -> list[str] | None:
+        """Append a reply, returns the participants before it or None if missing"""
+        ...
+
+    async def get(
+        self, discussion_id: str, offset: int = 0, limit: int | None = None
+    ) -> dict[str, Any] | None:
+        """A discussion with all of its replies, or the window [offset, offset + limit)"""
+        ...
+
+    async def find(self, reference_prefix: str | None) -> list[dict[str, Any]]:
+        """Discussions with all of their replies"""
+        ...
+
+    async def entries(
+        self,
+        reference_prefix: str | None,
+        limit: int | None = None,
+        after: Position | None = None,
+    ) -> tuple[list[ListEntry], bool]:
+        """LIST_DISCUSSIONS entries, and whether more follow the page.
+
+        With a limit, at most that many discussions are returned in
+        (created_at, discussion_id) order, starting after ``after``.
+        """
+        ...
+
+    async def participants(self, discussion_id: str) -> list[str] | None: ...
+
+    async def mark_fanned_out(self, discussion_id: str) -> None:
+        """Record that replies to the discussion are stored as discussion events"""
+        ...
+
+    async def fanned_out(self, participant_id: str) -> list[str]:
+        """The fanned out discussions a client takes part in"""
+        ...
+
+    def watch(self) -> AsyncIterator[dict[str, Any]]:
+        """Change events of every discussion, in change stream format"""
+        ...
+
+
+class NotificationRepository(Protocol):
+    async def insert(self, notifications: list[dict[str, Any]]) -> None: ...
+
+    async def insert_event(self, event: dict[str, Any]) -> None: ...
+
+    async def find(self, recipient_id: str) -> list[dict[str, Any]]:
+        """Notifications of a recipient, newest first"""
+        ...
+
+    async def unread_events(
+        self, recipient_id: str, discussion_ids: list[str]
+    ) -> list[dict[str, Any]]:
+        """Events the recipient has not read yet, as its notifications"""
+        ...
+
+    async def delete(self, recipient_id: str, discussion_id: str) -> None:
+        """Delete the notifications of a discussion and mark its events read"""
+        ...
+
+    def watch(self, node_id: str) -> AsyncIterator[dict[str, Any]]:
+        """Notifications created by other nodes"""
+        ...
+
+    def watch_events(self, node_id: str) -> AsyncIterator[dict[str, Any]]:
+        """Discussion events created by other nodes"""
+        ...
+
+    async def flush(self) -> None:
+        """Wait for the writes still buffered"""
+        ...
+
+    def stats(self) -> dict[str, int]: ...
+
+
+class SessionRepository(Protocol):
+    async def save(self, session: dict[str, Any]) -> None: ...
+
+    async def delete(self, peer_id: str) -> None: ...
+
+    async def delete_node(self, node_id: str) -> int:
+        """Remove the sessions of a node, returns how many there were"""
+        ...
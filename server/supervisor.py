@@ -0,0 +1,298 @@
+"""Multi-process worker mode.
+
+The supervisor starts N worker processes that each run a complete server, with
+its own event loop and Motor client, on a port shared through SO_REUSEPORT so
+the kernel balances connections between them. Every worker has its own
+node_id: notifications created by one worker reach recipients connected to
+another through the notifications change stream. The id names the supervisor
+process and the worker index, so a restarted worker recovers the sessions of
+the one it replaces while supervisors sharing a host keep distinct ids.
+
+Workers that keep failing before they run healthily are restarted with an
+exponential backoff, and given up on after a few failures in a row.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from dataclasses import dataclass, field
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from queue import Empty
+from typing import Any, Protocol
+
+from server import event_loop
+from server.di import Container
+from server.server import Server, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# (worker index, pid, heartbeat timestamp, Server.stats())
+WorkerReport = tuple[int, int, float, dict[str, Any]]
+
+MISSED_REPORTS_LIMIT = 6
+# Restarts of a failing worker wait 1s, 2s, 4s... up to a minute
+RESTART_BACKOFF = 1.0
+MAX_RESTART_BACKOFF = 60.0
+# A worker reporting for this long ran fine, its next restart is immediate
+HEALTHY_UPTIME = 30.0
+# Consecutive failures before a worker is no longer restarted
+MAX_STARTUP_FAILURES = 5
+
+
+class WorkerTarget(Protocol):
+    def __call__(
+        self,
+        index: int,
+        host: str,
+        port: int,
+        reports: "Queue[WorkerReport]",
+        report_interval: float,
+    ) -> None: ...
+
+
+@dataclass
+class WorkerStats:
+    pid: int | None = None
+    started_at: float = 0.0
+    heartbeat: float | None = None
+    restarts: int = 0
+    # Consecutive exits or hangs before HEALTHY_UPTIME
+    failures: int = 0
+    restart_at: float | None = None
+    given_up: bool = False
+    stats: dict[str, Any] = field(default_factory=dict)
+
+
+def worker_node_id(index: int) -> str:
+    """node_id of a worker, called in the worker process"""
+    return f"{socket.gethostname()}-{os.getppid()}-{index}"
+
+
+async def _serve_worker(
+    index: int,
+    host: str,
+    port: int,
+    reports: "Queue[WorkerReport]",
+    report_interval: float,
+) -> None:
+    container = Container()
+    container.config.from_dict({"node_id": worker_node_id(index)})
+    server = Server(container=container, host=host, port=port, reuse_port=True)
+
+    async def report() -> None:
+        while True:
+            reports.put((index, os.getpid(), time.time(), server.stats()))
+            await asyncio.sleep(report_interval)
+
+    reporter = asyncio.create_task(report())
+    main = asyncio.current_task()
+    if main is not None:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main.cancel)
+    try:
+        await server.start()
+    finally:
+        reporter.cancel()
+        await server.stop()
+
+
+def run_worker(
+    index: int,
+    host: str,
+    port: int,
+    reports: "Queue[WorkerReport]",
+    report_interval: float,
+) -> None:
+    """Entry point of a worker process."""
+    configure_logging()
+    # The supervisor owns shutdown, a terminal ^C must not kill workers first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    event_loop.run(_serve_worker(index, host, port, reports, report_interval))
+
+
+class Supervisor:
+    """Keeps N workers running, restarting those that exit or stop reporting."""
+
+    def __init__(
+        self,
+        workers: int,
+        host: str = "0.0.0.0",
+        port: int = 8989,
+        report_interval: float = 5.0,
+        target: WorkerTarget = run_worker,
+    ) -> None:
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.report_interval = report_interval
+        # A worker missing this many reports in a row is considered hung
+        self.health_timeout = report_interval * MISSED_REPORTS_LIMIT
+        self.restart_backoff = RESTART_BACKOFF
+        self.max_restart_backoff = MAX_RESTART_BACKOFF
+        self.healthy_uptime = HEALTHY_UPTIME
+        self.max_startup_failures = MAX_STARTUP_FAILURES
+        self.target = target
+        self.stats: dict[int, WorkerStats] = {i: WorkerStats() for i in range(workers)}
+        self._context = multiprocessing.get_context()
+        self._reports: Queue[WorkerReport] = self._context.Queue()
+        self._processes: dict[int, BaseProcess] = {}
+        self._running = False
+
+    def start(self) -> None:
+        self._running = True
+        for index in range(self.workers):
+            self._start_worker(index)
+
+    def _start_worker(self, index: int) -> None:
+        process = self._context.Process(
+            target=self.target,
+            args=(index, self.host, self.port, self._reports, self.report_interval),
+            name=f"server-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+        worker = self.stats[index]
+        worker.pid = process.pid
+        worker.started_at = time.time()
+        worker.heartbeat = None
+        worker.restart_at = None
+        logger.info("Started worker %d (pid %s)", index, process.pid)
+
+    def _collect_reports(self) -> None:
+        while True:
+            try:
+                index, pid, heartbeat, stats = self._reports.get_nowait()
+            except Empty:
+                return
+            worker = self.stats[index]
+            # Ignore late reports from a process that was already replaced
+            if pid == worker.pid:
+                worker.heartbeat = heartbeat
+                worker.stats = stats
+
+    def check_workers(self) -> None:
+        """Collect worker reports and restart dead or unresponsive workers.
+
+        Workers failing before they ran healthily for ``healthy_uptime`` are
+        restarted with an exponential backoff, and no longer restarted after
+        ``max_startup_failures`` failures in a row. Once that happened to
+        every worker, RuntimeError is raised.
+        """
+        self._collect_reports()
+        if not self._running:
+            return
+
+        now = time.time()
+        for index, process in self._processes.items():
+            worker = self.stats[index]
+            if worker.given_up:
+                continue
+            if worker.restart_at is not None:
+                if now >= worker.restart_at:
+                    self._restart_worker(index)
+                continue
+
+            if not process.is_alive():
+                logger.warning(
+                    "Worker %d (pid %s) exited with %s",
+                    index,
+                    process.pid,
+                    process.exitcode,
+                )
+            elif now - (worker.heartbeat or worker.started_at) > self.health_timeout:
+                logger.warning(
+                    "Worker %d (pid %s) stopped reporting",
+                    index,
+                    process.pid,
+                )
+                process.kill()
+                process.join()
+            else:
+                continue
+            self._schedule_restart(index, now)
+
+        if all(worker.given_up for worker in self.stats.values()):
+            raise RuntimeError("Every worker failed at startup, giving up")
+
+    def _restart_delay(self, failures: int) -> float:
+        if failures == 0:
+            return 0.0
+        delay = self.restart_backoff * 2 ** (failures - 1)
+        return float(min(delay, self.max_restart_backoff))
+
+    def _schedule_restart(self, index: int, now: float) -> None:
+        worker = self.stats[index]
+        healthy = (
+            worker.heartbeat is not None
+            and worker.heartbeat - worker.started_at >= self.healthy_uptime
+        )
+        worker.failures = 0 if healthy else worker.failures + 1
+        if worker.failures >= self.max_startup_failures:
+            logger.error(
+                "Worker %d failed %d times in a row, no longer restarting it",
+                index,
+                worker.failures,
+            )
+            worker.given_up = True
+            return
+
+        delay = self._restart_delay(worker.failures)
+        logger.info("Restarting worker %d in %.1fs", index, delay)
+        worker.restart_at = now + delay
+        if not delay:
+            self._restart_worker(index)
+
+    def _restart_worker(self, index: int) -> None:
+        self.stats[index].restarts += 1
+        self._start_worker(index)
+
+    def log_stats(self) -> None:
+        for index, worker in self.stats.items():
+            logger.info(
+                "Worker %d pid=%s restarts=%d failures=%d stats=%s",
+                index,
+                worker.pid,
+                worker.restarts,
+                worker.failures,
+                worker.stats,
+            )
+
+    def run(self) -> None:
+        """Supervise the workers until interrupted."""
+        self.start()
+        last_log = time.time()
+        try:
+            while self._running:
+                time.sleep(1.0)
+                self.check_workers()
+                if time.time() - last_log >= self.report_interval:
+                    self.log_stats()
+                    last_log = time.time()
+        finally:
+            self.stop()
+
+    def interrupt(self) -> None:
+        """Ask run() to stop the workers and return."""
+        self._running = False
+
+    def stop(self) -> None:
+        self._running = False
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes.values():
+            process.join()
+        logger.info("All workers stopped")
+
+
+def run_supervisor(workers: int, host: str = "0.0.0.0", port: int = 8989) -> None:
+    configure_logging()
+    supervisor = Supervisor(workers, host=host, port=port)
+    signal.signal(signal.SIGTERM, lambda *_: supervisor.interrupt())
+    supervisor.run()
@@ -1,4 +1,5 @@
-from collections.abc import AsyncGenerator, Generator
+import os
+from collections.abc import AsyncGenerator, Generator, Mapping
 
 import pytest
 from dependency_injector import providers
@@ -7,8 +8,26 @@ from mongomock_motor import (  # type: ignore
 )
 
 from server.di import Container
+from server.event_loop import LoopFactory, loop_factories, select_loop
 
 TEST_PEER_ID = "127.0.0.1:89899"
+# Kept apart from SERVER_EVENT_LOOP, which the server only accepts loop names in
+TEST_LOOPS_ENV_VAR = "TEST_EVENT_LOOPS"
+
+
+def pytest_asyncio_loop_factories(
+    config: pytest.Config, item: pytest.Item
+) -> Mapping[str, LoopFactory]:
+    """Event loops async tests run on.
+
+    TEST_EVENT_LOOPS names one, or "all" to run every test on each available
+    loop. Without it, the loop is picked like the server does.
+    """
+    loops = os.environ.get(TEST_LOOPS_ENV_VAR)
+    if loops == "all":
+        return loop_factories()
+    name, factory = select_loop(loops)
+    return {name: factory}
 
 
 @pytest.fixture
@@ -0,0 +1,93 @@
+import asyncio
+from typing import Any
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from server.batcher import InsertBatcher
+from server.di import Container
+
+
+@pytest.mark.asyncio
+async def test_concurrent_inserts_share_a_batch(container: Container) -> None:
+    collection = container.db().notifications
+    batcher = InsertBatcher(collection, max_docs=500, max_delay=0.01)
+
+    await asyncio.gather(*(batcher.insert([{"n": i}, {"n": -i}]) for i in range(1, 11)))
+    await batcher.flush()
+
+    assert await collection.count_documents({}) == 20
+    assert batcher.batches == 1
+    assert batcher.max_batch == 20
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_written_without_waiting(container: Container) -> None:
+    collection = container.db().notifications
+    batcher = InsertBatcher(collection, max_docs=3, max_delay=60)
+
+    await batcher.insert([{"n": i} for i in range(3)])
+    assert batcher.stats()["pending"] == 0
+    await asyncio.wait_for(batcher.flush(), 1)
+
+    assert batcher.batches == 1
+    assert await collection.count_documents({}) == 3
+
+
+@pytest.mark.asyncio
+async def test_retried_insert_is_not_a_failure(container: Container) -> None:
+    collection = container.db().notifications
+    batcher = InsertBatcher(collection, max_docs=500, max_delay=0)
+    docs = [{"n": 1}, {"n": 2}]
+
+    await batcher.insert(docs)
+    await batcher.flush()
+    await batcher.insert(docs)  # same _ids, already written
+    await batcher.flush()
+
+    assert await collection.count_documents({}) == 2
+    assert batcher.failed == 0
+
+
+@pytest.mark.asyncio
+async def test_insert_returns_before_the_write(container: Container) -> None:
+    collection = container.db().notifications
+    batcher = InsertBatcher(collection, max_docs=500, max_delay=60)
+
+    await batcher.insert([{"n": 1}])
+    assert await collection.count_documents({}) == 0
+    await batcher.flush()
+
+    assert await collection.count_documents({}) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_writes_are_retried(
+    container: Container, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    collection = container.db().notifications
+    batcher = InsertBatcher(collection, max_docs=500, max_delay=0, max_retries=2)
+    batcher.retry_delay = 0
+    insert_many = collection.insert_many
+    failures = 2
+
+    async def insert_many_failing(*args: Any, **kwargs: Any) -> Any:
+        nonlocal failures
+        if failures:
+            failures -= 1
+            raise AutoReconnect("connection lost")
+        return await insert_many(*args, **kwargs)
+
+    monkeypatch.setattr(collection, "insert_many", insert_many_failing)
+    await batcher.insert([{"n": 1}, {"n": 2}])
+    await batcher.flush()
+    assert await collection.count_documents({}) == 2
+    assert batcher.retries == 2
+    assert batcher.failed == 0
+
+    # Past max_retries the documents are given up on
+    failures = 3
+    await batcher.insert([{"n": 3}])
+    await batcher.flush()
+    assert await collection.count_documents({}) == 2
+    assert batcher.failed == 1
@@ -0,0 +1,46 @@
+import time
+
+from server.cache import LRUCache
+
+
+def test_lru_eviction() -> None:
+    evicted: list[str] = []
+    cache: LRUCache[str, int] = LRUCache(2, on_evict=lambda k, v: evicted.append(k))
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert evicted == ["b"]
+    assert cache.stats() == {
+        "entries": 2,
+        "hits": 3,
+        "misses": 1,
+        "evictions": 1,
+        "invalidations": 0,
+    }
+
+
+def test_ttl_expiry() -> None:
+    cache: LRUCache[str, int] = LRUCache(10, ttl=0.01)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_invalidate_and_disabled_cache() -> None:
+    cache: LRUCache[str, int] = LRUCache(10)
+    cache.put("a", 1)
+    cache.invalidate("a")
+    cache.invalidate("missing")
+    assert cache.get("a") is None
+    assert cache.invalidations == 1
+
+    disabled: LRUCache[str, int] = LRUCache(0)
+    disabled.put("a", 1)
+    assert disabled.get("a") is None
@@ -7,7 +7,7 @@ from tests.conftest import TEST_PEER_ID
 
 def test_parse_actions(container: Container) -> None:
     # Test SIGN_IN action
-    assert vars(CommandContext.from_line(container, "ougmcim|SIGN_IN|janedoe")) == vars(
+    assert CommandContext.from_line(container, "ougmcim|SIGN_IN|janedoe") == (
         CommandContext(
             container=container,
             request_id="ougmcim",
@@ -17,31 +17,31 @@ def test_parse_actions(container: Container) -> None:
     )
 
     # Test SIGN_IN action
-    assert vars(CommandContext.from_line(container, "ougmcim|SIGN_IN|janedoe")) == vars(
+    assert CommandContext.from_line(container, "ougmcim|SIGN_IN|janedoe") == (
         CommandContext(
             container, request_id="ougmcim", action="SIGN_IN", params=["janedoe"]
         )
     )
 
-    assert vars(CommandContext.from_line(container, "iwhygsi|WHOAMI")) == vars(
+    assert CommandContext.from_line(container, "iwhygsi|WHOAMI") == (
         CommandContext(container, request_id="iwhygsi", action="WHOAMI")
     )
 
-    assert vars(CommandContext.from_line(container, "cadlsdo|SIGN_OUT")) == vars(
+    assert CommandContext.from_line(container, "cadlsdo|SIGN_OUT") == (
         CommandContext(container, request_id="cadlsdo", action="SIGN_OUT")
     )
 
-    assert vars(CommandContext.from_line(container, "cadlsdo|SIGN_OUT")) == vars(
+    assert CommandContext.from_line(container, "cadlsdo|SIGN_OUT") == (
         CommandContext(container, request_id="cadlsdo", action="SIGN_OUT")
     )
 
-    assert vars(
+    assert (
         CommandContext.from_line(
             container,
             'ykkngzx|CREATE_DISCUSSION|iofetzv.0s|Hey, folks. What do you think of my video? Does it have enough "polish"?',
             TEST_PEER_ID,
         )
-    ) == vars(
+    ) == (
         CommandContext(
             container,
             request_id="ykkngzx",
@@ -54,13 +54,13 @@ def test_parse_actions(container: Container) -> None:
         )
     )
 
-    assert vars(
+    assert (
         CommandContext.from_line(
             container,
             "sqahhfj|CREATE_REPLY|iztybsd|I think it's great!",
             TEST_PEER_ID,
         )
-    ) == vars(
+    ) == (
         CommandContext(
             container,
             request_id="sqahhfj",
@@ -70,25 +70,21 @@ def test_parse_actions(container: Container) -> None:
         )
     )
 
-    assert vars(
-        CommandContext.from_line(container, "xthbsuv|GET_DISCUSSION|iztybsd")
-    ) == vars(
+    assert CommandContext.from_line(container, "xthbsuv|GET_DISCUSSION|iztybsd") == (
         CommandContext(
             container, request_id="xthbsuv", action="GET_DISCUSSION", params=["iztybsd"]
         )
     )
 
-    assert vars(
-        CommandContext.from_line(container, "xthbsuv|LIST_DISCUSSIONS")
-    ) == vars(
+    assert CommandContext.from_line(container, "xthbsuv|LIST_DISCUSSIONS") == (
         CommandContext(
             container, request_id="xthbsuv", action="LIST_DISCUSSIONS", params=[]
         )
     )
 
-    assert vars(
+    assert (
         CommandContext.from_line(container, "xthbsuv|LIST_DISCUSSIONS|refprefix")
-    ) == vars(
+    ) == (
         CommandContext(
             container,
             request_id="xthbsuv",
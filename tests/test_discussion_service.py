@@ -1,3 +1,7 @@
+import asyncio
+from datetime import datetime
+from typing import Any
+
 import pytest
 
 from server.di import Container
@@ -71,3 +75,350 @@ async def test_get_discussion(container: Container) -> None:
     assert discussion.time_marker == "30s"
     assert discussion.client_id == "user1"
     assert discussion.replies[0].comment == "test comment 3"
+
+
+@pytest.mark.asyncio
+async def test_list_discussions_page(container: Container) -> None:
+    discussion_service = container.discussion_service()
+    created = [
+        await discussion_service.create_discussion(f"page.{i}s", "Comment", "user1")
+        for i in range(7)
+    ]
+
+    listed: list[str] = []
+    cursor = None
+    pages = 0
+    while True:
+        entries, cursor = await discussion_service.list_discussion_entries(
+            limit=3, cursor=cursor
+        )
+        listed.extend(entry.split("|")[0] for entry in entries)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 3
+    # Every discussion exactly once, even those created in the same millisecond
+    assert len(listed) == len(created)
+    assert set(listed) == set(created)
+
+
+@pytest.mark.asyncio
+async def test_list_discussions_page_rejects_invalid_cursor(
+    container: Container,
+) -> None:
+    discussion_service = container.discussion_service()
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        await discussion_service.list_discussion_entries(limit=3, cursor="garbage")
+
+
+@pytest.mark.asyncio
+async def test_get_discussion_reply_window(container: Container) -> None:
+    discussion_service = container.discussion_service()
+    discussion_id = await discussion_service.create_discussion(
+        "ref.30s", "comment 0", "user1"
+    )
+    for i in range(1, 10):
+        await discussion_service.create_reply(discussion_id, f"comment {i}", "user2")
+
+    discussion = await discussion_service.get_discussion(
+        discussion_id, offset=3, limit=4
+    )
+    assert [reply.comment for reply in discussion.replies] == [
+        f"comment {i}" for i in range(3, 7)
+    ]
+    assert discussion.reply_count == 10
+
+    discussion = await discussion_service.get_discussion(discussion_id)
+    assert len(discussion.replies) == 10
+    assert discussion.reply_count == 10
+
+    # The participant list is left in the database
+    repository = container.mongo_discussions()
+    for limit in [None, 4]:
+        discussion_doc = await repository.get(discussion_id, 3, limit)
+        assert discussion_doc is not None
+        assert "participants" not in discussion_doc
+        assert "_id" in discussion_doc
+
+
+@pytest.mark.asyncio
+async def test_get_discussion_is_cached(container: Container) -> None:
+    discussion_service = container.discussion_service()
+    discussion_id = await discussion_service.create_discussion(
+        "ref.30s", "comment 0", "user1"
+    )
+
+    await discussion_service.get_discussion(discussion_id)
+    await discussion_service.get_discussion(discussion_id)
+    window = await discussion_service.get_discussion(discussion_id, limit=1)
+    assert len(window.replies) == 1
+    assert discussion_service.cache.hits == 2
+    assert discussion_service.cache.misses == 1
+
+    # Local replies evict the cached copy right away
+    await discussion_service.create_reply(discussion_id, "comment 1", "user2")
+    discussion = await discussion_service.get_discussion(discussion_id)
+    assert len(discussion.replies) == 2
+
+
+@pytest.mark.asyncio
+async def test_discussion_change_events_invalidate_cache(
+    container: Container,
+) -> None:
+    discussion_service = container.discussion_service()
+    discussion_id = await discussion_service.create_discussion(
+        "ref.30s", "comment 0", "user1"
+    )
+    await discussion_service.get_discussion(discussion_id)
+
+    # Another node appends a reply
+    discussions = container.db().discussions
+    discussion_doc = await discussions.find_one({"discussion_id": discussion_id})
+    assert discussion_doc is not None
+    await discussions.update_one(
+        {"_id": discussion_doc["_id"]},
+        {"$push": {"replies": {**discussion_doc["replies"][0], "comment": "remote"}}},
+    )
+    discussion_service._handle_discussion_change(
+        {"operationType": "update", "documentKey": {"_id": discussion_doc["_id"]}}
+    )
+
+    discussion = await discussion_service.get_discussion(discussion_id)
+    assert [reply.comment for reply in discussion.replies] == ["comment 0", "remote"]
+    assert discussion_service.cache.invalidations == 1
+
+
+@pytest.mark.asyncio
+async def test_remote_change_during_uncached_read_is_not_cached(
+    container: Container, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    discussion_service = container.discussion_service()
+    discussion_id = await discussion_service.create_discussion(
+        "ref.30s", "comment 0", "user1"
+    )
+    repository = discussion_service.repository
+    get = repository.get
+    read, resume = asyncio.Event(), asyncio.Event()
+
+    async def slow_get(*args: Any) -> dict[str, Any] | None:
+        discussion_doc = await get(*args)
+        read.set()
+        await resume.wait()
+        return discussion_doc
+
+    monkeypatch.setattr(repository, "get", slow_get)
+    reading = asyncio.create_task(discussion_service.get_discussion(discussion_id))
+    await read.wait()
+
+    # Another node appends a reply after the read, before it is cached
+    discussions = container.db().discussions
+    discussion_doc = await discussions.find_one({"discussion_id": discussion_id})
+    assert discussion_doc is not None
+    await discussions.update_one(
+        {"_id": discussion_doc["_id"]},
+        {"$push": {"replies": {**discussion_doc["replies"][0], "comment": "remote"}}},
+    )
+    discussion_service._handle_discussion_change(
+        {"operationType": "update", "documentKey": {"_id": discussion_doc["_id"]}}
+    )
+    resume.set()
+    await reading
+
+    discussion = await discussion_service.get_discussion(discussion_id)
+    assert [reply.comment for reply in discussion.replies] == ["comment 0", "remote"]
+
+
+@pytest.mark.asyncio
+async def test_create_reply_maintains_participants(container: Container) -> None:
+    discussion_service = container.discussion_service()
+    discussion_id = await discussion_service.create_discussion(
+        "ref.30s", "comment", "user1"
+    )
+    for client_id in ["user2", "user1", "user2", "user3"]:
+        await discussion_service.create_reply(discussion_id, "reply", client_id)
+
+    discussion_doc = await container.db().discussions.find_one(
+        {"discussion_id": discussion_id}
+    )
+    assert discussion_doc is not None
+    assert discussion_doc["participants"] == ["user1", "user2", "user3"]
+
+    with pytest.raises(ValueError, match="not found"):
+        await discussion_service.create_reply("missing", "reply", "user1")
+
+
+@pytest.mark.asyncio
+async def test_create_reply_without_stored_participants(container: Container) -> None:
+    # As written by nodes predating the participants field
+    await container.db().discussions.insert_one(
+        {
+            "discussion_id": "legacy1",
+            "reference_prefix": "ref",
+            "time_marker": "30s",
+            "client_id": "user1",
+            "created_at": datetime.now(),
+            "replies": [
+                {"client_id": "user1", "comment": "old", "created_at": datetime.now()}
+            ],
+        }
+    )
+    discussion_service = container.discussion_service()
+
+    await discussion_service.create_reply("legacy1", "reply", "user2")
+
+    discussion = await discussion_service.get_discussion("legacy1")
+    assert [reply.comment for reply in discussion.replies] == ["old", "reply"]
+    discussion_doc = await container.db().discussions.find_one(
+        {"discussion_id": "legacy1"}
+    )
+    assert discussion_doc is not None
+    assert discussion_doc["participants"] == ["user2"]
+
+
+@pytest.fixture
+def bucketed_container(container: Container) -> Container:
+    container.config.from_dict(
+        {
+            "reply_storage": "bucketed",
+            "reply_bucket_size": 3,
+            "discussion_cache_size": 0,
+        }
+    )
+    return container
+
+
+@pytest.mark.asyncio
+async def test_bucketed_replies(bucketed_container: Container) -> None:
+    discussion_service = bucketed_container.discussion_service()
+    discussion_id = await discussion_service.create_discussion(
+        "ref.30s", "comment 0", "user1"
+    )
+    for i in range(1, 8):
+        await discussion_service.create_reply(discussion_id, f"comment {i}", "user2")
+
+    db = bucketed_container.db()
+    discussion_doc = await db.discussions.find_one({"discussion_id": discussion_id})
+    assert discussion_doc is not None
+    assert len(discussion_doc["replies"]) == 1
+    assert await db.reply_buckets.count_documents({}) == 3
+
+    discussion = await discussion_service.get_discussion(discussion_id)
+    assert [reply.comment for reply in discussion.replies] == [
+        f"comment {i}" for i in range(8)
+    ]
+    assert discussion.reply_count == 8
+
+    window = await discussion_service.get_discussion(discussion_id, offset=0, limit=2)
+    assert [reply.comment for reply in window.replies] == ["comment 0", "comment 1"]
+    window = await discussion_service.get_discussion(discussion_id, offset=2, limit=5)
+    assert [reply.comment for reply in window.replies] == [
+        f"comment {i}" for i in range(2, 7)
+    ]
+
+    replies = ",".join(
+        [
+            "user1|comment 0",
+            *(f"user2|comment {i}" for i in range(1, 8)),
+        ]
+    )
+    [listed] = await discussion_service.list_discussions()
+    assert len(listed.replies) == 8
+    entries, _ = await discussion_service.list_discussion_entries()
+    assert entries == [f"{discussion_id}|ref.30s|({replies})"]
+    page, _ = await discussion_service.list_discussion_entries(limit=1)
+    assert page == entries
+
+
+@pytest.mark.asyncio
+async def test_bucketed_reply_is_stored_before_last_discussion_write(
+    bucketed_container: Container, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    discussion_service = bucketed_container.discussion_service()
+    discussion_id = await discussion_service.create_discussion(
+        "ref.30s", "comment 0", "user1"
+    )
+    db = bucketed_container.db()
+    repository = bucketed_container.mongo_discussions()
+    # Change events of these writes invalidate the caches of other nodes
+    buckets_seen: list[int] = []
+    find_one_and_update = repository.discussions.find_one_and_update
+    update_one = repository.discussions.update_one
+
+    async def counting_find_one_and_update(*args: Any, **kwargs: Any) -> Any:
+        buckets_seen.append(await db.reply_buckets.count_documents({}))
+        return await find_one_and_update(*args, **kwargs)
+
+    async def counting_update_one(*args: Any, **kwargs: Any) -> Any:
+        buckets_seen.append(await db.reply_buckets.count_documents({}))
+        return await update_one(*args, **kwargs)
+
+    monkeypatch.setattr(
+        repository.discussions, "find_one_and_update", counting_find_one_and_update
+    )
+    monkeypatch.setattr(repository.discussions, "update_one", counting_update_one)
+
+    await discussion_service.create_reply(discussion_id, "comment 1", "user2")
+
+    # The last discussion write happens once the bucket holds the reply
+    assert buckets_seen == [0, 1]
+    discussion_doc = await db.discussions.find_one({"discussion_id": discussion_id})
+    assert discussion_doc is not None
+    assert discussion_doc["bucketed_replies"] == 1
+
+
+@pytest.mark.asyncio
+async def test_bucketed_discussions_stay_bucketed(container: Container) -> None:
+    discussion_service = container.discussion_service()
+    discussion_id = await discussion_service.create_discussion(
+        "ref.30s", "comment 0", "user1"
+    )
+    repository = container.mongo_discussions()
+    repository.reply_storage = "bucketed"
+    await discussion_service.create_reply(discussion_id, "comment 1", "user2")
+    repository.reply_storage = "embedded"
+    await discussion_service.create_reply(discussion_id, "comment 2", "user3")
+
+    discussion = await discussion_service.get_discussion(discussion_id)
+    assert [reply.comment for reply in discussion.replies] == [
+        "comment 0",
+        "comment 1",
+        "comment 2",
+    ]
+    assert await container.db().reply_buckets.count_documents({}) == 1
+
+
+@pytest.mark.asyncio
+async def test_list_discussion_entries(bucketed_container: Container) -> None:
+    discussion_service = bucketed_container.discussion_service()
+    first = await discussion_service.create_discussion("ref.30s", "hello", "user1")
+    for i in range(4):
+        await discussion_service.create_reply(first, f"reply {i}", "user2")
+    second = await discussion_service.create_discussion("ref.1m5s", "a, b", "user3")
+    # Distinct creation times: mongomock keeps milliseconds only, so both could
+    # otherwise share one and be paged by discussion_id
+    discussions = bucketed_container.db().discussions
+    for minute, discussion_id in enumerate([first, second]):
+        await discussions.update_one(
+            {"discussion_id": discussion_id},
+            {"$set": {"created_at": datetime(2024, 1, 1, 12, minute)}},
+        )
+
+    entries, next_cursor = await discussion_service.list_discussion_entries("ref")
+    replies = ",".join(f"user2|reply {i}" for i in range(4))
+    assert sorted(entries) == sorted(
+        [
+            f"{first}|ref.30s|(user1|hello,{replies})",
+            f'{second}|ref.1m5s|(user3|"a, b")',
+        ]
+    )
+    assert next_cursor is None
+
+    # One page at a time, in creation order
+    entries, next_cursor = await discussion_service.list_discussion_entries(limit=1)
+    assert entries == [f"{first}|ref.30s|(user1|hello,{replies})"]
+    entries, next_cursor = await discussion_service.list_discussion_entries(
+        limit=1, cursor=next_cursor
+    )
+    assert entries == [f'{second}|ref.1m5s|(user3|"a, b")']
+    assert next_cursor is None
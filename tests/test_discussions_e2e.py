@@ -240,3 +240,135 @@ async def test_list_discussion_executes(container: Container) -> None:
     await ListDiscussionsCommand(
         CommandContext(container, "abcdefg", [], TEST_PEER_ID),
     ).execute()
+
+
+async def test_list_discussion_paginates(container: Container) -> None:
+    for _ in range(3):
+        await CreateDiscussionCommand(
+            CommandContext(container, "abcdefg", ["ref.30s", "comment"], TEST_PEER_ID)
+        ).execute()
+
+    first = await ListDiscussionsCommand(
+        CommandContext(container, "abcdefg", ["limit=2"], TEST_PEER_ID),
+    ).execute()
+    discussions, cursor = first.rstrip("\n").rsplit("|", 1)
+    assert discussions.count("ref.30s") == 2
+
+    second = await ListDiscussionsCommand(
+        CommandContext(
+            container, "abcdefg", ["limit=2", f"cursor={cursor}"], TEST_PEER_ID
+        ),
+    ).execute()
+    assert second.count("ref.30s") == 1
+    assert second.endswith(")\n")
+
+
+async def test_list_discussion_validates_options(container: Container) -> None:
+    for params in [["limit=0"], ["limit=abc"], ["limit=1001"], ["sort=asc"]]:
+        with pytest.raises(ValueError):
+            await ListDiscussionsCommand(
+                CommandContext(container, "abcdefg", params, TEST_PEER_ID),
+            ).execute()
+
+    with pytest.raises(ValueError, match="more than one parameter"):
+        await ListDiscussionsCommand(
+            CommandContext(container, "abcdefg", ["ref1", "ref2"], TEST_PEER_ID),
+        ).execute()
+
+
+async def test_list_discussion_filters_by_reference_prefix(
+    container: Container,
+) -> None:
+    for reference in ["video1.30s", "video1.45s", "video2.10s"]:
+        await CreateDiscussionCommand(
+            CommandContext(container, "abcdefg", [reference, "comment"], TEST_PEER_ID)
+        ).execute()
+
+    listed = await ListDiscussionsCommand(
+        CommandContext(container, "abcdefg", ["video1"], TEST_PEER_ID),
+    ).execute()
+    assert listed.count("video1.") == 2
+    assert "video2." not in listed
+
+    paged = await ListDiscussionsCommand(
+        CommandContext(container, "abcdefg", ["video2", "limit=5"], TEST_PEER_ID),
+    ).execute()
+    assert paged.count("video2.") == 1
+    assert "video1." not in paged
+
+
+async def test_get_discussion_reply_window(
+    container: Container, client_id: str
+) -> None:
+    created = CreateDiscussionCommand(
+        CommandContext(container, "abcdefg", ["ref.30s", "first"], TEST_PEER_ID),
+    )
+    created_discussion_id = (await created.execute()).strip("\n").split("|")[1]
+    for comment in ["second", "third"]:
+        await CreateReplyCommand(
+            CommandContext(
+                container, "abcdefg", [created_discussion_id, comment], TEST_PEER_ID
+            ),
+        ).execute()
+
+    returned_discussion = await GetDiscussionCommand(
+        CommandContext(
+            container,
+            "abcdefg",
+            [created_discussion_id, "offset=1", "limit=1"],
+            TEST_PEER_ID,
+        ),
+    ).execute()
+    assert (
+        returned_discussion
+        == f"abcdefg|{created_discussion_id}|ref.30s|({client_id}|second)|3\n"
+    )
+
+    # Options may come before the discussion id
+    returned_discussion = await GetDiscussionCommand(
+        CommandContext.from_line(
+            container,
+            f"abcdefg|GET_DISCUSSION|limit=5|{created_discussion_id}",
+            TEST_PEER_ID,
+        ),
+    ).execute()
+    assert returned_discussion == (
+        f"abcdefg|{created_discussion_id}|ref.30s"
+        f"|({client_id}|first,{client_id}|second,{client_id}|third)|3\n"
+    )
+
+    for params in [["offset=-1"], ["limit=0"], ["limit=x"], ["after=1"]]:
+        with pytest.raises(ValueError):
+            await GetDiscussionCommand(
+                CommandContext(
+                    container, "abcdefg", [created_discussion_id, *params], TEST_PEER_ID
+                ),
+            ).execute()
+
+
+async def test_list_discussion_reuses_serialized_response(
+    container: Container, client_id: str
+) -> None:
+    created = CreateDiscussionCommand(
+        CommandContext(container, "abcdefg", ["ref.30s", "first"], TEST_PEER_ID),
+    )
+    created_discussion_id = (await created.execute()).strip("\n").split("|")[1]
+
+    first = await ListDiscussionsCommand(
+        CommandContext(container, "abcdefg", [], TEST_PEER_ID),
+    ).execute()
+    second = await ListDiscussionsCommand(
+        CommandContext(container, "bcdefgh", [], TEST_PEER_ID),
+    ).execute()
+    assert second == "bcdefgh" + first[len("abcdefg") :]
+    assert container.list_response_cache().hits == 1
+
+    await CreateReplyCommand(
+        CommandContext(
+            container, "abcdefg", [created_discussion_id, "second"], TEST_PEER_ID
+        ),
+    ).execute()
+    third = await ListDiscussionsCommand(
+        CommandContext(container, "cdefghi", [], TEST_PEER_ID),
+    ).execute()
+    assert f"({client_id}|first,{client_id}|second)" in third
@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+from server import event_loop
+
+
+def test_auto_prefers_uvloop_when_installed() -> None:
+    name, _ = event_loop.select_loop("auto")
+    assert name == ("uvloop" if "uvloop" in event_loop.loop_factories() else "asyncio")
+    assert event_loop.run(_loop_name(), name) == name
+
+
+def test_missing_uvloop_falls_back_to_asyncio(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(event_loop, "_import_uvloop", lambda: None)
+
+    assert event_loop.select_loop("uvloop")[0] == "asyncio"
+    assert event_loop.select_loop("auto")[0] == "asyncio"
+
+
+def test_loop_from_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(event_loop.ENV_VAR, "asyncio")
+    assert event_loop.select_loop()[0] == "asyncio"
+
+    monkeypatch.setenv(event_loop.ENV_VAR, "trio")
+    with pytest.raises(ValueError):
+        event_loop.select_loop()
+
+
+async def _loop_name() -> str:
+    await asyncio.sleep(0)
+    return event_loop.running_loop_name()
@@ -0,0 +1,62 @@
+import pytest
+
+from server.commands.command_context import CommandContext
+from server.commands.discussion_commands import CreateReplyCommand
+from server.commands.line_parser import LineParser
+from server.di import Container
+from tests.conftest import TEST_PEER_ID
+
+LINES = [
+    "ougmcim|SIGN_IN|janedoe\n",
+    "iwhygsi|WHOAMI\r\n",
+    "sqahhfj|CREATE_REPLY|iztybsd|I think it's great!\n",
+    "xthbsuv|LIST_DISCUSSIONS|refprefix|limit=5\n",
+    "xthbsuv|GET_DISCUSSION|iztybsd||\n",
+]
+
+
+@pytest.mark.parametrize("line", LINES)
+def test_parse_matches_from_line(container: Container, line: str) -> None:
+    command = LineParser(container).parse(line.encode(), TEST_PEER_ID)
+
+    assert command.context == CommandContext.from_line(container, line, TEST_PEER_ID)
+
+
+def test_parse_dispatches_with_shared_services(container: Container) -> None:
+    parser = LineParser(container)
+    first = parser.parse(b"sqahhfj|CREATE_REPLY|iztybsd|hi\n")
+    second = parser.parse(b"sqahhfj|CREATE_REPLY|iztybsd|hi\n")
+
+    assert isinstance(first, CreateReplyCommand)
+    assert first.services is second.services is parser.services
+    assert parser.services.discussion_service is container.discussion_service()
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        b"abc|SIGN_IN|janedoe\n",
+        b"abc123d|SIGN_IN|janedoe\n",
+        b"ABCDEFG|SIGN_IN|janedoe\n",
+        b"abcdefg\n",
+        b"abcdefg|INVALID\n",
+        b"abcdefg|SIGN_IN|\xff\n",
+    ],
+)
+def test_parse_failures(container: Container, line: bytes) -> None:
+    with pytest.raises(ValueError):
+        LineParser(container).parse(line)
+
+
+def test_changes_session(container: Container) -> None:
+    parser = LineParser(container)
+
+    assert parser.changes_session(b"ougmcim|SIGN_IN|janedoe\n")
+    assert parser.changes_session(b"ougmcim|SIGN_OUT\r\n")
+    assert not parser.changes_session(b"iwhygsi|WHOAMI\n")
+    assert not parser.changes_session(b"garbage\n")
+
+    # Lines are split as parse splits them, empty fields included
+    for line in [b"ougmcim||SIGN_IN|janedoe\n", b"|ougmcim|SIGN_OUT\n"]:
+        assert parser.changes_session(line)
+        assert parser.parse(line).changes_session
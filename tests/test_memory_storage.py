@@ -0,0 +1,196 @@
+import asyncio
+
+import pytest
+
+from server.di import Container
+from server.entities.notification import NotificationType
+
+
+@pytest.fixture
+def memory_container(container: Container) -> Container:
+    container.config.from_dict({"storage": "memory", "discussion_cache_size": 0})
+    return container
+
+
+@pytest.mark.asyncio
+async def test_discussions(memory_container: Container) -> None:
+    discussion_service = memory_container.discussion_service()
+    discussion_id = await discussion_service.create_discussion(
+        "ref.30s", "comment 0", "user1"
+    )
+    for i in range(1, 5):
+        await discussion_service.create_reply(discussion_id, f"comment {i}", "user2")
+
+    discussion = await discussion_service.get_discussion(discussion_id)
+    assert [reply.comment for reply in discussion.replies] == [
+        f"comment {i}" for i in range(5)
+    ]
+    assert discussion.reply_count == 5
+    window = await discussion_service.get_discussion(discussion_id, offset=1, limit=2)
+    assert [reply.comment for reply in window.replies] == ["comment 1", "comment 2"]
+    assert window.reply_count == 5
+
+    repository = memory_container.discussion_repository()
+    assert await repository.participants(discussion_id) == ["user1", "user2"]
+    with pytest.raises(ValueError, match="not found"):
+        await discussion_service.create_reply("missing", "reply", "user1")
+    with pytest.raises(ValueError, match="not found"):
+        await discussion_service.get_discussion("missing")
+
+
+@pytest.mark.asyncio
+async def test_discussions_are_copied(memory_container: Container) -> None:
+    discussion_service = memory_container.discussion_service()
+    discussion_id = await discussion_service.create_discussion(
+        "ref.30s", "comment 0", "user1"
+    )
+    repository = memory_container.discussion_repository()
+    discussion_doc = await repository.get(discussion_id)
+    assert discussion_doc is not None
+
+    await discussion_service.create_reply(discussion_id, "comment 1", "user2")
+    assert len(discussion_doc["replies"]) == 1
+    assert discussion_doc["participants"] == ["user1"]
+
+    discussion_doc["replies"].clear()
+    discussion_doc["participants"].append("user3")
+    stored = await repository.get(discussion_id)
+    assert stored is not None
+    assert [reply["comment"] for reply in stored["replies"]] == [
+        "comment 0",
+        "comment 1",
+    ]
+    assert stored["participants"] == ["user1", "user2"]
+
+
+@pytest.mark.asyncio
+async def test_list_pages(memory_container: Container) -> None:
+    discussion_service = memory_container.discussion_service()
+    created = {
+        await discussion_service.create_discussion(f"{prefix}.{i}s", "hi", "user1")
+        for i in range(5)
+        for prefix in ["ref", "other"]
+    }
+
+    listed: list[str] = []
+    cursor = None
+    while True:
+        entries, cursor = await discussion_service.list_discussion_entries(
+            limit=3, cursor=cursor
+        )
+        assert len(entries) <= 3
+        listed.extend(entry.split("|")[0] for entry in entries)
+        if cursor is None:
+            break
+
+    assert len(listed) == 10
+    assert set(listed) == created
+
+    ref = await discussion_service.list_discussions("ref")
+    assert {d.reference_prefix for d in ref} == {"ref"}
+    ref_entries, _ = await discussion_service.list_discussion_entries("ref")
+    assert len(ref_entries) == 5
+    for entry in ref_entries:
+        discussion = await discussion_service.get_discussion(entry.split("|")[0])
+        assert entry == (
+            f"{discussion.discussion_id}|ref.{discussion.time_marker}|(user1|hi)"
+        )
+
+
+@pytest.mark.asyncio
+async def test_notifications(memory_container: Container) -> None:
+    discussion_service = memory_container.discussion_service()
+    notification_service = memory_container.notification_service()
+    discussion_id = await discussion_service.create_discussion(
+        "ref.30s", "hi @user3", "user1"
+    )
+    await discussion_service.create_reply(discussion_id, "hello", "user2")
+    await discussion_service.notification_scheduler.join()
+
+    [mention] = await notification_service.get_notifications("user3")
+    assert mention.notification_type == NotificationType.MENTION
+    [reply] = await notification_service.get_notifications("user1")
+    assert reply.notification_type == NotificationType.REPLY
+    assert reply.sender_id == "user2"
+
+    await notification_service.mark_as_read("user1", discussion_id)
+    assert await notification_service.get_notifications("user1") == []
+    # Nothing reached MongoDB
+    assert await memory_container.db().notifications.count_documents({}) == 0
+
+
+@pytest.mark.asyncio
+async def test_fanned_out_notifications(memory_container: Container) -> None:
+    memory_container.config.from_dict({"notification_fan_out_threshold": 1})
+    discussion_service = memory_container.discussion_service()
+    notification_service = memory_container.notification_service()
+    discussion_id = await discussion_service.create_discussion(
+        "ref.30s", "first", "user1"
+    )
+    await discussion_service.create_reply(discussion_id, "second", "user2")
+    await discussion_service.create_reply(discussion_id, "third", "user3")
+    await discussion_service.notification_scheduler.join()
+
+    # The second reply is one event, resolved against the participants
+    assert len(memory_container.memory_store().events[discussion_id]) == 1
+    assert [
+        n.sender_id for n in await notification_service.get_notifications("user1")
+    ] == ["user3", "user2"]
+    assert len(await notification_service.get_notifications("user2")) == 1
+    assert await notification_service.get_notifications("user3") == []
+
+    await notification_service.mark_as_read("user1", discussion_id)
+    assert await notification_service.get_notifications("user1") == []
+
+
+@pytest.mark.asyncio
+async def test_sessions_recover(memory_container: Container) -> None:
+    memory_container.config.from_dict({"node_id": "node-1"})
+    session_service = memory_container.session_service()
+    await session_service.set("127.0.0.1:8001", "user1")
+    await session_service.flush()
+    assert "127.0.0.1:8001" in memory_container.memory_store().sessions
+
+    await session_service.recover()
+    assert memory_container.memory_store().sessions == {}
+
+
+@pytest.mark.asyncio
+async def test_nodes_sharing_a_store(memory_container: Container) -> None:
+    # A second node of the same deployment, with its own services
+    other = Container()
+    other.config.from_dict({"storage": "memory", "node_id": "other"})
+    other.memory_store.override(memory_container.memory_store())
+    other_notifications = other.notification_service()
+    other_discussions = other.discussion_service()
+
+    delivered: list[tuple[str, str]] = []
+
+    async def send(recipient_id: str, message: str) -> None:
+        delivered.append((recipient_id, message))
+
+    other_notifications.set_send_callback(send)
+    watchers = [
+        asyncio.create_task(other_notifications.watch_notifications()),
+        asyncio.create_task(other_discussions.watch_discussions()),
+    ]
+    await asyncio.sleep(0)
+
+    discussion_service = memory_container.discussion_service()
+    discussion_id = await discussion_service.create_discussion(
+        "ref.30s", "first", "user1"
+    )
+    # Cached by the other node, then replied to on this one
+    await other_discussions.get_discussion(discussion_id)
+    await discussion_service.create_reply(discussion_id, "second", "user2")
+    await discussion_service.notification_scheduler.join()
+    await asyncio.sleep(0.01)
+
+    assert delivered == [("user1", f"DISCUSSION_UPDATED|{discussion_id}\n")]
+    discussion = await other_discussions.get_discussion(discussion_id)
+    assert [reply.comment for reply in discussion.replies] == ["first", "second"]
+    assert other_discussions.cache.invalidations == 1
+
+    for watcher in watchers:
+        watcher.cancel()
+    await asyncio.gather(*watchers, return_exceptions=True)
@@ -1,7 +1,9 @@
 import asyncio
 from collections.abc import AsyncGenerator
+from typing import Any
 
 import pytest
+from pymongo.errors import AutoReconnect
 
 from server.di import Container
 from server.entities.notification import NotificationType
@@ -38,7 +40,7 @@ async def test_reply_notifications(container: Container) -> None:
         discussion_id=discussion_id, comment="First reply", client_id="user2"
     )
     # Wait for notifications to be processed
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
 
     # Check notifications for user1 (should get notification from user2's reply)
     user1_notifications = await notification_service.get_notifications("user1")
@@ -52,7 +54,7 @@ async def test_reply_notifications(container: Container) -> None:
         discussion_id=discussion_id, comment="Second reply", client_id="user3"
     )
 
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
 
     # Check notifications for user1 and user2
     user1_notifications = await notification_service.get_notifications("user1")
@@ -75,7 +77,7 @@ async def test_mention_notifications(container: Container) -> None:
         client_id="user1",
     )
 
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
 
     # Check notifications for mentioned users
     user2_notifications = await notification_service.get_notifications("user2")
@@ -102,7 +104,7 @@ async def test_combined_reply_and_mention_notifications(container: Container) ->
         comment="Hey @user4, what do you think?",
         client_id="user1",
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
 
     # User4 should have a mention notification
     user4_notifications = await notification_service.get_notifications("user4")
@@ -115,7 +117,7 @@ async def test_combined_reply_and_mention_notifications(container: Container) ->
         comment="@user3 might have some insights here too!",
         client_id="user2",
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
 
     # User1 should have a reply notification (from user2)
     user1_notifications = await notification_service.get_notifications("user1")
@@ -140,7 +142,7 @@ async def test_self_mention_and_reply(container: Container) -> None:
         comment="I'm talking to myself @user1 here",
         client_id="user1",
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
 
     # User1 shouldn't have a mention notification
     user1_notifications = await notification_service.get_notifications("user1")
@@ -152,7 +154,7 @@ async def test_self_mention_and_reply(container: Container) -> None:
         comment="Replying to myself",
         client_id="user1",
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
     # User1 still shouldn't have any notifications
     user1_notifications = await notification_service.get_notifications("user1")
     assert len(user1_notifications) == 0
@@ -172,7 +174,7 @@ async def test_mark_notifications_as_read(container: Container) -> None:
         comment="Replying and mentioning @user3",
         client_id="user2",
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
 
     # Verify initial notifications
     user1_notifications = await notification_service.get_notifications("user1")
@@ -206,7 +208,7 @@ async def test_notification_ordering(container: Container) -> None:
     await asyncio.sleep(0.1)
 
     # Add replies with small time gaps
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
     await discussion_service.create_reply(
         discussion_id=discussion_id,
         comment="First reply mentioning @user2",
@@ -214,14 +216,14 @@ async def test_notification_ordering(container: Container) -> None:
     )
     await asyncio.sleep(0.1)
 
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
     await discussion_service.create_reply(
         discussion_id=discussion_id,
         comment="Second reply mentioning @user2",
         client_id="user4",
     )
 
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
 
     # Get notifications for user2
     notifications = await notification_service.get_notifications("user2")
@@ -245,7 +247,7 @@ async def test_invalid_mentions(container: Container) -> None:
         """,
         client_id="user1",
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
     # Only valid mentions should create notifications
     user2_notifications = await notification_service.get_notifications("user2")
     user3_notifications = await notification_service.get_notifications("user3")
@@ -266,7 +268,7 @@ async def test_duplicate_mentions(container: Container) -> None:
         comment="Hey @user2 @user2 @user2, multiple mentions!",
         client_id="user1",
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
     # Should only create one notification despite multiple mentions
     user2_notifications = await notification_service.get_notifications("user2")
     assert len(user2_notifications) == 1
@@ -280,14 +282,14 @@ async def test_mention_in_reply_to_own_discussion(container: Container) -> None:
     discussion_id = await discussion_service.create_discussion(
         reference="test.33s", comment="Initial discussion", client_id="user1"
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
     # User1 replies to their own discussion mentioning others
     await discussion_service.create_reply(
         discussion_id=discussion_id,
         comment="Mentioning @user2 and @user3 in my own discussion",
         client_id="user1",
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
     # Check notifications
     user1_notifications = await notification_service.get_notifications("user1")
     user2_notifications = await notification_service.get_notifications("user2")
@@ -306,7 +308,7 @@ async def test_performance_many_notifications(container: Container) -> None:
     discussion_id = await discussion_service.create_discussion(
         reference="test.33s", comment="Initial discussion", client_id="user1"
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
     # Add many replies (testing bulk notification creation)
     for i in range(50):
         await discussion_service.create_reply(
@@ -314,7 +316,7 @@ async def test_performance_many_notifications(container: Container) -> None:
             comment=f"Reply {i} mentioning @user2",
             client_id="user3",
         )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
     # Verify notifications were created correctly
     user1_notifications = await notification_service.get_notifications("user1")
     user2_notifications = await notification_service.get_notifications("user2")
@@ -333,14 +335,14 @@ async def test_mark_all_as_read(container: Container) -> None:
         comment="First discussion mentioning @user2",
         client_id="user1",
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
 
     discussion_id2 = await discussion_service.create_discussion(
         reference="test.456",
         comment="Second discussion mentioning @user2",
         client_id="user1",
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
 
     # Mark all notifications as read for user2
     await notification_service.mark_as_read("user2", discussion_id1)
@@ -361,7 +363,7 @@ async def test_notification_after_mark_as_read(container: Container) -> None:
         comment="Initial discussion mentioning @user2",
         client_id="user1",
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
     # Mark as read
     await notification_service.mark_as_read("user2", discussion_id)
 
@@ -371,8 +373,204 @@ async def test_notification_after_mark_as_read(container: Container) -> None:
         comment="New reply mentioning @user2",
         client_id="user3",
     )
-    await asyncio.gather(*discussion_service.notification_tasks)
+    await discussion_service.notification_scheduler.join()
 
     # Verify new notifications are created after mark as read
     user2_notifications = await notification_service.get_notifications("user2")
     assert len(user2_notifications) == 1
+
+
+@pytest.mark.asyncio
+async def test_dispatch_keeps_order_per_recipient(container: Container) -> None:
+    notification_service = container.notification_service()
+    workers = notification_service.delivery_workers
+    # String hashes are salted per process, pick a user on another worker
+    other = next(
+        f"user{i}"
+        for i in range(2, 100)
+        if hash(f"user{i}") % workers != hash("user1") % workers
+    )
+    delivered: list[tuple[str, str]] = []
+    user1_blocked = asyncio.Event()
+
+    async def send(recipient_id: str, message: str) -> None:
+        if recipient_id == "user1":
+            await user1_blocked.wait()
+        delivered.append((recipient_id, message))
+
+    notification_service.set_send_callback(send)
+    notification_service.start_delivery()
+    try:
+        for discussion_id in ["disc1", "disc2", "disc3"]:
+            for recipient_id in ["user1", other]:
+                await notification_service._dispatch(
+                    {"discussion_id": discussion_id, "recipient_id": recipient_id}
+                )
+        await asyncio.sleep(0.01)
+
+        # A stalled recipient does not hold back the others
+        expected = [f"DISCUSSION_UPDATED|disc{i}\n" for i in range(1, 4)]
+        assert delivered == [(other, message) for message in expected]
+
+        user1_blocked.set()
+        await asyncio.sleep(0.01)
+        assert [m for r, m in delivered if r == "user1"] == expected
+    finally:
+        await notification_service.stop_delivery()
+
+
+@pytest.mark.asyncio
+async def test_local_recipients_are_notified_without_change_stream(
+    container: Container,
+) -> None:
+    discussion_service = container.discussion_service()
+    notification_service = container.notification_service()
+    delivered: list[tuple[str, str]] = []
+
+    async def send(recipient_id: str, message: str) -> None:
+        delivered.append((recipient_id, message))
+
+    notification_service.set_send_callback(send)
+    discussion_id = await discussion_service.create_discussion(
+        reference="test.33s", comment="Hey @user2", client_id="user1"
+    )
+    await discussion_service.create_reply(
+        discussion_id=discussion_id, comment="Hi", client_id="user3"
+    )
+    await discussion_service.notification_scheduler.join()
+
+    message = f"DISCUSSION_UPDATED|{discussion_id}\n"
+    assert sorted(delivered) == [("user1", message), ("user2", message)]
+
+    # Persisted copies are tagged so this node's change stream skips them
+    await notification_service.repository.flush()
+    notifications = container.db().notifications
+    assert await notifications.count_documents(
+        {"origin": notification_service.node_id}
+    ) == len(delivered)
+
+
+@pytest.mark.asyncio
+async def test_reply_notifications_share_one_insert(container: Container) -> None:
+    discussion_service = container.discussion_service()
+    notification_service = container.notification_service()
+    discussion_id = await discussion_service.create_discussion(
+        reference="batch.1", comment="first", client_id="user1"
+    )
+    await discussion_service.notification_scheduler.join()
+
+    batcher = container.mongo_notifications().batcher
+    await batcher.flush()
+    batches = batcher.batches
+    await discussion_service.create_reply(discussion_id, "hi @user3", "user2")
+    await discussion_service.notification_scheduler.join()
+    await batcher.flush()
+
+    # The mention of user3 and the reply to user1 are written together
+    assert batcher.batches == batches + 1
+    assert len(await notification_service.get_notifications("user1")) == 1
+    assert len(await notification_service.get_notifications("user3")) == 1
+
+
+@pytest.mark.asyncio
+async def test_reply_storm_fills_notification_batches(container: Container) -> None:
+    container.config.from_dict(
+        {"notification_batch_size": 50, "notification_batch_delay": 60}
+    )
+    discussion_service = container.discussion_service()
+    discussion_id = await discussion_service.create_discussion(
+        reference="storm.1", comment="first", client_id="user1"
+    )
+    await discussion_service.notification_scheduler.join()
+
+    # One notification to user1 per reply, written once 50 are pending
+    for i in range(50):
+        await discussion_service.create_reply(discussion_id, f"reply {i}", "user2")
+    await asyncio.wait_for(discussion_service.notification_scheduler.join(), 5)
+
+    batcher = container.mongo_notifications().batcher
+    assert batcher.batches == 1
+    assert batcher.max_batch == 50
+
+
+@pytest.mark.asyncio
+async def test_large_discussions_fan_out_on_read(container: Container) -> None:
+    container.config.from_dict({"notification_fan_out_threshold": 2})
+    discussion_service = container.discussion_service()
+    notification_service = container.notification_service()
+    delivered: list[str] = []
+
+    async def send(recipient_id: str, message: str) -> None:
+        delivered.append(recipient_id)
+
+    notification_service.set_send_callback(send)
+    notification_service.set_online_users_callback(lambda: {"user1", "user3", "x"})
+    discussion_id = await discussion_service.create_discussion(
+        reference="big.1", comment="first", client_id="user1"
+    )
+    for client_id in ["user2", "user3", "user4"]:
+        await discussion_service.create_reply(discussion_id, "hi", client_id)
+    await discussion_service.notification_scheduler.join()
+    delivered.clear()
+
+    await discussion_service.create_reply(discussion_id, "hi all", "user2")
+    await discussion_service.notification_scheduler.join()
+
+    # One stored event per reply past the threshold, delivered to online
+    # participants only
+    assert sorted(delivered) == ["user1", "user3"]
+    await notification_service.repository.flush()
+    events = container.db().discussion_events
+    assert await events.count_documents({"discussion_id": discussion_id}) == 2
+    assert await container.db().notifications.count_documents({}) == 3
+
+    # Another node resolves the recipients from the participant set
+    delivered.clear()
+    event = await events.find_one({"discussion_id": discussion_id})
+    await notification_service._deliver_event({**event, "sender_id": "user3"})
+    assert delivered == ["user1"]
+
+    # Events are read back against the participant set, up to the last read
+    assert len(await notification_service.get_notifications("user1")) == 4
+    assert len(await notification_service.get_notifications("user4")) == 1
+    await notification_service.mark_as_read("user1", discussion_id)
+    assert await notification_service.get_notifications("user1") == []
+    assert await notification_service.get_notifications("outsider") == []
+
+
+@pytest.mark.asyncio
+async def test_failed_insert_is_retried_without_duplicates(
+    container: Container, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    discussion_service = container.discussion_service()
+    notification_service = container.notification_service()
+    batcher = container.mongo_notifications().batcher
+    batcher.retry_delay = 0
+    delivered: list[str] = []
+
+    async def send(recipient_id: str, message: str) -> None:
+        delivered.append(recipient_id)
+
+    notification_service.set_send_callback(send)
+    collection = batcher.collection
+    insert_many = collection.insert_many
+    failures = [AutoReconnect("connection lost after the write")]
+
+    async def insert_many_failing_once(*args: Any, **kwargs: Any) -> Any:
+        result = await insert_many(*args, **kwargs)
+        if failures:
+            raise failures.pop()
+        return result
+
+    monkeypatch.setattr(collection, "insert_many", insert_many_failing_once)
+    await discussion_service.create_discussion(
+        reference="retry.1", comment="hi @user2", client_id="user1"
+    )
+    await discussion_service.notification_scheduler.join()
+    await batcher.flush()
+
+    assert not failures
+    assert delivered == ["user2"]
+    assert await container.db().notifications.count_documents({}) == 1
+    assert batcher.retries == 1
+    assert batcher.failed == 0
@@ -0,0 +1,181 @@
+import asyncio
+from typing import cast
+from unittest.mock import MagicMock
+
+import pytest
+
+from server.outbound import OutboundQueue, OverflowPolicy
+
+
+class BlockedWriter:
+    """StreamWriter stand-in whose peer never reads until released."""
+
+    def __init__(self) -> None:
+        self.written: list[bytes] = []
+        self.writes = 0
+        self.buffered = 0
+        self.released = asyncio.Event()
+        self.transport = MagicMock()
+        self.transport.is_closing.return_value = False
+        self.transport.get_write_buffer_size.side_effect = lambda: self.buffered
+
+    def writelines(self, data: list[bytes]) -> None:
+        self.writes += 1
+        self.written.extend(data)
+        self.buffered += sum(len(chunk) for chunk in data)
+
+    async def drain(self) -> None:
+        await self.released.wait()
+        self.buffered = 0
+
+
+def make_queue(
+    writer: BlockedWriter, policy: OverflowPolicy, max_size: int = 2
+) -> OutboundQueue:
+    # Anything written and not yet read puts the transport above high water
+    queue = OutboundQueue(
+        cast(asyncio.StreamWriter, writer), max_size, policy, high_water=0
+    )
+    queue.start()
+    return queue
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest() -> None:
+    writer = BlockedWriter()
+    queue = make_queue(writer, OverflowPolicy.DROP_OLDEST)
+
+    queue.put("a\n")
+    await asyncio.sleep(0)  # "a" is written, the writer is now stuck in drain
+    for message in ["b\n", "c\n", "d\n"]:
+        assert queue.put(message)
+
+    assert queue.depth == 2
+    assert queue.stats.dropped == 1
+
+    writer.released.set()
+    await asyncio.sleep(0.01)
+    assert writer.written == [b"a\n", b"c\n", b"d\n"]
+    assert queue.stats.sent == 3
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_coalesce() -> None:
+    writer = BlockedWriter()
+    queue = make_queue(writer, OverflowPolicy.COALESCE)
+
+    queue.put("a\n")
+    await asyncio.sleep(0)
+    for message in ["b\n", "b\n", "c\n", "b\n"]:
+        assert queue.put(message)
+
+    assert queue.depth == 2
+    assert queue.stats.coalesced == 2
+    assert queue.stats.dropped == 0
+
+    writer.released.set()
+    await asyncio.sleep(0.01)
+    assert writer.written == [b"a\n", b"b\n", b"c\n"]
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_disconnect_slow_consumer() -> None:
+    writer = BlockedWriter()
+    queue = make_queue(writer, OverflowPolicy.DISCONNECT)
+
+    queue.put("a\n")
+    await asyncio.sleep(0)
+    assert queue.put("b\n")
+    assert queue.put("c\n")
+    assert not queue.put("d\n")
+
+    writer.transport.abort.assert_called_once()
+    assert queue.stats.disconnected == 1
+    assert queue.stats.dropped == 2
+    assert not queue.put("e\n")
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_responses_and_notifications_share_one_write() -> None:
+    writer = BlockedWriter()
+    writer.released.set()
+    queue = make_queue(writer, OverflowPolicy.DROP_OLDEST, max_size=10)
+
+    queue.send("abcdefg\n")
+    queue.put("DISCUSSION_UPDATED|x\n")
+    queue.send("bcdefgh\n")
+    assert writer.writes == 0
+
+    await asyncio.sleep(0)
+    assert writer.writes == 1
+    # In the order they were queued
+    assert writer.written == [b"abcdefg\n", b"DISCUSSION_UPDATED|x\n", b"bcdefgh\n"]
+    assert queue.stats.flushes == 1
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_responses_are_written_while_peer_is_slow() -> None:
+    writer = BlockedWriter()
+    queue = make_queue(writer, OverflowPolicy.DROP_OLDEST)
+
+    queue.send("abcdefg\n")
+    await asyncio.sleep(0)
+    queue.send("bcdefgh\n")
+    await asyncio.sleep(0)
+    queue.put("a\n")
+    queue.send("cdefghi\n")
+    await asyncio.sleep(0)
+
+    # Responses go out, the notification waits for the peer and so does the
+    # response queued after it
+    assert writer.written == [b"abcdefg\n", b"bcdefgh\n"]
+    drained = asyncio.create_task(queue.drain())
+    await asyncio.sleep(0)
+    assert not drained.done()
+
+    writer.released.set()
+    await drained
+    await asyncio.sleep(0)
+    assert writer.written[2:] == [b"a\n", b"cdefghi\n"]
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_drain_returns_once_the_transport_is_closing() -> None:
+    writer = BlockedWriter()
+    drains = 0
+
+    async def drain() -> None:
+        # As a closing transport: returns at once, the buffer stays full
+        nonlocal drains
+        drains += 1
+
+    writer.drain = drain  # type: ignore[method-assign]
+    queue = make_queue(writer, OverflowPolicy.DROP_OLDEST)
+    queue.send("abcdefg\n")
+    await asyncio.sleep(0)
+    writer.transport.is_closing.return_value = True
+    queue.put("a\n")
+
+    for _ in range(3):
+        await asyncio.wait_for(queue.drain(), 1)
+    await asyncio.sleep(0.01)
+    assert drains == 0
+    assert writer.written == [b"abcdefg\n"]
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_close_writes_buffered_output() -> None:
+    writer = BlockedWriter()
+    queue = make_queue(writer, OverflowPolicy.DROP_OLDEST)
+
+    queue.send("abcdefg\n")
+    await queue.close()
+
+    assert writer.written == [b"abcdefg\n"]
+    assert not queue.put("a\n")
@@ -11,6 +11,13 @@ class TestResponse(unittest.TestCase):
         result = Response(request_id="abcdefg", params=["janedoe"]).serialize()
         self.assertEqual(result, "abcdefg|janedoe\n")
 
+    def test_serialize_list(self) -> None:
+        result = Response(request_id="abcdefg", params=["a", "b"]).serialize_list()
+        self.assertEqual(result, "abcdefg|(a,b)\n")
+
+        result = Response(request_id="abcdefg", params=["a"]).serialize_list("next")
+        self.assertEqual(result, "abcdefg|(a)|next\n")
+
     def test_serialize_failures(self) -> None:
         with self.assertRaises(ValueError):
             Response(request_id="abc").serialize()
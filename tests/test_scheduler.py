@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from server.scheduler import WorkScheduler
+
+
+@pytest.mark.asyncio
+async def test_runs_jobs_on_bounded_workers() -> None:
+    scheduler = WorkScheduler(workers=2, max_queue=10)
+    running = 0
+    peak = 0
+
+    async def job() -> None:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001)
+        running -= 1
+
+    for _ in range(6):
+        await scheduler.submit(job)
+    await scheduler.join()
+
+    assert peak == 2
+    stats = scheduler.snapshot()
+    assert stats["submitted"] == 6
+    assert stats["completed"] == 6
+    assert stats["queued"] == 0
+    await scheduler.close()
+
+
+@pytest.mark.asyncio
+async def test_submit_waits_for_room() -> None:
+    scheduler = WorkScheduler(workers=1, max_queue=1)
+    released = asyncio.Event()
+
+    async def job() -> None:
+        await released.wait()
+
+    await scheduler.submit(job)  # picked up by the worker
+    await asyncio.sleep(0)
+    await scheduler.submit(job)  # fills the queue
+    blocked = asyncio.create_task(scheduler.submit(job))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+    assert scheduler.depth == 1
+
+    released.set()
+    await blocked
+    await scheduler.close()
+    assert scheduler.stats.completed == 3
+
+
+@pytest.mark.asyncio
+async def test_retries_then_gives_up() -> None:
+    scheduler = WorkScheduler(workers=1, max_retries=2, retry_delay=0)
+    attempts = 0
+
+    async def flaky() -> None:
+        nonlocal attempts
+        attempts += 1
+        if attempts < 2:
+            raise RuntimeError("transient")
+
+    async def broken() -> None:
+        raise RuntimeError("permanent")
+
+    await scheduler.submit(flaky)
+    await scheduler.submit(broken)
+    await scheduler.join()
+
+    assert scheduler.stats.completed == 1
+    assert scheduler.stats.failed == 1
+    assert scheduler.stats.retried == 3
+    await scheduler.close()
+
+
+@pytest.mark.asyncio
+async def test_close_drains_and_refuses_new_jobs() -> None:
+    scheduler = WorkScheduler(workers=1)
+    done: list[int] = []
+
+    for i in range(3):
+
+        async def job(i: int = i) -> None:
+            await asyncio.sleep(0)
+            done.append(i)
+
+        await scheduler.submit(job)
+    await scheduler.close()
+
+    assert done == [0, 1, 2]
+    with pytest.raises(RuntimeError):
+        await scheduler.submit(lambda: asyncio.sleep(0))
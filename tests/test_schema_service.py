@@ -0,0 +1,81 @@
+from typing import Any
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from server.di import Container
+from server.migrations import Migration
+from server.services.schema_service import SchemaService
+
+
+async def index_keys(container: Container, collection: str) -> list[list[Any]]:
+    index_info = await container.db()[collection].index_information()
+    return [list(index["key"]) for index in index_info.values()]
+
+
+@pytest.mark.asyncio
+async def test_setup_creates_declared_indexes(container: Container) -> None:
+    schema_service = container.schema_service()
+    await schema_service.setup()
+    report = await schema_service.setup()  # idempotent
+
+    assert report.missing == {}
+    assert [("reference_prefix", 1), ("created_at", 1)] in await index_keys(
+        container, "discussions"
+    )
+    assert [("peer_id", 1)] in await index_keys(container, "sessions")
+    assert [("recipient_id", 1), ("created_at", -1)] in await index_keys(
+        container, "notifications"
+    )
+
+    index_info = await container.db().discussions.index_information()
+    assert index_info["discussion_id_1"].get("unique")
+
+
+@pytest.mark.asyncio
+async def test_setup_reports_undeclared_indexes(container: Container) -> None:
+    await container.db().sessions.create_index("created_at")
+
+    report = await container.schema_service().setup()
+
+    assert report.undeclared == {"sessions": ["created_at_1"]}
+
+
+@pytest.mark.asyncio
+async def test_migrations_are_applied_once_in_order(container: Container) -> None:
+    applied: list[int] = []
+
+    def migration(version: int) -> Migration:
+        async def apply(db: AsyncIOMotorDatabase[Any]) -> None:
+            applied.append(version)
+
+        return Migration(version, f"migration {version}", apply)
+
+    db = container.db()
+    schema_service = SchemaService(db, [], [migration(2), migration(1)])
+    assert (await schema_service.setup()).applied_migrations == [1, 2]
+
+    schema_service = SchemaService(db, [], [migration(1), migration(2), migration(3)])
+    assert (await schema_service.setup()).applied_migrations == [3]
+
+    assert applied == [1, 2, 3]
+    assert await db.schema_migrations.count_documents({}) == 3
+
+
+@pytest.mark.asyncio
+async def test_backfill_migrations(container: Container) -> None:
+    db = container.db()
+    await db.discussions.insert_one(
+        {
+            "discussion_id": "legacy1",
+            "client_id": "a",
+            "replies": [{"client_id": "a"}, {"client_id": "b"}, {"client_id": "a"}],
+        }
+    )
+
+    await container.schema_service().setup()
+
+    discussion_doc = await db.discussions.find_one({"discussion_id": "legacy1"})
+    assert discussion_doc is not None
+    assert discussion_doc["reply_count"] == 3
+    assert sorted(discussion_doc["participants"]) == ["a", "b"]
@@ -3,6 +3,7 @@
 import asyncio
 from asyncio.base_events import Server as AsyncioServer
 from collections.abc import AsyncGenerator
+from typing import cast
 
 import pytest
 
@@ -11,7 +12,11 @@ from server.di import Container
 
 
 @pytest.fixture
-async def server(container: Container) -> AsyncGenerator[Server, None]:
+async def server(
+    container: Container, request: pytest.FixtureRequest
+) -> AsyncGenerator[Server, None]:
+    # Tests change the configuration through indirect parametrization
+    container.config.from_dict(getattr(request, "param", {}))
     server = Server(container=container, port=0)
     task = asyncio.create_task(server.start())
     await asyncio.sleep(0.1)
@@ -31,11 +36,7 @@ async def test_server_echo(server: Server) -> None:
     if server._server is None:
         pytest.fail("Server not initialized")
 
-    server_instance = server._server
-    assert isinstance(server_instance, AsyncioServer)
-
-    port = server_instance.sockets[0].getsockname()[1]
-    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    reader, writer = await asyncio.open_connection("127.0.0.1", server_port(server))
 
     test_actions = ["hijklmn|SIGN_IN|testuser", "abcdefg|WHOAMI", "opqrstu|SIGN_OUT"]
     expected_responses = ["hijklmn\n", "abcdefg|testuser\n", "opqrstu\n"]
@@ -49,3 +50,237 @@ async def test_server_echo(server: Server) -> None:
         assert response.decode().replace("_id", "") == expected_responses[i]
 
     writer.close()
+
+
+def server_port(server: Server) -> int:
+    # asyncio.Server or its uvloop counterpart
+    sockets = cast(AsyncioServer, server._server).sockets
+    return int(sockets[0].getsockname()[1])
+
+
+pipelined = pytest.mark.parametrize(
+    "server", [{"max_in_flight": 8}], ids=["pipelined"], indirect=True
+)
+
+
+@pytest.mark.asyncio
+@pipelined
+async def test_server_pipelined_preserves_order(server: Server) -> None:
+    port = server_port(server)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+    request_ids = ["".join(chr(97 + (i + j) % 26) for j in range(7)) for i in range(20)]
+    writer.write(b"hijklmn|SIGN_IN|testuser\n")
+    writer.write("".join(f"{rid}|WHOAMI\n" for rid in request_ids).encode())
+    await writer.drain()
+
+    assert await reader.readline() == b"hijklmn\n"
+    for rid in request_ids:
+        assert await reader.readline() == f"{rid}|testuser\n".encode()
+
+    writer.close()
+
+
+@pytest.mark.asyncio
+@pipelined
+async def test_server_pipelined_session_changes_are_barriers(
+    server: Server, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    session_service = server.session_service
+    set_session, delete_session = session_service.set, session_service.delete
+
+    # Session changes that take a while, as with a remote session store
+    async def slow_set(peer_id: str, user_id: str) -> None:
+        await asyncio.sleep(0.01)
+        await set_session(peer_id, user_id)
+
+    async def slow_delete(peer_id: str | None) -> None:
+        await asyncio.sleep(0.01)
+        await delete_session(peer_id)
+
+    monkeypatch.setattr(session_service, "set", slow_set)
+    monkeypatch.setattr(session_service, "delete", slow_delete)
+
+    port = server_port(server)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        b"abcdefg|SIGN_IN|testuser\n"
+        b"bcdefgh|CREATE_DISCUSSION|ref.30s|hello\n"
+        b"cdefghi|WHOAMI\n"
+        b"defghij|SIGN_OUT\n"
+        b"efghijk|WHOAMI\n"
+    )
+    await writer.drain()
+
+    assert await reader.readline() == b"abcdefg\n"
+    assert (await reader.readline()).startswith(b"bcdefgh|")
+    assert await reader.readline() == b"cdefghi|testuser\n"
+    assert await reader.readline() == b"defghij\n"
+    assert await reader.readline() == b"efghijk\n"
+    writer.close()
+
+
+@pytest.mark.asyncio
+@pipelined
+async def test_server_pipelined_reports_errors(server: Server) -> None:
+    port = server_port(server)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+    writer.write(b"abcdefg|WHOAMI\nbcdefgh|UNKNOWN\n")
+    await writer.drain()
+
+    assert await reader.readline() == b"abcdefg\n"
+    assert await reader.read() == b"Invalid action: UNKNOWN"
+
+    writer.close()
+
+
+@pytest.mark.asyncio
+async def test_server_stats(server: Server) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", server_port(server))
+    writer.write(b"hijklmn|SIGN_IN|testuser\n")
+    await writer.drain()
+    await reader.readline()
+
+    stats = server.stats()
+    assert stats["connections"] == 1
+    assert stats["outbound"]["queued"] == 0
+    assert stats["outbound"]["dropped"] == 0
+    assert stats["event_loop"] in ("asyncio", "uvloop")
+
+    writer.close()
+
+
+@pytest.mark.asyncio
+async def test_notification_reaches_every_connection_of_user(server: Server) -> None:
+    connections = [
+        await asyncio.open_connection("127.0.0.1", server_port(server))
+        for _ in range(3)
+    ]
+    for i, (reader, writer) in enumerate(connections):
+        user = "otheruser" if i == 2 else "testuser"
+        writer.write(f"hijklmn|SIGN_IN|{user}\n".encode())
+        await writer.drain()
+        assert await reader.readline() == b"hijklmn\n"
+
+    await server._send_notification_to_peer("testuser", "DISCUSSION_UPDATED|abc\n")
+
+    for reader, _ in connections[:2]:
+        assert await reader.readline() == b"DISCUSSION_UPDATED|abc\n"
+
+    # Signing out stops delivery to that connection only
+    reader, writer = connections[0]
+    writer.write(b"opqrstu|SIGN_OUT\n")
+    await writer.drain()
+    assert await reader.readline() == b"opqrstu\n"
+    assert len(server._get_peer_queues("testuser")) == 1
+    assert server._get_peer_queues("otheruser")
+
+    for _, writer in connections:
+        writer.close()
+
+
+@pytest.mark.asyncio
+async def test_servers_share_port_with_reuse_port(container: Container) -> None:
+    first = Server(container=container, port=0, reuse_port=True)
+    first_task = asyncio.create_task(first.start())
+    await asyncio.sleep(0.1)
+    second = Server(container=container, port=server_port(first), reuse_port=True)
+    second_task = asyncio.create_task(second.start())
+    await asyncio.sleep(0.1)
+    try:
+        assert server_port(second) == server_port(first)
+    finally:
+        for server, task in [(first, first_task), (second, second_task)]:
+            await server.stop()
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+protocol_engine = pytest.mark.parametrize(
+    "server",
+    [
+        {"engine": "protocol", "max_in_flight": 1},
+        {"engine": "protocol", "max_in_flight": 8},
+    ],
+    ids=["serial", "pipelined"],
+    indirect=True,
+)
+
+
+@pytest.mark.asyncio
+@protocol_engine
+async def test_protocol_engine(server: Server) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", server_port(server))
+
+    # Lines split across and packed into segments are framed the same
+    writer.write(b"hijklmn|SIGN_")
+    await writer.drain()
+    await asyncio.sleep(0.01)
+    writer.write(b"IN|testuser\nabcdefg|WHOAMI\nbcdefgh|WHO")
+    await writer.drain()
+    writer.write(b"AMI\ncdefghi|UNKNOWN\n")
+    await writer.drain()
+
+    assert await reader.readline() == b"hijklmn\n"
+    assert await reader.readline() == b"abcdefg|testuser\n"
+    assert await reader.readline() == b"bcdefgh|testuser\n"
+    assert await reader.read() == b"Invalid action: UNKNOWN"
+    writer.close()
+
+
+@pytest.mark.asyncio
+@protocol_engine
+async def test_protocol_engine_answers_last_line_before_eof(server: Server) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", server_port(server))
+
+    writer.write(b"abcdefg|WHOAMI\nbcdefgh|WHOAMI")
+    writer.write_eof()
+
+    assert await reader.read() == b"abcdefg\nbcdefgh\n"
+    writer.close()
+
+
+def test_unknown_engine(container: Container) -> None:
+    container.config.from_dict({"engine": "threads"})
+    with pytest.raises(ValueError):
+        Server(container=container, port=0)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("server", [{"storage": "memory"}], indirect=True)
+async def test_memory_storage(server: Server) -> None:
+    port = server_port(server)
+    connections = [await asyncio.open_connection("127.0.0.1", port) for _ in range(2)]
+    for user, (reader, writer) in zip(["user1", "user2"], connections, strict=True):
+        writer.write(f"hijklmn|SIGN_IN|{user}\n".encode())
+        assert await reader.readline() == b"hijklmn\n"
+
+    reader, writer = connections[0]
+    writer.write(b"abcdefg|CREATE_DISCUSSION|ref.30s|hello\n")
+    response = await reader.readline()
+    discussion_id = response.decode().strip().split("|")[1]
+
+    other_reader, other_writer = connections[1]
+    other_writer.write(f"bcdefgh|CREATE_REPLY|{discussion_id}|hi\n".encode())
+    assert await other_reader.readline() == b"bcdefgh\n"
+    assert await reader.readline() == f"DISCUSSION_UPDATED|{discussion_id}\n".encode()
+
+    writer.write(b"cdefghi|LIST_DISCUSSIONS|ref\n")
+    assert await reader.readline() == (
+        f"cdefghi|({discussion_id}|ref.30s|(user1|hello,user2|hi))\n".encode()
+    )
+    assert server.mongo_client is None
+    assert server.stats()["notification_storage"]["inserted"] == 1
+
+    for _, writer in connections:
+        writer.close()
+
+
+def test_unknown_storage(container: Container) -> None:
+    container.config.from_dict({"storage": "redis"})
+    with pytest.raises(ValueError):
+        Server(container=container, port=0)
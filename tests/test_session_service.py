@@ -0,0 +1,131 @@
+import asyncio
+import os
+from typing import Any
+
+import pytest
+
+from server.di import Container
+
+TEST_PEER_1 = "127.0.0.1:8001"
+TEST_PEER_2 = "127.0.0.1:8002"
+
+
+@pytest.mark.asyncio
+async def test_lookups_are_served_from_memory(container: Container) -> None:
+    session_service = container.session_service()
+    await session_service.set(TEST_PEER_1, "user1")
+
+    # The registry answers before the mirror write has happened
+    assert await session_service.get_client_id(TEST_PEER_1) == "user1"
+    assert await session_service.get_by_user_id("user1") == TEST_PEER_1
+    session = await session_service.get_session(TEST_PEER_1)
+    assert session is not None
+    assert session.user_id == "user1"
+
+    assert await session_service.get_client_id(TEST_PEER_2) is None
+    assert await session_service.get_by_user_id("user2") is None
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_mirrored_to_db(container: Container) -> None:
+    session_service = container.session_service()
+    sessions = container.db().sessions
+
+    await session_service.set(TEST_PEER_1, "user1")
+    await session_service.set(TEST_PEER_1, "user2")
+    await session_service.flush()
+
+    session_doc = await sessions.find_one({"peer_id": TEST_PEER_1}, {"_id": 0})
+    assert session_doc is not None
+    assert session_doc["user_id"] == "user2"
+    assert session_doc["node_id"] == session_service.node_id
+
+    await session_service.delete(TEST_PEER_1)
+    await session_service.flush()
+    assert await sessions.count_documents({}) == 0
+
+
+@pytest.mark.asyncio
+async def test_mirror_writes_are_ordered_per_peer(
+    container: Container, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    session_service = container.session_service()
+    repository = session_service.repository
+    save = repository.save
+    released = asyncio.Event()
+
+    # The first peer's store write hangs until released
+    async def blocking_save(session: dict[str, Any]) -> None:
+        if session["peer_id"] == TEST_PEER_1:
+            await released.wait()
+        await save(session)
+
+    monkeypatch.setattr(repository, "save", blocking_save)
+    sessions = container.db().sessions
+    await session_service.set(TEST_PEER_1, "user1")
+    await session_service.delete(TEST_PEER_1)
+    await session_service.set(TEST_PEER_2, "user2")
+
+    # The second peer is not held up behind the first
+    await asyncio.wait_for(session_service._mirror_tails[TEST_PEER_2], 1)
+    assert await sessions.count_documents({}) == 1
+
+    released.set()
+    await session_service.flush()
+    assert await sessions.count_documents({"peer_id": TEST_PEER_1}) == 0
+    assert session_service._mirror_tails == {}
+
+
+@pytest.mark.asyncio
+async def test_sign_in_again_replaces_previous_user(container: Container) -> None:
+    session_service = container.session_service()
+    await session_service.set(TEST_PEER_1, "user1")
+    await session_service.set(TEST_PEER_1, "user2")
+
+    assert await session_service.get_client_id(TEST_PEER_1) == "user2"
+    assert await session_service.get_by_user_id("user1") is None
+    assert await session_service.get_by_user_id("user2") == TEST_PEER_1
+
+
+@pytest.mark.asyncio
+async def test_delete_keeps_other_connections_of_user(container: Container) -> None:
+    session_service = container.session_service()
+    await session_service.set(TEST_PEER_1, "user1")
+    await session_service.set(TEST_PEER_2, "user1")
+
+    await session_service.delete(TEST_PEER_1)
+    assert await session_service.get_client_id(TEST_PEER_1) is None
+    assert await session_service.get_by_user_id("user1") == TEST_PEER_2
+
+
+@pytest.mark.asyncio
+async def test_recover_removes_stale_sessions_of_node(container: Container) -> None:
+    container.config.from_dict({"node_id": "node-1"})
+    session_service = container.session_service()
+    sessions = container.db().sessions
+    await sessions.insert_one(
+        {"peer_id": TEST_PEER_1, "user_id": "user1", "node_id": session_service.node_id}
+    )
+    await sessions.insert_one(
+        {"peer_id": TEST_PEER_2, "user_id": "user2", "node_id": "other-node"}
+    )
+
+    await session_service.recover()
+
+    assert await sessions.count_documents({}) == 1
+    assert await sessions.count_documents({"node_id": "other-node"}) == 1
+
+
+@pytest.mark.asyncio
+async def test_recover_needs_a_configured_node_id(container: Container) -> None:
+    session_service = container.session_service()
+    # Unique per process, so servers sharing a host do not share it
+    assert f"-{os.getpid()}-" in session_service.node_id
+    sessions = container.db().sessions
+    await sessions.insert_one(
+        {"peer_id": TEST_PEER_1, "user_id": "user1", "node_id": session_service.node_id}
+    )
+
+    await session_service.recover()
+
+    assert await sessions.count_documents({}) == 1
@@ -0,0 +1,175 @@
+import os
+import socket
+import time
+from multiprocessing.queues import Queue
+
+import pytest
+
+from server.supervisor import Supervisor, WorkerReport, worker_node_id
+
+
+def crashing_worker(
+    index: int,
+    host: str,
+    port: int,
+    reports: "Queue[WorkerReport]",
+    report_interval: float,
+) -> None:
+    reports.put((index, os.getpid(), time.time(), {"connections": index}))
+    time.sleep(0.2)
+    raise SystemExit(1)
+
+
+def node_id_worker(
+    index: int,
+    host: str,
+    port: int,
+    reports: "Queue[WorkerReport]",
+    report_interval: float,
+) -> None:
+    reports.put((index, os.getpid(), time.time(), {"node_id": worker_node_id(index)}))
+    time.sleep(5)
+
+
+def failing_worker(
+    index: int,
+    host: str,
+    port: int,
+    reports: "Queue[WorkerReport]",
+    report_interval: float,
+) -> None:
+    raise SystemExit(1)
+
+
+def short_lived_worker(
+    index: int,
+    host: str,
+    port: int,
+    reports: "Queue[WorkerReport]",
+    report_interval: float,
+) -> None:
+    reports.put((index, os.getpid(), time.time(), {}))
+    time.sleep(0.2)
+    reports.put((index, os.getpid(), time.time(), {}))
+    raise SystemExit(1)
+
+
+def silent_worker(
+    index: int,
+    host: str,
+    port: int,
+    reports: "Queue[WorkerReport]",
+    report_interval: float,
+) -> None:
+    time.sleep(60)
+
+
+def wait_for(condition: object, timeout: float = 5.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if callable(condition) and condition():
+            return
+        time.sleep(0.05)
+    raise AssertionError("condition not met in time")
+
+
+def test_supervisor_restarts_exited_workers() -> None:
+    supervisor = Supervisor(2, target=crashing_worker)
+    supervisor.start()
+    try:
+        first_pids = {i: w.pid for i, w in supervisor.stats.items()}
+
+        def restarted() -> bool:
+            supervisor.check_workers()
+            return all(w.restarts >= 1 for w in supervisor.stats.values())
+
+        wait_for(restarted)
+        for index, worker in supervisor.stats.items():
+            assert worker.pid != first_pids[index]
+    finally:
+        supervisor.stop()
+
+
+def test_supervisor_collects_per_worker_stats() -> None:
+    supervisor = Supervisor(2, target=crashing_worker)
+    supervisor.start()
+    try:
+
+        def reported() -> bool:
+            supervisor.check_workers()
+            return all(w.heartbeat for w in supervisor.stats.values())
+
+        wait_for(reported)
+        assert supervisor.stats[1].stats == {"connections": 1}
+    finally:
+        supervisor.stop()
+
+
+def test_worker_node_ids_name_the_supervisor() -> None:
+    supervisor = Supervisor(2, target=node_id_worker)
+    supervisor.start()
+    try:
+
+        def reported() -> bool:
+            supervisor.check_workers()
+            return all(w.heartbeat for w in supervisor.stats.values())
+
+        wait_for(reported)
+        # Another supervisor on this host has another pid, hence other ids
+        assert [w.stats["node_id"] for w in supervisor.stats.values()] == [
+            f"{socket.gethostname()}-{os.getpid()}-{index}" for index in range(2)
+        ]
+    finally:
+        supervisor.stop()
+
+
+def test_supervisor_restarts_unresponsive_workers() -> None:
+    supervisor = Supervisor(1, target=silent_worker)
+    supervisor.health_timeout = 0.2
+    supervisor.restart_backoff = 0.05
+    supervisor.start()
+    try:
+        first_pid = supervisor.stats[0].pid
+
+        def restarted() -> bool:
+            supervisor.check_workers()
+            return supervisor.stats[0].restarts == 1
+
+        wait_for(restarted)
+        assert supervisor.stats[0].pid != first_pid
+    finally:
+        supervisor.stop()
+
+
+def test_supervisor_backs_off_and_gives_up_on_failing_workers() -> None:
+    supervisor = Supervisor(1, target=failing_worker)
+    supervisor.restart_backoff = 0.05
+    supervisor.max_startup_failures = 3
+    assert [supervisor._restart_delay(n) for n in range(4)] == [0, 0.05, 0.1, 0.2]
+    supervisor.start()
+    try:
+        with pytest.raises(RuntimeError, match="failed at startup"):
+            wait_for(supervisor.check_workers)
+        worker = supervisor.stats[0]
+        assert worker.given_up
+        assert worker.failures == 3
+        assert worker.restarts == 2
+    finally:
+        supervisor.stop()
+
+
+def test_supervisor_restarts_healthy_workers_immediately() -> None:
+    supervisor = Supervisor(1, target=short_lived_worker)
+    supervisor.healthy_uptime = 0.1
+    supervisor.max_startup_failures = 1
+    supervisor.start()
+    try:
+
+        def restarted() -> bool:
+            supervisor.check_workers()
+            return supervisor.stats[0].restarts >= 2
+
+        wait_for(restarted)
+        assert supervisor.stats[0].failures == 0
+    finally:
+        supervisor.stop()